@@ -8,6 +8,7 @@ import signal
 import sys
 import time
 from datetime import datetime
+from multiprocessing.pool import ThreadPool
 
 import click
 from send2trash import send2trash
@@ -19,12 +20,24 @@ if not verify_dependencies():
     sys.exit(1)
 
 from elodie.config import Config
+from elodie import analytics
+from elodie import compact
 from elodie import constants
+from elodie import daemon
+from elodie import diff
+from elodie import geolocation
+from elodie import hashing
+from elodie import history
 from elodie import log
+from elodie import shards
 from elodie import utility
+from elodie import verify
 from elodie.compatability import _decode
+from elodie.duplicates import DuplicateDetector
 from elodie.filesystem import FileSystem
+from elodie.index import match_entry
 from elodie.manifest import Manifest
+from elodie.manifest import merge_files
 from elodie.media.base import Base, get_all_subclasses
 from elodie.media.media import Media
 from elodie.media.text import Text
@@ -40,9 +53,16 @@ from elodie.external.pyexiftool import ExifTool
 FILESYSTEM = FileSystem()
 
 
-def import_file(file_path, config, manifest, metadata_dict, move=False, allow_duplicates=False, dryrun=False):
+def import_file(file_path, config, manifest, metadata_dict, move=False, allow_duplicates=False, dryrun=False, duplicates=None,
+                paranoid=False, place=None):
 
     """Set file metadata and move it to destination.
+
+    If a :class:`~elodie.duplicates.DuplicateDetector` is passed, files it
+    rules unique are hashed in the background and added to the manifest
+    when it finishes. Unless ``paranoid`` is set, a destination which still
+    matches the state recorded in the manifest isn't read again. ``place``
+    is the file's place name, see :func:`get_places`.
     """
     if not os.path.exists(file_path):
         log.warn('Import_file: Could not find %s' % file_path)
@@ -66,12 +86,30 @@ def import_file(file_path, config, manifest, metadata_dict, move=False, allow_du
     # if album_from_folder:
     #     media.set_album_from_folder()
 
-    checksum = manifest.checksum(file_path)
-    is_duplicate = (checksum in manifest.entries)
+    # Unless this is a dry run the file is read again to copy it, so keep it cached.
+    if duplicates is None:
+        checksum, chunks = manifest.hash_file(file_path, drop_cache=dryrun)
+        is_duplicate = (checksum in manifest.entries)
+    else:
+        is_duplicate, checksum, chunks = duplicates.check(file_path)
 
     # Merge it into the manifest regardless of duplicate entries, to record all sources for a given file
-    manifest_entry = FILESYSTEM.generate_manifest(file_path, target, metadata_dict, media)
-    manifest.merge({checksum: manifest_entry})
+    manifest_entry = FILESYSTEM.generate_manifest(file_path, target, metadata_dict, media, place)
+    destination = os.path.join(target_base_path, manifest_entry["target"]["path"], manifest_entry["target"]["name"])
+    if checksum is None and os.path.isfile(destination):
+        # The target name is taken, so the file may be copied to a name with its hash in it.
+        checksum, chunks = manifest.hash_file(file_path, drop_cache=dryrun)
+    recorded_target = None
+    if checksum is not None and os.path.isfile(destination):
+        # Looked up by where it was written, as the file there may be another version of this one.
+        recorded_key = manifest.get_target_key(manifest_entry["target"]["path"], manifest_entry["target"]["name"])
+        if recorded_key is not None:
+            recorded_target = dict(manifest.entries[recorded_key].get("target") or {})
+            # Targets written before their digest was recorded are keyed on it.
+            recorded_target.setdefault("checksum", recorded_key)
+    if checksum is not None:
+        manifest.set_chunks(manifest_entry, chunks)
+        manifest.merge({checksum: manifest_entry})
 
     if (not allow_duplicates) and is_duplicate:
         log.debug("[ ] File {} already present in manifest; allow_duplicates is false; skipping".format(file_path))
@@ -79,15 +117,84 @@ def import_file(file_path, config, manifest, metadata_dict, move=False, allow_du
 
     if dryrun:
         log.info("Generated manifest: {}".format(file_path))
-        return manifest_entry is not None
+        result = manifest_entry is not None
     else:
-        result = FILESYSTEM.execute_manifest(file_path, manifest_entry, target_base_path, move_not_copy=move)
-        # if dest_path:
-        #     print('%s -> %s' % (_file, dest_path))
-        # if trash:
-        #     send2trash(_file)
+        result = FILESYSTEM.execute_manifest(file_path, manifest_entry, target_base_path, move_not_copy=move,
+                                             algorithm=manifest.algorithm, recorded_target=recorded_target,
+                                             paranoid=paranoid, checksum=checksum,
+                                             tree_chunk_size=manifest.tree_chunk_size)
+        if checksum is not None:
+            # Keep the size and mtime the target was written with.
+            manifest.merge({checksum: {"target": manifest_entry["target"]}})
+
+    if duplicates is not None:
+        # A moved file is hashed at its destination.
+        content_path = file_path if os.path.isfile(file_path) else destination
+        duplicates.add(content_path, manifest_entry, checksum)
+
+    # if dest_path:
+    #     print('%s -> %s' % (_file, dest_path))
+    # if trash:
+    #     send2trash(_file)
+
+    return result
+
+
+def get_places(file_batch, metadata_dict, target):
+    """Look up the place names of a batch of files, if the target's folders
+    are named after places.
+
+    Coordinates which aren't cached are looked up together, so files taken
+    at the same spot share a lookup, see
+    :func:`elodie.geolocation.place_names`.
+
+    :param list file_batch: Paths of the files.
+    :param dict metadata_dict: Their metadata, keyed on absolute path.
+    :param dict target: The target they're imported to.
+    :returns: dict of place names keyed on absolute path.
+    """
+    if not FILESYSTEM.uses_places(target):
+        return {}
+
+    paths = []
+    coordinates = []
+    subclasses = get_all_subclasses()
+    for current_file in file_batch:
+        media = Media.get_class_by_file(current_file, subclasses)
+        if not media or media.get_metadata(metadata_dict) is None:
+            continue
+        latitude = media.get_coordinate('latitude')
+        longitude = media.get_coordinate('longitude')
+        if latitude is None or longitude is None:
+            continue
+        paths.append(os.path.abspath(current_file))
+        coordinates.append((latitude, longitude))
+    return dict(zip(paths, geolocation.place_names(coordinates)))
 
-        return result
+
+def read_native_metadata(file_batch):
+    """Read metadata for the files the built-in header parsers support.
+
+    :param list file_batch: Paths to read.
+    :returns: tuple(dict, list) of metadata keyed on absolute path, and the
+        paths which still need to be sent to ExifTool.
+    """
+    metadata_dict = {}
+    exiftool_batch = []
+    subclasses = get_all_subclasses()
+    for current_file in file_batch:
+        metadata = None
+        if constants.native_metadata:
+            media = Media.get_class_by_file(current_file, subclasses)
+            if isinstance(media, Media):
+                metadata = media.get_native_attributes()
+
+        if metadata is None:
+            exiftool_batch.append(current_file)
+        else:
+            metadata_dict[os.path.abspath(current_file)] = metadata
+
+    return metadata_dict, exiftool_batch
 
 
 @click.command('import')
@@ -96,7 +203,8 @@ def import_file(file_path, config, manifest, metadata_dict, move=False, allow_du
 @click.option('-c', '--config', 'config_path', type=click.Path(file_okay=True),
               required=True, help='Import configuration file.')
 @click.option('-m', '--manifest', 'manifest_path', type=click.Path(file_okay=True),
-              help='The database/manifest used to store file sync information.')
+              help='The database/manifest used to store file sync information. A directory, or a path ending in '
+                   'a separator, holds it in shard files keyed by digest prefix.')
 @click.option('-i', '--indent-manifest', 'indent_manifest', is_flag=True,
               help='Whether to indent the manifest for easier reading (roughly doubles file size)')
 @click.option('--no-overwrite-manifest', 'no_overwrite_manifest', is_flag=True,
@@ -109,15 +217,25 @@ def import_file(file_path, config, manifest, metadata_dict, move=False, allow_du
               help='Move files rather than copying them. Faster within a drive.')
 @click.option('--dryrun', default=False, is_flag=True,
               help="Don't move files or save the manifest; just print the manifest to terminal")
+@click.option('--scan-mode', default='full', type=click.Choice(['full', 'fast', 'fast2']),
+              help='ExifTool scan mode. fast and fast2 only read file headers, for sources on slow mounts.')
+@click.option('--exiftool-walk', default=False, is_flag=True,
+              help='Let ExifTool walk the source directory instead of sending it file lists. '
+                   'Only files with a supported media extension are imported.')
+@click.option('--defer-hashing', default=False, is_flag=True,
+              help='Rule out duplicates by size and a partial fingerprint, and fully hash files in the background.')
+@click.option('--paranoid', default=False, is_flag=True,
+              help='Fully compare files already in the target even if they are unchanged since they were written.')
 @click.option('--debug', default=False, is_flag=True,
               help='Override the value in constants.py with True.')
 # @click.argument('paths', nargs=-1, type=click.Path())
-def _import(source, config_path, manifest_path, allow_duplicates, dryrun, debug, move=False, indent_manifest=False, no_overwrite_manifest=False):
+def _import(source, config_path, manifest_path, allow_duplicates, dryrun, debug, move=False, indent_manifest=False, no_overwrite_manifest=False, scan_mode='full', exiftool_walk=False, defer_hashing=False, paranoid=False):
     """Import files or directories by reading their EXIF and organizing them accordingly.
     """
     start_time = round(time.time())
 
     constants.debug = debug
+    constants.exiftool_scan_mode = scan_mode
     has_errors = False
     result = Result()
 
@@ -154,35 +272,72 @@ def _import(source, config_path, manifest_path, allow_duplicates, dryrun, debug,
         # '-overwrite_original',
         u'-config',
         u'"{}"'.format(constants.exiftool_config)
-    ]
+    ] + constants.exiftool_scan_mode_args[scan_mode]
 
-    file_generator = FILESYSTEM.get_all_files(source_file_path, None)
     source_file_count = 0
+    native_file_count = 0
+
+    duplicates = None
+    if defer_hashing:
+        duplicates = DuplicateDetector(manifest, target["base_path"])
+
+    def import_current_file(current_file, metadata_dict, places):
+        try:
+            return import_file(current_file, config, manifest, metadata_dict, move=move, dryrun=dryrun,
+                               allow_duplicates=allow_duplicates, duplicates=duplicates, paranoid=paranoid,
+                               place=places.get(os.path.abspath(current_file)))
+        except Exception as e:
+            log.warn("[!] Error importing {}: {}".format(current_file, e))
+            return False
 
     with ExifTool(addedargs=exiftool_addedargs) as et:
-        while True:
-            file_batch = list(itertools.islice(file_generator, constants.exiftool_batch_size))
-            if len(file_batch) == 0: break
-
-            # This will cause slight discrepancies in file counts: since elodie.json is counted but not imported,
-            #   each one will set the count off by one.
-            source_file_count += len(file_batch)
-            metadata_list = et.get_metadata_batch(file_batch)
-            if not metadata_list:
-                raise Exception("Metadata scrape failed.")
-            # Key on the filename to make for easy access,
-            metadata_dict = dict((os.path.abspath(el["SourceFile"]), el) for el in metadata_list)
-            for current_file in file_batch:
-                # Don't import localized config files.
-                if current_file.endswith("elodie.json"):  # Faster than a os.path.split
-                    continue
-                try:
-                    result = import_file(current_file, config, manifest, metadata_dict, move=move, dryrun=dryrun, allow_duplicates=allow_duplicates)
-                except Exception as e:
-                    log.warn("[!] Error importing {}: {}".format(current_file, e))
-                    result = False
-                has_errors = has_errors or not result
+        if exiftool_walk:
+            # ExifTool walks the directory and streams a record per file back,
+            #   so there's no file list to build in Python or send to it.
+            extensions = FILESYSTEM.get_valid_extensions()
+            records = et.iter_metadata_directory(os.path.abspath(source_file_path), extensions)
+            while True:
+                # Read in batches, so the places of a batch are looked up together.
+                record_batch = list(itertools.islice(records, constants.exiftool_batch_size))
+                if len(record_batch) == 0: break
+
+                source_file_count += len(record_batch)
+                file_batch = [os.path.normpath(record["SourceFile"]) for record in record_batch]
+                metadata_dict = dict((os.path.abspath(f), r) for f, r in zip(file_batch, record_batch))
+                places = get_places(file_batch, metadata_dict, target)
+                for current_file in file_batch:
+                    result = import_current_file(current_file, metadata_dict, places)
+                    has_errors = has_errors or not result
+        else:
+            file_generator = FILESYSTEM.get_all_files(source_file_path, None)
+            while True:
+                file_batch = list(itertools.islice(file_generator, constants.exiftool_batch_size))
+                if len(file_batch) == 0: break
+
+                # This will cause slight discrepancies in file counts: since elodie.json is counted but not imported,
+                #   each one will set the count off by one.
+                source_file_count += len(file_batch)
+                metadata_dict, exiftool_batch = read_native_metadata(file_batch)
+                native_file_count += len(metadata_dict)
+                if len(exiftool_batch) > 0:
+                    metadata_list = et.get_metadata_batch(exiftool_batch)
+                    if not metadata_list:
+                        raise Exception("Metadata scrape failed.")
+                    # Key on the filename to make for easy access,
+                    metadata_dict.update((os.path.abspath(el["SourceFile"]), el) for el in metadata_list)
+                places = get_places(file_batch, metadata_dict, target)
+                for current_file in file_batch:
+                    # Don't import localized config files.
+                    if current_file.endswith("elodie.json"):  # Faster than a os.path.split
+                        continue
+                    result = import_current_file(current_file, metadata_dict, places)
+                    has_errors = has_errors or not result
         exiftool_waiting_time = et.waiting_time
+        exiftool_bytes_read = et.bytes_read if et.bytes_read_available else None
+
+    if duplicates is not None:
+        log.info("[ ] Waiting for background hashing...")
+        has_errors = not duplicates.finish() or has_errors
 
     manifest.write(indent=indent_manifest, overwrite=(not no_overwrite_manifest))
 
@@ -192,11 +347,21 @@ def _import(source, config_path, manifest_path, allow_duplicates, dryrun, debug,
         total_time = round(time.time() - start_time)
         log.info("Statistics:")
         log.info("Source: File Count {}".format(source_file_count))
+        log.info("Source: Read Without ExifTool {}".format(native_file_count))
         log.info("Manifest: New Hashes {}".format(manifest_key_count - original_manifest_key_count))
         log.info("Manifest: Total Hashes {}".format(manifest_key_count))
         log.info("Time: Total {}s".format(total_time))
         log.info("Time: Files/sec {}".format(round(source_file_count / total_time)))
         log.info("Time: Waiting on ExifTool {}s".format(round(exiftool_waiting_time)))
+        if duplicates is not None:
+            log.info("Duplicates: Hashed Before Import {}".format(duplicates.hashed_count))
+            log.info("Duplicates: Hashed In Background {}".format(duplicates.deferred_count))
+        if exiftool_bytes_read is not None:
+            exiftool_file_count = source_file_count - native_file_count
+            log.info("ExifTool: Scan Mode {}".format(scan_mode))
+            log.info("ExifTool: Bytes Read From Storage {}".format(exiftool_bytes_read))
+            if exiftool_file_count > 0:
+                log.info("ExifTool: Bytes Read From Storage/File {}".format(round(exiftool_bytes_read / exiftool_file_count)))
     except Exception as e:
         log.error("[!] Error generating statistics: {}".format(e))
 
@@ -207,77 +372,325 @@ def _import(source, config_path, manifest_path, allow_duplicates, dryrun, debug,
 
 
 @click.command('analyze')
+@click.option('-f', '--format', 'output_format', default='text', type=click.Choice(['text', 'json', 'csv']),
+              help='Log the totals as text, or write them as JSON or CSV.')
+@click.option('-o', '--output', 'output_path', type=click.Path(dir_okay=False),
+              help='File to write the JSON or CSV to. Defaults to standard output.')
+@click.option('--top', default=analytics.TOP, type=int,
+              help='Number of the largest duplicate clusters to list.')
+@click.option('--stat-sources', 'stat_sources', default=False, is_flag=True,
+              help='Count entries without a recorded size with the size of their source files, looking up each one.')
 @click.option('--debug', default=False, is_flag=True,
               help='Override the value in constants.py with True.')
-@click.argument('manifest_path', nargs=1, required=True)
-def _analyze(manifest_path, debug):
+@click.argument('manifest_path', nargs=1, required=True, type=click.Path(exists=True))
+def _analyze(manifest_path, output_format, output_path, top, stat_sources, debug):
+    """Total a manifest's entries by date, camera model, origin and
+    extension, and find its duplicate sources.
+
+    Bytes are the size recorded with each target. Entries from before sizes
+    were recorded are counted as without size, or with the size of their
+    first source file which still exists with --stat-sources.
+    """
     constants.debug = debug
 
-    manifest = Manifest()
-    manifest.load_from_file(manifest_path)
-    manifest_key_count = len(manifest)
-
-    duplicate_source_file_count = {}
+    # Entries are read one at a time, so memory doesn't grow with the manifest.
+    totals = analytics.Analytics(top, stat_sources)
+    with shards.open_reader(manifest_path) as reader:
+        for k, v in reader:
+            totals.add(k, v)
 
-    # Could be made into a reduce, but I want more functionality here ( ie a list of the duplicated files )
-    for k, v in manifest.entries.items():
-        if len(v["sources"]) > 1:
-            length = len(v["sources"])
-            if length in duplicate_source_file_count:
-                duplicate_source_file_count[length] += 1
-            else:
-                duplicate_source_file_count[length] = 1
+    if output_format != 'text':
+        write = totals.write_json if output_format == 'json' else totals.write_csv
+        if output_path is None:
+            write(sys.stdout)
+        else:
+            with open(output_path, 'w') as f:
+                write(f)
+        return
 
     log.info("Statistics:")
-    log.info("Manifest: Total Hashes {}".format(manifest_key_count))
-    for k, v in duplicate_source_file_count.items():
-        log.info("Manifest: Duplicate (x{}) Source Files {}".format(k, v))
+    log.info("Manifest: Total Hashes {}".format(totals.entries))
+    log.info("Manifest: Total Sources {}".format(totals.sources))
+    log.info("Manifest: Total Bytes {}".format(totals.bytes))
+    log.info("Manifest: Hashes Without Size {}".format(totals.unsized))
+    for count, entries in totals.get_duplicates():
+        log.info("Manifest: Duplicate (x{}) Source Files {}".format(count, entries))
+    for dimension in analytics.DIMENSIONS:
+        label = dimension.replace('_', ' ').title()
+        for value, count, size in totals.get_rows(dimension):
+            log.info("{} {}: Hashes {} Bytes {}".format(label, value or 'Unknown', count, size))
+    for cluster in totals.get_largest():
+        log.info("Largest Duplicate {}: Sources {} Bytes {} {}".format(
+            cluster["checksum"], cluster["sources"], cluster["bytes"], cluster["name"] or ''))
 
 
 @click.command('merge')
 @click.option('-o', '--output', 'output_path', type=click.Path(file_okay=True),
               required=True, help='The file path to save the merged manifest.')
-@click.argument('manifest_paths', nargs=-1, required=True)
+@click.argument('manifest_paths', nargs=-1, required=True, type=click.Path(exists=True))
+@click.option('-i', '--indent-manifest', 'indent_manifest', is_flag=True,
+              help='Whether to indent the manifest for easier reading (roughly doubles file size)')
+@click.option('--shards', 'shard_count', type=int,
+              help='Write a directory of this many shard files keyed by digest prefix, 256 or 4096.')
 @click.option('--debug', default=False, is_flag=True,
               help='Override the value in constants.py with True.')
-def _merge(manifest_paths, output_path, debug):
+def _merge(manifest_paths, output_path, indent_manifest, shard_count, debug):
+    """Merge manifests into one, reading them a few entries at a time.
+    """
     constants.debug = debug
 
-    manifest = Manifest()
-    for manifest_path in manifest_paths:
-        manifest.load_from_file(manifest_path)
-
-    manifest.write(output_path, overwrite=False)
+    try:
+        manifest_key_count, conflict_count = merge_files(
+            manifest_paths, output_path, indent=indent_manifest, sidecar=constants.manifest_sidecar,
+            shard_count=shard_count)
+    except ValueError as e:
+        log.error(str(e))
+        sys.exit(1)
 
-    manifest_key_count = len(manifest)
     log.info("Statistics:")
     log.info("Merged Manifest: Total Hashes {}".format(manifest_key_count))
+    log.info("Merged Manifest: Conflicting Targets {}".format(conflict_count))
+
+
+@click.command('compact')
+@click.option('-m', '--manifest', 'manifest_path', type=click.Path(exists=True),
+              required=True, help='The manifest, or directory of a sharded manifest, to compact.')
+@click.option('--keep-missing', 'keep_missing_days', default=constants.compact_keep_missing_days, type=int,
+              help='Days to keep sources which no longer exist, from when compact first finds them missing. '
+                   '0 removes them at once.')
+@click.option('-i', '--indent-manifest', 'indent_manifest', is_flag=True,
+              help='Whether to indent the manifest for easier reading (roughly doubles file size)')
+@click.option('--dryrun', default=False, is_flag=True,
+              help='Count what would be removed without changing the manifest.')
+@click.option('--debug', default=False, is_flag=True,
+              help='Override the value in constants.py with True.')
+def _compact(manifest_path, keep_missing_days, indent_manifest, dryrun, debug):
+    """Remove sources which no longer exist and null values from a manifest.
+    """
+    constants.debug = debug
+
+    try:
+        summary = compact.compact_file(manifest_path, keep_missing_days, dryrun=dryrun, indent=indent_manifest)
+    except ValueError as e:
+        log.error(str(e))
+        sys.exit(1)
+
+    log.info("Statistics:")
+    log.info("Manifest: Total Hashes {}".format(summary["entries"]))
+    log.info("Compact: Hashes Removed {}".format(summary["entries_removed"]))
+    log.info("Compact: Sources Removed {}".format(summary["sources_removed"]))
+    log.info("Compact: Sources Missing {}".format(summary["sources_missing"]))
+    log.info("Compact: Relative Sources Not Checked {}".format(summary["sources_relative"]))
+    log.info("Compact: Nulls Removed {}".format(summary["nulls_removed"]))
+    log.info("Compact: Bytes Before {}".format(summary["bytes_before"]))
+    if summary["bytes_after"] is not None:
+        log.info("Compact: Bytes After {}".format(summary["bytes_after"]))
+
+
+@click.command('diff')
+@click.argument('old_path', nargs=1, required=True, type=click.Path(exists=True))
+@click.argument('new_path', nargs=1, required=True, type=click.Path(exists=True))
+@click.option('-o', '--output', 'output_path', type=click.Path(dir_okay=False),
+              help='File to write the JSON lines to. Defaults to standard output.')
+@click.option('-s', '--status', 'statuses', multiple=True, type=click.Choice(diff.STATUSES),
+              help='Only output digests with this status; can be given more than once. '
+                   'Defaults to added, removed and changed.')
+@click.option('-w', '--workers', default=4, type=int,
+              help='Number of files to hash at once, when comparing with a directory.')
+@click.option('--debug', default=False, is_flag=True,
+              help='Override the value in constants.py with True.')
+def _diff(old_path, new_path, output_path, statuses, workers, debug):
+    """Compare two manifests, or a manifest and a directory of files, by digest.
+
+    Digests only in NEW_PATH are added, only in OLD_PATH removed, and in
+    both with different sources or target changed. Files in a directory
+    are hashed the way the manifest keys them and only compared by digest.
+    """
+    constants.debug = debug
+
+    def run(report):
+        return diff.diff_paths(old_path, new_path, report, statuses=statuses or None, workers=workers)
+
+    try:
+        if output_path is None:
+            # Nothing else is printed, so the output can be piped.
+            run(sys.stdout)
+            return
+        with open(output_path, 'w') as report:
+            summary = run(report)
+    except ValueError as e:
+        log.error(str(e))
+        sys.exit(1)
+
+    log.info("Statistics:")
+    for status in diff.STATUSES:
+        log.info("Diff: {} {}".format(status.capitalize(), summary[status]))
+    log.info("Diff: Report {}".format(output_path))
+
+
+@click.command('history')
+@click.option('-m', '--manifest', 'manifest_path', type=click.Path(file_okay=True), required=True,
+              help='The manifest, or directory of a sharded manifest, whose history is used.')
+@click.option('--at', help='Rebuild the manifest as it was at this UTC time, as YYYY-MM-DD[ HH:MM:SS]; a date '
+                           'includes the whole day. Defaults to the latest snapshot.')
+@click.option('-o', '--output', 'output_path', type=click.Path(dir_okay=False),
+              help='The file path to save the rebuilt manifest to. Without it, the snapshots are listed.')
+@click.option('--prune', 'prune', default=False, is_flag=True,
+              help='Thin out old snapshots now, as every write of the manifest does.')
+@click.option('--debug', default=False, is_flag=True,
+              help='Override the value in constants.py with True.')
+def _history(manifest_path, at, output_path, prune, debug):
+    """List, rebuild or prune the history snapshots of a manifest.
+    """
+    constants.debug = debug
+
+    directory, names = history.get_manifest_history(manifest_path)
+    if prune:
+        removed = sum(history.prune(directory, name) for name in names)
+        log.info("History: Snapshots Removed {}".format(removed))
+
+    if output_path is not None:
+        try:
+            count = history.restore(manifest_path, output_path, at)
+        except ValueError as e:
+            log.error(str(e))
+            sys.exit(1)
+        if count is None:
+            log.error("[!] No snapshot of {} from before {}".format(manifest_path, at or 'now'))
+            sys.exit(1)
+        log.info("History: Rebuilt Manifest {}".format(output_path))
+        log.info("History: Total Hashes {}".format(count))
+        return
+
+    snapshot_count = 0
+    byte_count = 0
+    for name in names:
+        for snapshot in history.list_snapshots(directory, name):
+            size = os.path.getsize(snapshot.path)
+            log.info("{} {} {}".format(snapshot.file_name, snapshot.kind, size))
+            snapshot_count += 1
+            byte_count += size
+    log.info("Statistics:")
+    log.info("History: Snapshots {}".format(snapshot_count))
+    log.info("History: Bytes {}".format(byte_count))
+
+
+@click.command('migrate')
+@click.option('-m', '--manifest', 'manifest_path', type=click.Path(exists=True),
+              required=True, help='The manifest to migrate.')
+@click.option('-a', '--algorithm', type=click.Choice(hashing.ALGORITHMS), default='blake2b',
+              help='The hash algorithm to re-key the manifest on.')
+@click.option('-c', '--config', 'config_path', type=click.Path(file_okay=True),
+              help='Import configuration file. Files are read from its target rather than the sources.')
+@click.option('-t', '--tree-chunk-size', 'tree_chunk_size', type=int,
+              help='Tree hash files in chunks of this many MiB, hashing large files in several threads. '
+                   '0 turns tree hashing off. Defaults to keeping the current setting.')
+@click.option('-w', '--workers', default=4, type=int,
+              help='Number of files to hash at once.')
+@click.option('-i', '--indent-manifest', 'indent_manifest', is_flag=True,
+              help='Whether to indent the manifest for easier reading (roughly doubles file size)')
+@click.option('--debug', default=False, is_flag=True,
+              help='Override the value in constants.py with True.')
+def _migrate(manifest_path, algorithm, config_path, tree_chunk_size, workers, indent_manifest, debug):
+    """Re-key a manifest on another hash algorithm without copying any files.
+    """
+    constants.debug = debug
+
+    base_path = None
+    if config_path is not None:
+        base_path = Config().load_from_file(config_path)["targets"][0]["base_path"]
+
+    manifest = Manifest().load_from_file(manifest_path)
+    original_hashing = manifest.describe_hashing(manifest.algorithm, manifest.tree_chunk_size)
+    if tree_chunk_size is not None:
+        tree_chunk_size = tree_chunk_size * 1024 * 1024
+
+    failed = manifest.migrate(algorithm, base_path=base_path, workers=workers, tree_chunk_size=tree_chunk_size)
+    migrated_hashing = manifest.describe_hashing(manifest.algorithm, manifest.tree_chunk_size)
+
+    log.info("Statistics:")
+    log.info("Manifest: Total Hashes {}".format(len(manifest)))
+    if len(failed) > 0:
+        log.error("[!] {} entries have no intact file; manifest left keyed on {}".format(
+            len(failed), original_hashing))
+        sys.exit(1)
+    if migrated_hashing == original_hashing:
+        log.info("Manifest is already keyed on {}".format(original_hashing))
+        return
+
+    manifest.write(indent=indent_manifest)
+    log.info("Manifest: Migrated from {} to {}".format(original_hashing, migrated_hashing))
 
 
 @click.command('find')
-@click.option('-m', '--manifest', 'manifest_path', type=click.Path(file_okay=True),
+@click.option('-m', '--manifest', 'manifest_path', type=click.Path(exists=True),
               help='The database/manifest used to store file sync information.', required=True)
+@click.option('-k', '--checksum', help='the checksum of the file')
 @click.option('-t', '--target-file-name', 'target_file_name', help='the name of the target file')
-def _find(manifest_path, target_file_name):
-    manifest = Manifest().load_from_file(manifest_path)
-    for k, v in manifest.entries.items():
-        if v["target"]["name"] == target_file_name:
-            print("Hash {}".format(k))
-            print(json.dumps(v, indent=2))
+@click.option('-p', '--name-prefix', 'name_prefix', help='the start of the name of the target file')
+@click.option('-s', '--source', help='a source file, or a directory to find every source file under')
+@click.option('--from', 'date_from', help='earliest date taken, as YYYY-MM-DD[ HH:MM:SS]')
+@click.option('--to', 'date_to', help='latest date taken, as YYYY-MM-DD[ HH:MM:SS]; a date includes the whole day')
+@click.option('--make', 'camera_make', help='the camera make')
+@click.option('--model', 'camera_model', help='the camera model')
+@click.option('--album', help='the album')
+@click.option('--origin', help='the origin')
+def _find(manifest_path, checksum, target_file_name, name_prefix, source, date_from, date_to, camera_make, camera_model,
+          album, origin):
+    """Find manifest entries matching every given criterion.
+    """
+    criteria = dict((k, v) for k, v in (
+        ('key', checksum),
+        ('name', target_file_name),
+        ('name_prefix', name_prefix),
+        ('source', source),
+        ('date_from', date_from),
+        ('date_to', date_to),
+        ('camera_make', camera_make),
+        ('camera_model', camera_model),
+        ('album', album),
+        ('origin', origin),
+    ) if v is not None)
+    if len(criteria) == 0:
+        log.error("[!] Nothing to find; give at least one criterion")
+        sys.exit(1)
+
+    sidecars = shards.open_sidecars(manifest_path, checksum)
+    client = daemon.get_client() if sidecars is None else None
+    if sidecars is not None:
+        # Looked up in the indexes next to the manifest, without parsing it.
+        entries = {}
+        for sidecar in sidecars:
+            with sidecar:
+                entries.update(sidecar.find(**criteria))
+    elif client is not None:
+        # The daemon keeps the manifest and its index loaded between runs.
+        entries = client.query(manifest_path, criteria)
+    else:
+        # A single query, so entries are matched as they're read rather
+        #   than loaded and indexed.
+        with shards.open_reader(manifest_path, checksum) as reader:
+            entries = dict((k, v) for k, v in reader if match_entry(k, v, criteria))
+    for k in sorted(entries):
+        print("Hash {}".format(k))
+        print(json.dumps(entries[k], indent=2))
     print("Search complete.")
 
 
 @click.command('generate-db')
 @click.option('--source', type=click.Path(file_okay=False),
               required=True, help='Source of your photo library.')
+@click.option('-w', '--workers', default=constants.generate_db_workers, type=int,
+              help='Number of files to hash at once.')
 @click.option('--debug', default=False, is_flag=True,
               help='Override the value in constants.py with True.')
-def _generate_db(source, debug):
+def _generate_db(source, workers, debug):
     """Regenerate the hash.json database which contains all of the sha256 signatures of media files. The hash.json file is located at ~/.elodie/.
     """
     constants.debug = debug
     result = Result()
     source = os.path.abspath(os.path.expanduser(source))
+    start_time = time.time()
 
     if not os.path.isdir(source):
         log.error('Source is not a valid directory %s' % source)
@@ -287,38 +700,96 @@ def _generate_db(source, debug):
     db.backup_hash_db()
     db.reset_hash_db()
 
-    for current_file in FILESYSTEM.get_all_files(source):
-        result.append((current_file, True))
-        db.add_hash(db.checksum(current_file), current_file)
-        log.progress()
-    
+    def hash_file(current_file):
+        try:
+            size = os.path.getsize(current_file)
+        except OSError:
+            size = 0
+        return (current_file, db.checksum(current_file), size)
+
+    # Hashing releases the GIL, so threads keep several disks/cores busy.
+    #   The db is only touched from this thread and written in batches.
+    byte_count = 0
+    pool = ThreadPool(workers)
+    try:
+        for current_file, checksum, size in pool.imap_unordered(hash_file, FILESYSTEM.get_all_files(source), 16):
+            if checksum is None:
+                result.append((current_file, False))
+                log.progress('x')
+                continue
+            result.append((current_file, True))
+            db.add_hash(checksum, current_file, True)
+            byte_count += size
+            if db.hash_db_unsaved == 0:
+                log.progress()
+    finally:
+        pool.close()
+        pool.join()
+
     db.update_hash_db()
     log.progress('', True)
+
+    total_time = max(time.time() - start_time, 0.001)
+    log.info("Statistics:")
+    log.info("Hash DB: Total Hashes {}".format(len(db.hash_db)))
+    log.info("Source: Bytes Read {}".format(byte_count))
+    log.info("Time: Total {}s".format(round(total_time)))
+    log.info("Time: Bytes/sec {}".format(round(byte_count / total_time)))
     result.write()
 
 @click.command('verify')
+@click.option('-m', '--manifest', 'manifest_path', type=click.Path(exists=True),
+              required=True, help='The manifest whose target files are verified.')
+@click.option('-c', '--config', 'config_path', type=click.Path(file_okay=True),
+              required=True, help='Import configuration file, for the target base path.')
+@click.option('-w', '--workers', default=constants.verify_workers, type=int,
+              help='Number of files to hash at once.')
+@click.option('--rate-limit', 'rate_limit', type=float,
+              help='Maximum MB read per second.')
+@click.option('--sample', 'sample_percent', type=float,
+              help='Verify this percentage of files per run, a different slice each run.')
+@click.option('--period', type=float,
+              help='With --sample, pick the slice from the date so every file is verified once per this many days.')
+@click.option('--restart', default=False, is_flag=True,
+              help='Ignore where an interrupted run stopped.')
+@click.option('-r', '--report', 'report_path', type=click.Path(dir_okay=False),
+              help='File to write the JSON lines report to. Defaults to the .elodie directory next to the manifest.')
 @click.option('--debug', default=False, is_flag=True,
               help='Override the value in constants.py with True.')
-def _verify(debug):
+def _verify(manifest_path, config_path, workers, rate_limit, sample_percent, period, restart, report_path, debug):
+    """Verify the files in the target against the manifest.
+    """
     constants.debug = debug
-    result = Result()
-    db = Manifest()
-    for checksum, file_path in db.all():
-        if not os.path.isfile(file_path):
-            result.append((file_path, False))
-            log.progress('x')
-            continue
 
-        actual_checksum = db.checksum(file_path)
-        if checksum == actual_checksum:
-            result.append((file_path, True))
-            log.progress()
-        else:
-            result.append((file_path, False))
-            log.progress('x')
+    config = Config().load_from_file(config_path)
+    manifest = Manifest().load_from_file(manifest_path)
 
-    log.progress('', True)
-    result.write()
+    log_base_path, _ = os.path.split(manifest.file_path)
+    FILESYSTEM.create_directory(os.path.join(log_base_path, '.elodie'))
+    if report_path is None:
+        report_path = os.path.join(log_base_path, '.elodie', 'verify_{}.jsonl'.format(utility.timestamp_string()))
+
+    verifier = verify.Verifier(
+        manifest,
+        config["targets"][0]["base_path"],
+        workers=workers,
+        rate_limit=rate_limit * 1000 * 1000 if rate_limit else None,
+        cursor_path=os.path.join(log_base_path, '.elodie', 'verify_cursor.json')
+    )
+    keys = verifier.select(sample_percent, period, resume=not restart)
+
+    with open(report_path, 'w') as report:
+        summary = verifier.run(report, keys)
+
+    log.info("Statistics:")
+    log.info("Verify: Files Checked {}".format(len(keys)))
+    for status in (verify.STATUS_OK, verify.STATUS_MISSING, verify.STATUS_MISMATCH, verify.STATUS_ERROR):
+        log.info("Verify: {} {}".format(status.capitalize(), summary[status]))
+    log.info("Verify: Bytes/sec {}".format(round(summary["bytes"] / max(summary["seconds"], 0.001))))
+    log.info("Verify: Report {}".format(report_path))
+
+    if summary[verify.STATUS_OK] != len(keys):
+        sys.exit(1)
 
 
 def update_location(media, file_path, location_name):
@@ -374,6 +845,8 @@ def _update(album, location, time, title, paths, debug):
     has_errors = False
     result = Result()
 
+    db = Manifest().load_hash_db()
+
     files = set()
     for path in paths:
         path = os.path.expanduser(path)
@@ -453,7 +926,7 @@ def _update(album, location, time, title, paths, debug):
                     original_base_name.replace('-%s' % original_title, ''))
 
             dest_path = FILESYSTEM.process_file(current_file, destination,
-                updated_media, move=True, allowDuplicate=True)
+                updated_media, db, move=True, allowDuplicate=True)
             log.info(u'%s -> %s' % (current_file, dest_path))
             log.info('{"source":"%s", "destination":"%s"}' % (current_file,
                 dest_path))
@@ -469,20 +942,73 @@ def _update(album, location, time, title, paths, debug):
             has_errors = False
             result.append((current_file, False))
 
+    db.update_hash_db()
     result.write()
     
     if has_errors:
         sys.exit(1)
 
 
+@click.group('daemon')
+def _daemon():
+    """Run a local daemon which keeps ExifTool and manifests loaded between runs.
+    """
+    pass
+
+
+@_daemon.command('start')
+@click.option('--workers', default=constants.daemon_workers, type=int,
+              help='Number of ExifTool processes to keep running.')
+@click.option('--debug', default=False, is_flag=True,
+              help='Override the value in constants.py with True.')
+def _daemon_start(workers, debug):
+    """Start the daemon in the foreground.
+    """
+    constants.debug = debug
+    FILESYSTEM.create_directory(constants.application_directory)
+    try:
+        daemon.Daemon(workers=workers).serve_forever()
+    except daemon.DaemonError as e:
+        log.error('[!] {}'.format(e))
+        sys.exit(1)
+
+
+@_daemon.command('stop')
+def _daemon_stop():
+    """Stop the running daemon.
+    """
+    client = daemon.get_client()
+    if client is None:
+        log.warn('[ ] No daemon is running')
+        return
+    client.request('shutdown')
+    log.info('[*] Daemon stopped')
+
+
+@_daemon.command('status')
+def _daemon_status():
+    """Print whether the daemon is running.
+    """
+    client = daemon.get_client()
+    if client is None:
+        log.info('[ ] No daemon is running')
+        sys.exit(1)
+    log.info('[*] Daemon running with pid {}'.format(client.request('ping')['pid']))
+
+
 @click.group()
 def main():
     pass
 
 
 main.add_command(_analyze)
+main.add_command(_compact)
+main.add_command(_daemon)
+main.add_command(_diff)
 main.add_command(_import)
 main.add_command(_merge)
+main.add_command(_migrate)
+main.add_command(_history)
 main.add_command(_find)
 main.add_command(_update)
 main.add_command(_generate_db)
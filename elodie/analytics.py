@@ -0,0 +1,213 @@
+"""
+Totals over the entries of a manifest, gathered in a single pass.
+
+Entries are counted by the year and month they were taken, their camera
+model, origin and extension, with the bytes of their target files, along
+with how many have more than one source and which have the most. Each
+dimension gives every distinct value an id, and keeps its counts and bytes
+in arrays indexed by that id, so the totals of a manifest of millions of
+entries take little more memory than its distinct values.
+
+Entries have a source for each place a file was imported from, and a
+dimension uses the first source which has a value for it. Entries written
+before targets recorded their size are counted with no bytes, and
+reported as without size. They can be counted with the size of their first
+source file which still exists instead, at the cost of looking up every
+one of those files.
+"""
+from __future__ import absolute_import
+from builtins import object
+
+import csv
+import heapq
+import json
+import os
+from array import array
+
+from elodie.index import format_date_taken
+
+#: Dimensions entries are counted by, in the order they're written.
+DIMENSIONS = ('year', 'month', 'camera_model', 'origin', 'extension')
+
+#: Dimensions which are written in order of their values, rather than of
+#: their counts.
+_ORDERED_DIMENSIONS = ('year', 'month')
+
+#: Number of the largest duplicate clusters kept by default.
+TOP = 10
+
+
+def get_source_size(sources):
+    """Get the size of the first of an entry's source files which exists.
+
+    Relative paths are skipped, as they're relative to wherever they were
+    imported from.
+
+    :param dict sources: The entry's sources.
+    :returns: int or None
+    """
+    for path in sources:
+        if os.path.isabs(path):
+            try:
+                return os.path.getsize(path)
+            except OSError:
+                continue
+    return None
+
+
+class Counter(object):
+
+    """Counts and bytes per value of a dimension, kept in arrays indexed by
+    an id for each distinct value.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.values = []
+        self.counts = array('q')
+        self.bytes = array('q')
+
+    def add(self, value, size):
+        index = self.ids.get(value)
+        if index is None:
+            index = len(self.values)
+            self.ids[value] = index
+            self.values.append(value)
+            self.counts.append(0)
+            self.bytes.append(0)
+        self.counts[index] += 1
+        self.bytes[index] += size
+
+    def rows(self, by_count=True):
+        """Get the totals of each value.
+
+        :param bool by_count: Whether to order them by count, largest first,
+            rather than by value. Entries without a value come last.
+        :returns: list of tuple(value, int, int) of value, count and bytes
+        """
+        if by_count:
+            order = sorted(range(len(self.values)),
+                           key=lambda i: (-self.counts[i], self.values[i] is None, self.values[i] or ''))
+        else:
+            order = sorted(range(len(self.values)), key=lambda i: (self.values[i] is None, self.values[i] or ''))
+        return [(self.values[i], self.counts[i], self.bytes[i]) for i in order]
+
+
+class Analytics(object):
+
+    """Totals over manifest entries, added one at a time.
+
+    :param int top: Number of the largest duplicate clusters to keep.
+    :param bool stat_sources: Whether entries without a recorded size are
+        counted with the size of their source files.
+    """
+
+    def __init__(self, top=TOP, stat_sources=False):
+        self.top = top
+        self.stat_sources = stat_sources
+        self.entries = 0
+        self.sources = 0
+        self.bytes = 0
+        self.unsized = 0
+        self.counters = dict((dimension, Counter()) for dimension in DIMENSIONS)
+        # Entries by number of sources, indexed by that number.
+        self.source_counts = array('q')
+        self.largest = []
+
+    def add(self, key, entry):
+        """Add an entry to the totals.
+
+        :param str key: The entry's key.
+        :param dict entry: The entry.
+        """
+        sources = entry.get("sources") or {}
+        target = entry.get("target") or {}
+        size = target.get("size")
+        if size is None and self.stat_sources:
+            size = get_source_size(sources)
+        if size is None:
+            self.unsized += 1
+            size = 0
+        self.entries += 1
+        self.sources += len(sources)
+        self.bytes += size
+
+        values = dict.fromkeys(DIMENSIONS)
+        for metadata in sources.values():
+            if values["month"] is None:
+                date_taken = format_date_taken(metadata.get("date_taken"))
+                if date_taken is not None:
+                    values["year"], values["month"] = date_taken[:4], date_taken[:7]
+            for field in ('camera_model', 'origin'):
+                if values[field] is None and metadata.get(field):
+                    values[field] = metadata[field]
+        name = target.get("name") or next(iter(sources), '')
+        values["extension"] = os.path.splitext(name)[1][1:].lower() or None
+        for dimension in DIMENSIONS:
+            self.counters[dimension].add(values[dimension], size)
+
+        count = len(sources)
+        while len(self.source_counts) <= count:
+            self.source_counts.append(0)
+        self.source_counts[count] += 1
+        if count > 1 and self.top > 0:
+            cluster = (count, size, key, target.get("name"))
+            if len(self.largest) < self.top:
+                heapq.heappush(self.largest, cluster)
+            elif cluster > self.largest[0]:
+                heapq.heapreplace(self.largest, cluster)
+
+    def get_duplicates(self):
+        """Get how many entries have each number of sources above one.
+
+        :returns: list of tuple(int, int) of number of sources and entries
+        """
+        return [(count, self.source_counts[count])
+                for count in range(2, len(self.source_counts)) if self.source_counts[count] > 0]
+
+    def get_largest(self):
+        """Get the entries with the most sources, most first.
+
+        :returns: list of dict with the ``checksum``, number of ``sources``,
+            ``bytes`` of the target and target ``name``.
+        """
+        return [{"checksum": key, "sources": count, "bytes": size, "name": name}
+                for count, size, key, name in sorted(self.largest, reverse=True)]
+
+    def get_rows(self, dimension):
+        return self.counters[dimension].rows(by_count=dimension not in _ORDERED_DIMENSIONS)
+
+    def to_dict(self):
+        result = {
+            "entries": self.entries,
+            "sources": self.sources,
+            "bytes": self.bytes,
+            "entries_without_size": self.unsized,
+            "duplicates": [{"sources": count, "entries": entries} for count, entries in self.get_duplicates()],
+            "largest_duplicates": self.get_largest(),
+        }
+        for dimension in DIMENSIONS:
+            result[dimension] = [{"value": value, "entries": count, "bytes": size}
+                                 for value, count, size in self.get_rows(dimension)]
+        return result
+
+    def write_json(self, f):
+        json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+        f.write('\n')
+
+    def write_csv(self, f):
+        """Write the totals as CSV rows of dimension, value, entries and
+        bytes. Duplicates are rows of their number of sources, and the
+        largest clusters rows of their checksum.
+        """
+        writer = csv.writer(f)
+        writer.writerow(('dimension', 'value', 'entries', 'bytes'))
+        writer.writerow(('total', '', self.entries, self.bytes))
+        writer.writerow(('without_size', '', self.unsized, ''))
+        for dimension in DIMENSIONS:
+            for value, count, size in self.get_rows(dimension):
+                writer.writerow((dimension, '' if value is None else value, count, size))
+        for count, entries in self.get_duplicates():
+            writer.writerow(('duplicates', count, entries, ''))
+        for cluster in self.get_largest():
+            writer.writerow(('largest_duplicates', cluster["checksum"], cluster["sources"], cluster["bytes"]))
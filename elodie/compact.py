@@ -0,0 +1,209 @@
+"""
+Compaction of manifests, in a single streaming pass.
+
+Importing merges every source a file is seen at into its entry, so entries
+collect paths in staging folders which are long gone. Compacting a manifest
+drops sources which no longer exist, once they've been missing for
+``constants.compact_keep_missing_days``, leaving relative source paths
+alone as they can't be checked, removes null values left by older
+versions and sorts the sources of each entry. The manifest is read and
+rewritten one entry at a time, and replaced once it's complete.
+"""
+from __future__ import absolute_import
+from builtins import object
+
+import os
+import time
+
+from elodie import constants
+from elodie import history
+from elodie import shards
+from elodie.manifest import Manifest
+from elodie.manifest_stream import ManifestWriter
+
+#: Key a source's metadata records when it was first found missing, in
+#: seconds since the epoch.
+MISSING_KEY = 'missing'
+
+
+def remove_nulls(value):
+    """Remove null values from the dicts in a value.
+
+    :returns: tuple(value, int) of the value without nulls and the number
+        removed.
+    """
+    if isinstance(value, dict):
+        removed = 0
+        result = {}
+        for k, v in value.items():
+            if v is None:
+                removed += 1
+                continue
+            result[k], count = remove_nulls(v)
+            removed += count
+        return (result, removed)
+    if isinstance(value, list):
+        removed = 0
+        result = []
+        for v in value:
+            v, count = remove_nulls(v)
+            result.append(v)
+            removed += count
+        return (result, removed)
+    return (value, 0)
+
+
+class SourceChecker(object):
+
+    """Check whether source files exist.
+
+    Sources are usually many files in few folders, so whether each folder
+    exists is remembered, and the files in one which doesn't aren't looked
+    up.
+    """
+
+    def __init__(self):
+        self.directories = {}
+
+    def exists(self, path):
+        directory = os.path.dirname(path)
+        if directory not in self.directories:
+            self.directories[directory] = os.path.isdir(directory)
+        return self.directories[directory] and os.path.exists(path)
+
+
+def compact_entry(entry, checker, now, keep_missing_days):
+    """Compact a manifest entry.
+
+    :param dict entry: The entry.
+    :param checker: :class:`SourceChecker`
+    :param int now: The current time, in seconds since the epoch.
+    :param int keep_missing_days: Days a missing source is kept for.
+    :returns: tuple(dict, dict) of the compacted entry, or None if nothing
+        is left of it, and the counts of ``sources_removed``,
+        ``sources_missing``, ``sources_relative`` and ``nulls_removed``.
+    """
+    entry, nulls_removed = remove_nulls(entry)
+    counts = {"sources_removed": 0, "sources_missing": 0, "sources_relative": 0, "nulls_removed": nulls_removed}
+    sources = {}
+    # Sorted, so compacting a manifest twice gives the same file.
+    for path, metadata in sorted((entry.get("sources") or {}).items()):
+        if not os.path.isabs(path):
+            # Relative to wherever it was imported from, which isn't known,
+            #   so it can't be checked.
+            counts["sources_relative"] += 1
+        elif checker.exists(path):
+            metadata.pop(MISSING_KEY, None)
+        else:
+            missing = metadata.setdefault(MISSING_KEY, now)
+            if now - missing >= keep_missing_days * 86400:
+                counts["sources_removed"] += 1
+                continue
+            counts["sources_missing"] += 1
+        sources[path] = metadata
+    entry["sources"] = sources
+    if len(sources) == 0 and not entry.get("target"):
+        return (None, counts)
+    return (entry, counts)
+
+
+def get_entry_files(manifest_path):
+    """Get the files a manifest's entries are in: the manifest file, or the
+    shards of a sharded manifest.
+
+    :returns: list of str
+    """
+    if not shards.is_sharded(manifest_path):
+        return [manifest_path]
+    header = shards.read_header(manifest_path) or {}
+    prefix_length = shards.get_prefix_length(header.get("shards", constants.manifest_shards))
+    return [shards.get_shard_path(manifest_path, name)
+            for name in shards.get_shard_names(manifest_path, prefix_length)]
+
+
+def get_size(manifest_path):
+    """Get the number of bytes a manifest takes, without its sidecars and
+    history.
+
+    :returns: int
+    """
+    paths = get_entry_files(manifest_path)
+    if shards.is_sharded(manifest_path):
+        paths.append(os.path.join(manifest_path, shards.HEADER_FILE))
+    return sum(os.path.getsize(path) for path in paths if os.path.isfile(path))
+
+
+def compact_file(manifest_path, keep_missing_days=None, dryrun=False, indent=False, now=None):
+    """Compact a manifest file or sharded manifest in place.
+
+    The history of each file has a snapshot of it from before and after
+    compaction, so it can be rolled back.
+
+    :param str manifest_path: Path of the manifest.
+    :param int keep_missing_days: Days a missing source is kept for,
+        defaults to ``constants.compact_keep_missing_days``.
+    :param bool dryrun: Count what would be removed without writing.
+    :param bool indent: Whether to indent the JSON.
+    :param int now: The current time, in seconds since the epoch.
+    :returns: dict of the counts of ``entries``, ``entries_removed``,
+        ``sources_removed``, ``sources_missing``, ``sources_relative`` and
+        ``nulls_removed``, and the manifest's size in ``bytes_before`` and
+        ``bytes_after``, which is None for a dry run.
+    """
+    if keep_missing_days is None:
+        keep_missing_days = constants.compact_keep_missing_days
+    if now is None:
+        now = int(time.time())
+    summary = {
+        "entries": 0,
+        "entries_removed": 0,
+        "sources_removed": 0,
+        "sources_missing": 0,
+        "sources_relative": 0,
+        "nulls_removed": 0,
+        "bytes_before": get_size(manifest_path),
+    }
+    checker = SourceChecker()
+
+    files = get_entry_files(manifest_path)
+    if not dryrun:
+        for file_path in files:
+            history.snapshot_file(file_path)
+
+    with shards.open_reader(manifest_path) as reader:
+        # Legacy headers are written out in full.
+        header = Manifest()
+        header.merge_header(reader.header, reader.has_entries())
+        if dryrun:
+            writer = None
+        elif shards.is_sharded(manifest_path):
+            # Shards are read in order, so their keys come grouped by prefix.
+            writer = shards.ShardedWriter(manifest_path, header.get_header(), reader.header.get("shards"), indent,
+                                          constants.manifest_sidecar)
+        else:
+            writer = ManifestWriter(manifest_path, header.get_header(), indent, constants.manifest_sidecar)
+        try:
+            for key, entry in reader:
+                entry, counts = compact_entry(entry, checker, now, keep_missing_days)
+                for name, count in counts.items():
+                    summary[name] += count
+                if entry is None:
+                    summary["entries_removed"] += 1
+                    continue
+                summary["entries"] += 1
+                if writer is not None:
+                    writer.write(key, entry)
+        except Exception:
+            if writer is not None:
+                writer.abort()
+            raise
+        if writer is not None:
+            writer.close()
+
+    if not dryrun:
+        # Shards which are left without entries are removed.
+        for file_path in sorted(set(files).union(get_entry_files(manifest_path))):
+            history.snapshot_file(file_path, header.get_header())
+
+    summary["bytes_after"] = None if dryrun else get_size(manifest_path)
+    return summary
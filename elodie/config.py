@@ -1,5 +1,27 @@
 import json
 import os
+from configparser import RawConfigParser
+
+from elodie import constants
+
+#: Path to the ini file with settings such as API keys.
+config_file = '%s/config.ini' % constants.application_directory
+
+
+def load_config():
+    """Load the ini config file, once per process.
+
+    :returns: RawConfigParser, or an empty dict if there's no config file.
+    """
+    if hasattr(load_config, "config"):
+        return load_config.config
+
+    if not os.path.exists(config_file):
+        return {}
+
+    load_config.config = RawConfigParser()
+    load_config.config.read(config_file)
+    return load_config.config
 
 
 class Config:
@@ -18,6 +40,3 @@ class Config:
             self.fields = json.load(f)
 
         return self.fields
-
-
-
@@ -14,9 +14,85 @@ application_directory = '{}/.elodie'.format(path.expanduser('~'))
 #: File in which to store details about media Elodie has seen.
 hash_db = '{}/hash.json'.format(application_directory)
 
+#: Number of hashes added to the hash db between writes of it to disk.
+hash_db_flush_size = 1000
+
+#: Number of files generate-db hashes at once.
+generate_db_workers = 4
+
+#: Number of files verify hashes at once.
+verify_workers = 4
+
+#: Number of files verify checks between saves of its resume cursor.
+verify_cursor_interval = 100
+
 #: File in which to store geolocation details about media Elodie has seen.
 location_db = '{}/location.json'.format(application_directory)
 
+#: Number of places added to the location db between writes of it to disk.
+location_db_flush_size = 100
+
+#: Places in the offline gazetteer further than this many kilometers from a
+#: photo's coordinates aren't used to name its location.
+gazetteer_max_distance = 50
+
+#: If True, manifests are written with a binary lookup index next to them,
+#: see elodie.sidecar.
+manifest_sidecar = True
+
+#: Number of delta snapshots of a manifest's history between full ones. See
+#: elodie.history.
+history_full_interval = 20
+
+#: Number of a manifest's latest history snapshots which are kept.
+history_keep_last = 10
+
+#: Number of days of which the latest history snapshot is kept.
+history_keep_daily = 7
+
+#: Number of weeks of which the latest history snapshot is kept.
+history_keep_weekly = 8
+
+#: Number of shards new sharded manifests are split in, 256 or 4096. See
+#: elodie.shards.
+manifest_shards = 256
+
+#: Number of days compacting a manifest keeps a source which no longer
+#: exists, from when it was first found missing, so sources on a drive
+#: which isn't mounted survive a while. See elodie.compact.
+compact_keep_missing_days = 30
+
+#: Number of entries merging manifests holds in memory. Larger merges are
+#: sorted in runs of this many entries in temporary files.
+merge_run_size = 100000
+
+#: Unix socket the optional Elodie daemon listens on.
+daemon_socket = '{}/daemon.sock'.format(application_directory)
+
+#: Number of ExifTool processes the daemon keeps running.
+daemon_workers = 2
+
+#: Hash algorithm new manifests are keyed on. See elodie.hashing.ALGORITHMS.
+hash_algorithm = 'sha256'
+
+#: If True, hashing maps large files with mmap instead of reading them.
+hash_mmap = True
+
+#: If True, files are dropped from the page cache after they're hashed, so
+#: hashing a large library doesn't evict other processes' cached files.
+hash_drop_cache = True
+
+#: Chunk size of tree hashes, which hash large files in several threads,
+#: e.g. elodie.hashing.TREE_CHUNK_SIZE. New manifests are tree hashed if
+#: this is set. None disables tree hashing.
+tree_chunk_size = None
+
+#: Number of threads tree hashing uses to hash chunks.
+tree_hash_workers = 4
+
+#: Number of files hashed in the background by imports with deferred hashing.
+deferred_hash_workers = 2
+
 #: Elodie installation directory.
 script_directory = path.dirname(path.dirname(path.abspath(__file__)))
 
@@ -26,9 +102,37 @@ exiftool_config = path.join(script_directory, 'configs', 'ExifTool_config')
 # How many files to read into ExifTool batch mode at once. Larger batches == faster import, more memory consumption
 exiftool_batch_size = 100
 
+#: ExifTool scan mode used by imports. 'fast' and 'fast2' are header-only
+#: scans which stop reading early and may skip some tags.
+exiftool_scan_mode = 'full'
+
+#: ExifTool arguments for each scan mode.
+exiftool_scan_mode_args = {
+    'full': [],
+    'fast': ['-fast'],
+    'fast2': ['-fast2'],
+}
+
+#: If True, read metadata with the built-in header parsers before falling
+#: back to ExifTool.
+native_metadata = True
+
 #: Accepted language in responses from MapQuest
 accepted_language = 'en'
 
+#: Base URL of the geocoding API.
+geocoding_url = 'https://open.mapquestapi.com'
+
+#: Decimal places coordinates are rounded to before they're geocoded. 3
+#: places are about 100 meters.
+geocoding_precision = 3
+
+#: Number of geocoding lookups run at once.
+geocoding_workers = 4
+
+#: Seconds to wait for a geocoding response.
+geocoding_timeout = 10
+
 # check python version, required in filesystem.py to trigger appropriate method
 python_version = version_info.major
 
@@ -0,0 +1,276 @@
+"""
+An optional local daemon which keeps warm ExifTool workers and loaded
+manifests in memory, so short CLI operations don't pay for launching
+ExifTool or parsing a manifest on every run.
+
+The daemon listens on a Unix socket (see ``constants.daemon_socket``).
+Requests and responses are single lines of JSON. The CLI and
+:class:`~elodie.media.media.Media` use the daemon transparently when it's
+running and fall back to doing the work in-process otherwise.
+"""
+from __future__ import print_function
+
+import json
+import os
+import socket
+import threading
+
+try:
+    import socketserver
+except ImportError:  # Python 2
+    import SocketServer as socketserver
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+from elodie import constants
+from elodie import log
+
+__CLIENT__ = None
+
+
+class DaemonError(Exception):
+    """Raised when the daemon returns an error for a request."""
+
+
+class Client(object):
+
+    """A client for the daemon's Unix socket.
+
+    :param str socket_path: Path to the daemon's socket.
+    """
+
+    def __init__(self, socket_path=None):
+        if socket_path is None:
+            socket_path = constants.daemon_socket
+        self.socket_path = socket_path
+
+    def request(self, command, **params):
+        """Send a request and return the daemon's response.
+
+        :param str command: Name of the command to run.
+        :returns: dict
+        :raises DaemonError: If the daemon reported an error.
+        """
+        params['command'] = command
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.connect(self.socket_path)
+            connection.sendall(json.dumps(params).encode('utf-8') + b'\n')
+            with connection.makefile('rb') as f:
+                line = f.readline()
+        finally:
+            connection.close()
+
+        if not line:
+            raise DaemonError('No response from daemon')
+        response = json.loads(line.decode('utf-8'))
+        if 'error' in response:
+            raise DaemonError(response['error'])
+        return response
+
+    def is_running(self):
+        """Check whether a daemon is answering on the socket.
+
+        :returns: bool
+        """
+        if not hasattr(socket, 'AF_UNIX') or not os.path.exists(self.socket_path):
+            return False
+        try:
+            return self.request('ping')['status'] == 'ok'
+        except (socket.error, ValueError, DaemonError):
+            return False
+
+    def get_metadata(self, file_path):
+        """Get exiftool metadata for a single file.
+
+        :returns: dict or None
+        """
+        # The daemon runs in its own working directory.
+        records = self.request('metadata', files=[os.path.abspath(file_path)])['records']
+        if not records:
+            return None
+        return records[0]
+
+    def set_tags(self, tags, file_path):
+        """Write tags to a file.
+
+        :returns: str exiftool's output
+        """
+        return self.request('set_tags', tags=tags, file=os.path.abspath(file_path))['result']
+
+    def query(self, manifest_path, criteria):
+        """Find manifest entries matching criteria.
+
+        :param dict criteria: Keyword arguments of
+            :meth:`elodie.index.ManifestIndex.find`.
+        :returns: dict of checksum to entry
+        """
+        return self.request('query', manifest=os.path.abspath(manifest_path),
+                            criteria=criteria)['entries']
+
+
+def get_client():
+    """Get a client for the running daemon.
+
+    The check is done once per process.
+
+    :returns: :class:`Client` or None if no daemon is running.
+    """
+    global __CLIENT__
+    if __CLIENT__ is None:
+        client = Client()
+        __CLIENT__ = client if client.is_running() else False
+    return __CLIENT__ or None
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line.decode('utf-8'))
+            response = self.server.daemon.handle(request)
+        except Exception as e:
+            response = {'error': '{}: {}'.format(type(e).__name__, e)}
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class Daemon(object):
+
+    """Serve requests with a pool of warm ExifTool workers and cached manifests.
+
+    :param str socket_path: Path of the socket to listen on.
+    :param int workers: Number of ExifTool processes to keep running.
+    """
+
+    def __init__(self, socket_path=None, workers=None):
+        if socket_path is None:
+            socket_path = constants.daemon_socket
+        if workers is None:
+            workers = constants.daemon_workers
+        self.socket_path = socket_path
+        self.workers = workers
+        self.exiftools = queue.Queue()
+        self.manifests = {}
+        self.indexes = {}
+        self.manifests_lock = threading.Lock()
+        self.server = None
+
+    def serve_forever(self):
+        """Start the workers and serve requests until shut down."""
+        from elodie.external.pyexiftool import ExifTool
+
+        if Client(self.socket_path).is_running():
+            raise DaemonError('A daemon is already running on {}'.format(self.socket_path))
+        if os.path.exists(self.socket_path):
+            # Left behind by a daemon which didn't shut down cleanly.
+            os.remove(self.socket_path)
+
+        addedargs = [u'-config', u'"{}"'.format(constants.exiftool_config)]
+        for i in range(self.workers):
+            et = ExifTool(addedargs=addedargs)
+            et.start()
+            self.exiftools.put(et)
+
+        old_umask = os.umask(0o077)
+        try:
+            self.server = _Server(self.socket_path, _Handler)
+        finally:
+            os.umask(old_umask)
+        self.server.daemon = self
+
+        log.info('[*] Daemon listening on {} with {} ExifTool workers'.format(self.socket_path, self.workers))
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            while not self.exiftools.empty():
+                self.exiftools.get().terminate()
+
+    def handle(self, request):
+        """Dispatch a request to the method for its command.
+
+        :returns: dict
+        """
+        command = request.pop('command', None)
+        handler = getattr(self, 'command_{}'.format(command), None)
+        if handler is None:
+            return {'error': 'Unknown command {}'.format(command)}
+        return handler(**request)
+
+    def command_ping(self):
+        return {'status': 'ok', 'pid': os.getpid()}
+
+    def command_shutdown(self):
+        # shutdown() blocks until serve_forever() returns, which would
+        #   deadlock if called from the request handler's thread.
+        threading.Thread(target=self.server.shutdown).start()
+        return {'status': 'ok'}
+
+    def command_metadata(self, files):
+        et = self.exiftools.get()
+        try:
+            return {'records': list(et.iter_execute_json(*files))}
+        finally:
+            self.exiftools.put(et)
+
+    def command_set_tags(self, tags, file):
+        params = [u'-overwrite_original']
+        for tag, value in tags.items():
+            params.append(u'-%s=%s' % (tag, value))
+        params.append(file)
+        et = self.exiftools.get()
+        try:
+            result = et.execute(*[param.encode('utf-8') for param in params])
+        finally:
+            self.exiftools.put(et)
+        return {'result': result.decode('utf-8', 'replace')}
+
+    def command_query(self, manifest, criteria):
+        loaded, index = self.get_index(manifest)
+        keys = index.find(**criteria)
+        return {'entries': dict((key, loaded.entries[key]) for key in keys)}
+
+    def get_manifest(self, file_path):
+        """Get a loaded manifest, reloading it if the file has changed.
+
+        :returns: :class:`~elodie.manifest.Manifest`
+        """
+        from elodie.manifest import Manifest
+
+        stat = os.stat(file_path)
+        key = (stat.st_size, stat.st_mtime)
+        with self.manifests_lock:
+            cached = self.manifests.get(file_path)
+            if cached is None or cached[0] != key:
+                cached = (key, Manifest().load_from_file(file_path))
+                self.manifests[file_path] = cached
+            return cached[1]
+
+    def get_index(self, file_path):
+        """Get a loaded manifest and its index, building the index the first
+        time the manifest is queried after it's loaded.
+
+        :returns: tuple(:class:`~elodie.manifest.Manifest`,
+            :class:`~elodie.index.ManifestIndex`)
+        """
+        from elodie.index import ManifestIndex
+
+        manifest = self.get_manifest(file_path)
+        with self.manifests_lock:
+            cached = self.indexes.get(file_path)
+            if cached is None or cached[0] is not manifest:
+                cached = (manifest, ManifestIndex(manifest.entries))
+                self.indexes[file_path] = cached
+            return cached
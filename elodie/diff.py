@@ -0,0 +1,221 @@
+"""
+Compare two manifests, or a manifest and a directory of files, by digest.
+
+Each side is sorted by key a run at a time, see
+:func:`elodie.manifest.sort_entries`, and the sorted sides are walked
+together in a single merge join, so only a run of each side is held in
+memory however large the manifests are. A directory is read by hashing its
+files the way the manifest keys them.
+
+Results are written as one JSON object per line.
+"""
+from __future__ import absolute_import
+
+import json
+import os
+import shutil
+import tempfile
+from multiprocessing.pool import ThreadPool
+
+from elodie import log
+from elodie import shards
+from elodie.manifest import Manifest
+from elodie.manifest import sort_entries
+
+#: The digest is only in the new side.
+STATUS_ADDED = 'added'
+
+#: The digest is only in the old side.
+STATUS_REMOVED = 'removed'
+
+#: The digest is in both sides, with different sources or target.
+STATUS_CHANGED = 'changed'
+
+#: The digest is in both sides, with the same sources and target.
+STATUS_UNCHANGED = 'unchanged'
+
+STATUSES = (STATUS_ADDED, STATUS_REMOVED, STATUS_CHANGED, STATUS_UNCHANGED)
+
+
+def is_directory(path):
+    """Check whether a path is a directory of files rather than a manifest.
+
+    :returns: bool
+    """
+    return os.path.isdir(path) and shards.read_header(path) is None
+
+
+def join(old, new):
+    """Merge join two iterables of (key, entry) sorted by key.
+
+    :returns: generator of tuple(str, dict, dict) of the key and its old
+        and new entries, either of which is None if it's only in one side.
+    """
+    old = iter(old)
+    new = iter(new)
+    old_pair = next(old, None)
+    new_pair = next(new, None)
+    while old_pair is not None or new_pair is not None:
+        if new_pair is None or (old_pair is not None and old_pair[0] < new_pair[0]):
+            yield (old_pair[0], old_pair[1], None)
+            old_pair = next(old, None)
+        elif old_pair is None or new_pair[0] < old_pair[0]:
+            yield (new_pair[0], None, new_pair[1])
+            new_pair = next(new, None)
+        else:
+            yield (old_pair[0], old_pair[1], new_pair[1])
+            old_pair = next(old, None)
+            new_pair = next(new, None)
+
+
+def get_changes(old, new):
+    """Get what differs between two entries with the same key.
+
+    Sources are compared on their paths and metadata, and targets on their
+    path and name, as :func:`elodie.manifest.merge_entry` does.
+
+    :returns: list of str, some of ``sources``, ``metadata`` and ``target``
+    """
+    changes = []
+    old_sources = old.get("sources") or {}
+    new_sources = new.get("sources") or {}
+    if sorted(old_sources) != sorted(new_sources):
+        changes.append("sources")
+    elif old_sources != new_sources:
+        changes.append("metadata")
+    old_target = old.get("target") or {}
+    new_target = new.get("target") or {}
+    if (old_target.get("path"), old_target.get("name")) != (new_target.get("path"), new_target.get("name")):
+        changes.append("target")
+    return changes
+
+
+def diff(old, new, compare=True):
+    """Diff two iterables of (key, entry) sorted by key.
+
+    :param bool compare: Whether to compare the entries of keys in both.
+        If not, they're all unchanged.
+    :returns: generator of dict records with the ``checksum``, ``status``,
+        ``old`` and ``new`` entries and, if it changed, the ``changes`` and
+        the source paths only in the new entry, ``sources_added``, and only
+        in the old one, ``sources_removed``.
+    """
+    for key, old_entry, new_entry in join(old, new):
+        record = {"checksum": key, "old": old_entry, "new": new_entry}
+        if old_entry is None:
+            record["status"] = STATUS_ADDED
+        elif new_entry is None:
+            record["status"] = STATUS_REMOVED
+        else:
+            changes = get_changes(old_entry, new_entry) if compare else []
+            if changes:
+                record["status"] = STATUS_CHANGED
+                record["changes"] = changes
+                old_sources = set(old_entry.get("sources") or {})
+                new_sources = set(new_entry.get("sources") or {})
+                record["sources_added"] = sorted(new_sources - old_sources)
+                record["sources_removed"] = sorted(old_sources - new_sources)
+            else:
+                record["status"] = STATUS_UNCHANGED
+        yield record
+
+
+def hash_directory(directory, manifest, workers=1):
+    """Hash the files under a directory the way a manifest keys them.
+
+    Hidden files and directories, such as a manifest's history, are
+    skipped.
+
+    :param str directory: The directory.
+    :param manifest: :class:`~elodie.manifest.Manifest` with the hashing
+        settings to use.
+    :param int workers: Number of files to hash at once.
+    :returns: generator of tuple(str, dict) of each digest and an entry
+        with the file as its source.
+    """
+    def get_files():
+        for dirname, dirnames, filenames in os.walk(directory):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+            for filename in sorted(filenames):
+                if not filename.startswith('.'):
+                    yield os.path.join(dirname, filename)
+
+    def hash_file(file_path):
+        return (file_path, manifest.checksum(file_path))
+
+    # Hashing releases the GIL, so threads keep several disks/cores busy.
+    pool = ThreadPool(workers)
+    try:
+        for file_path, checksum in pool.imap_unordered(hash_file, get_files(), 16):
+            if checksum is None:
+                log.warn("Could not hash {}".format(file_path))
+                continue
+            yield (checksum, {"sources": {file_path: {}}})
+    finally:
+        pool.close()
+        pool.join()
+
+
+def diff_paths(old_path, new_path, report, statuses=None, workers=1, run_size=None):
+    """Diff two manifests, or a manifest and a directory, writing a record
+    per digest to a report.
+
+    :param str old_path: Path of the old manifest or directory.
+    :param str new_path: Path of the new manifest or directory.
+    :param report: File-like object the records are written to.
+    :param statuses: Only write records with these statuses. Defaults to
+        every status but unchanged.
+    :param int workers: Number of files to hash at once, for a directory.
+    :param int run_size: Number of entries of each side held in memory,
+        defaults to ``constants.merge_run_size``.
+    :returns: dict of the number of digests with each status.
+    :raises ValueError: If both paths are directories, or the manifests are
+        keyed on different hashes.
+    """
+    if statuses is None:
+        statuses = (STATUS_ADDED, STATUS_REMOVED, STATUS_CHANGED)
+    paths = (old_path, new_path)
+    if all(is_directory(path) for path in paths):
+        raise ValueError('At least one of {} and {} has to be a manifest'.format(old_path, new_path))
+
+    readers = []
+    directory = tempfile.mkdtemp(prefix='elodie-diff.')
+    try:
+        keying = Manifest()
+        keyed = False
+        for path in paths:
+            if is_directory(path):
+                readers.append(None)
+                continue
+            reader = shards.open_reader(path)
+            readers.append(reader)
+            # Empty manifests don't decide how the other side is keyed.
+            if reader.has_entries() or not keyed:
+                settings = (keying.algorithm, keying.tree_chunk_size)
+                keying.merge_header(reader.header, reader.has_entries())
+                if keyed and (keying.algorithm, keying.tree_chunk_size) != settings:
+                    raise ValueError("Cannot compare a {} manifest with a {} manifest; migrate one of them first".format(
+                        keying.describe_hashing(*settings),
+                        keying.describe_hashing(keying.algorithm, keying.tree_chunk_size)))
+                keyed = keyed or reader.has_entries()
+
+        sides = []
+        for path, reader in zip(paths, readers):
+            pairs = reader if reader is not None else hash_directory(path, keying, workers)
+            # Each side has its own runs, so they can be read in step.
+            side_directory = tempfile.mkdtemp(dir=directory)
+            sides.append(sort_entries(pairs, side_directory, run_size))
+
+        summary = dict((status, 0) for status in STATUSES)
+        # Entries found by hashing a directory have nothing to compare.
+        compare = None not in readers
+        for record in diff(sides[0], sides[1], compare):
+            summary[record["status"]] += 1
+            if record["status"] in statuses:
+                report.write(json.dumps(record, sort_keys=True) + '\n')
+    finally:
+        for reader in readers:
+            if reader is not None:
+                reader.close()
+        shutil.rmtree(directory, ignore_errors=True)
+    return summary
@@ -0,0 +1,177 @@
+"""
+Staged duplicate detection for imports.
+
+Most files in a library have a byte size no other file shares, so they
+can't be duplicates and don't need to be hashed to find that out. Files are
+bucketed by size first. Within a bucket a cheap fingerprint of the first,
+middle and last blocks rules out most of the rest, and only the files left
+over are fully hashed.
+
+The manifest is still keyed on the full digest, so files which were ruled
+unique are hashed on a background pool and merged into the manifest by
+:meth:`DuplicateDetector.finish`.
+"""
+from builtins import object
+
+import os
+from multiprocessing.pool import ThreadPool
+
+from elodie import constants
+from elodie import hashing
+from elodie import log
+
+
+class _Candidate(object):
+
+    """A file already seen, which new files of the same size are compared to.
+
+    :param list paths: Paths the content may be read from, in order.
+    :param str digest: Full digest, if known.
+    :param result: Pending background hash of the content.
+    """
+
+    __slots__ = ('paths', 'digest', 'result', '_fingerprint')
+
+    def __init__(self, paths, digest=None, result=None):
+        self.paths = paths
+        self.digest = digest
+        self.result = result
+        self._fingerprint = False
+
+    def get_fingerprint(self, algorithm):
+        """Fingerprint the content from the first readable path.
+
+        :returns: str or None if no path could be read.
+        """
+        if self._fingerprint is False:
+            self._fingerprint = None
+            for path in self.paths:
+                self._fingerprint = hashing.fingerprint(path, algorithm)
+                if self._fingerprint is not None:
+                    break
+        return self._fingerprint
+
+    def get_digest(self):
+        """Get the full digest, waiting for a background hash if needed.
+
+        :returns: str or None
+        """
+        if self.digest is None and self.result is not None:
+            self.digest = self.result.get()[0]
+        return self.digest
+
+
+class DuplicateDetector(object):
+
+    """Decide whether files are duplicates, hashing them fully only when
+    that can't be decided from their size or fingerprint.
+
+    :param manifest: The :class:`~elodie.manifest.Manifest` being imported
+        into.
+    :param str base_path: Base path of the target, where the content of
+        manifest entries can be read.
+    :param int workers: Number of files to hash in the background.
+    """
+
+    def __init__(self, manifest, base_path=None, workers=None):
+        if workers is None:
+            workers = constants.deferred_hash_workers
+        self.manifest = manifest
+        self.algorithm = manifest.algorithm
+        self.pool = ThreadPool(workers)
+        self.pending = []
+        self.sizes = {}
+        # Entries written before sizes were recorded can't be ruled out by
+        #   size, only by their extensions.
+        self.unsized_extensions = set()
+        self.hashed_count = 0
+        self.deferred_count = 0
+
+        for key, entry in manifest.iter_entries():
+            target = entry.get("target") or {}
+            size = target.get("size")
+            if size is None:
+                for name in [target.get("name")] + list(entry.get("sources") or {}):
+                    if name:
+                        self.unsized_extensions.add(os.path.splitext(name)[1][1:].lower())
+                continue
+            paths = manifest.get_entry_paths(entry, base_path)
+            self.sizes.setdefault(size, []).append(_Candidate(paths, digest=key))
+
+    def could_be_unsized(self, file_path):
+        """Check whether a file could be a duplicate of an entry without a
+        recorded size, because one of them has the file's extension.
+
+        :param str file_path: Path to the file.
+        :returns: bool
+        """
+        return os.path.splitext(file_path)[1][1:].lower() in self.unsized_extensions
+
+    def check(self, file_path):
+        """Check whether a file is a duplicate of one seen before.
+
+        :param str file_path: Path to the file.
+        :returns: tuple(bool, str, list) of whether the file is a duplicate,
+            its digest and its chunk digests as returned by
+            :meth:`~elodie.manifest.Manifest.hash_file`. The digest is None
+            if the file was ruled unique without hashing it.
+        """
+        bucket = self.sizes.get(os.path.getsize(file_path), [])
+        if not self.could_be_unsized(file_path):
+            if len(bucket) == 0:
+                return (False, None, None)
+
+            file_fingerprint = hashing.fingerprint(file_path, self.algorithm)
+            could_match = False
+            for candidate in bucket:
+                candidate_fingerprint = candidate.get_fingerprint(self.algorithm)
+                if candidate_fingerprint is None or candidate_fingerprint == file_fingerprint:
+                    could_match = True
+                    break
+            if file_fingerprint is not None and not could_match:
+                return (False, None, None)
+
+        # The file is usually copied next, so keep it cached.
+        digest, chunks = self.manifest.hash_file(file_path, drop_cache=False)
+        self.hashed_count += 1
+        is_duplicate = digest in self.manifest.entries or \
+            any(candidate.get_digest() == digest for candidate in bucket)
+        return (is_duplicate, digest, chunks)
+
+    def add(self, content_path, manifest_entry, digest=None):
+        """Record an imported file so later files are compared to it.
+
+        If the digest isn't known yet the file is hashed in the background
+        and the entry is merged into the manifest by :meth:`finish`.
+
+        :param str content_path: Path the content can be read from now.
+        :param dict manifest_entry: The file's manifest entry.
+        :param str digest: The file's digest, if it was hashed.
+        """
+        result = None
+        if digest is None:
+            result = self.pool.apply_async(self.manifest.hash_file, (content_path,))
+            self.pending.append((result, content_path, manifest_entry))
+            self.deferred_count += 1
+
+        size = manifest_entry["target"]["size"]
+        self.sizes.setdefault(size, []).append(_Candidate([content_path], digest, result))
+
+    def finish(self):
+        """Wait for background hashing and merge the entries into the manifest.
+
+        :returns: bool False if any file couldn't be hashed.
+        """
+        self.pool.close()
+        success = True
+        for result, content_path, manifest_entry in self.pending:
+            digest, chunks = result.get()
+            if digest is None:
+                log.warn("[!] Could not hash {}".format(content_path))
+                success = False
+                continue
+            self.manifest.set_chunks(manifest_entry, chunks)
+            self.manifest.merge({digest: manifest_entry})
+        self.pool.join()
+        self.pending = []
+        return success
@@ -0,0 +1,218 @@
+"""
+A compact in-memory store for manifest entries.
+
+Entries are nested dicts in the manifest file, which costs a few hundred
+bytes of dict overhead per entry and keeps a separate copy of every camera
+model, album and directory. Here each entry is a record with
+``__slots__``. Nested dicts are stored as a shared tuple of their keys
+followed by their values, lists of small numbers such as dates are packed
+into bytes and other lists stored as tuples, source paths are split into a
+shared directory prefix and a file name, and hex keys are stored as bytes.
+
+Only values which many entries share are interned: the keys of dicts,
+directory prefixes and the fields of :data:`INTERNED_FIELDS`. The table of
+interned values isn't pruned when entries are replaced or deleted, so it's
+kept to values with few distinct ones; titles, names, digests and
+timestamps are stored as they are.
+
+:class:`CompactEntries` is a mapping of key to entry dict like the plain
+dict it replaces. Entries are rebuilt as dicts when they're read, so
+changing a dict which was read doesn't change the store; assign it back or
+use :meth:`elodie.manifest.Manifest.merge`.
+"""
+from builtins import object
+
+import binascii
+import re
+from array import array
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:  # Python 2
+    from collections import MutableMapping
+
+
+#: Lists of integers below this, like the fields of dates, are packed into
+#: bytes.
+PACK_INT_LIMIT = 1 << 16
+
+#: Fields of sources and targets whose values are shared by many entries,
+#: so they're interned.
+INTERNED_FIELDS = ('camera_make', 'camera_model', 'album', 'origin', 'path')
+
+_HEX_KEY = re.compile(r'^[0-9a-f]+\Z')
+
+
+class _FrozenDict(tuple):
+
+    """A dict stored as a shared tuple of its keys followed by its values."""
+
+    __slots__ = ()
+
+
+class _PackedInts(bytes):
+
+    """A list of small integers, such as a date, packed into bytes."""
+
+    __slots__ = ()
+
+
+class _Entry(object):
+
+    """A manifest entry.
+
+    :param tuple sources: The sources flattened into (directory prefix,
+        file name, frozen metadata) triples, or None.
+    :param target: The frozen target dict, or None.
+    :param other: Any other keys of the entry as a frozen dict, or None.
+    """
+
+    __slots__ = ('sources', 'target', 'other')
+
+    def __init__(self, sources, target, other):
+        self.sources = sources
+        self.target = target
+        self.other = other
+
+
+class CompactEntries(MutableMapping):
+
+    """A mapping of manifest keys to entries, stored compactly.
+
+    :param dict entries: Entries to start with.
+    """
+
+    def __init__(self, entries=None):
+        self.records = {}
+        self.values = {}
+        self.changed = None
+        if entries is not None:
+            self.update(entries)
+
+    def track_changes(self, enabled=True):
+        """Start recording which keys are set or deleted, forgetting any
+        recorded before, or stop recording them.
+
+        :param bool enabled: Whether to record changes.
+        """
+        self.changed = set() if enabled else None
+
+    def get_changes(self):
+        """Get the keys set or deleted since :meth:`track_changes`.
+
+        :returns: list of str, or None if changes aren't recorded.
+        """
+        if self.changed is None:
+            return None
+        return [self.decode_key(key) for key in self.changed]
+
+    def intern(self, value):
+        """Get the shared copy of a string or tuple of keys.
+
+        :returns: The shared copy, equal to ``value``.
+        """
+        return self.values.setdefault(value, value)
+
+    def freeze(self, value, field=None):
+        """Convert a value from an entry to the form it's stored in.
+
+        :param value: A dict, list or JSON scalar.
+        :param str field: Key of the dict the value is in, if any.
+        """
+        if isinstance(value, dict):
+            return _FrozenDict(
+                (self.intern(tuple(value.keys())),) +
+                tuple(self.freeze(v, k) for k, v in value.items())
+            )
+        if isinstance(value, (list, tuple)):
+            # Booleans are ints too, but aren't packed as they'd read back as numbers.
+            if len(value) > 1 and all(type(v) is int and 0 <= v < PACK_INT_LIMIT for v in value):
+                return _PackedInts(array('H', value).tobytes())
+            return tuple(self.freeze(v) for v in value)
+        if type(value) is str and field in INTERNED_FIELDS:
+            return self.intern(value)
+        return value
+
+    @staticmethod
+    def thaw(value):
+        """Convert a stored value back to the form it's read in."""
+        if isinstance(value, _FrozenDict):
+            return dict(zip(value[0], [CompactEntries.thaw(v) for v in value[1:]]))
+        if isinstance(value, tuple):
+            return [CompactEntries.thaw(v) for v in value]
+        if isinstance(value, _PackedInts):
+            packed = array('H')
+            packed.frombytes(value)
+            return packed.tolist()
+        return value
+
+    @staticmethod
+    def encode_key(key):
+        # Hex digests take half the space as bytes. Others are kept as is;
+        #   bytearray.fromhex skips whitespace, so only hex digits are decoded.
+        if len(key) % 2 == 0 and _HEX_KEY.match(key):
+            return bytes(bytearray.fromhex(key))
+        return key
+
+    @staticmethod
+    def decode_key(key):
+        if isinstance(key, bytes):
+            return binascii.hexlify(key).decode('ascii')
+        return key
+
+    def __setitem__(self, key, entry):
+        sources = None
+        if "sources" in entry:
+            sources = []
+            for path, metadata in (entry["sources"] or {}).items():
+                # Keep the separator with the prefix, so joining is exact.
+                directory, separator, name = path.rpartition('/')
+                sources.extend((self.intern(directory + separator), name, self.freeze(metadata)))
+            sources = tuple(sources)
+
+        target = entry.get("target")
+        if target is not None:
+            target = self.freeze(target)
+
+        other = dict((k, v) for k, v in entry.items() if k not in ("sources", "target"))
+        key = self.encode_key(key)
+        if self.changed is not None:
+            self.changed.add(key)
+        self.records[key] = _Entry(
+            sources,
+            target,
+            self.freeze(other) if other else None
+        )
+
+    def __getitem__(self, key):
+        record = self.records[self.encode_key(key)]
+        entry = {}
+        if record.sources is not None:
+            sources = record.sources
+            entry["sources"] = dict(
+                (sources[i] + sources[i + 1], self.thaw(sources[i + 2]))
+                for i in range(0, len(sources), 3)
+            )
+        if record.target is not None:
+            entry["target"] = self.thaw(record.target)
+        if record.other is not None:
+            entry.update(self.thaw(record.other))
+        return entry
+
+    def __delitem__(self, key):
+        key = self.encode_key(key)
+        del self.records[key]
+        if self.changed is not None:
+            self.changed.add(key)
+
+    def __contains__(self, key):
+        return self.encode_key(key) in self.records
+
+    def __iter__(self):
+        return (self.decode_key(key) for key in self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __repr__(self):
+        return 'CompactEntries({!r})'.format(dict(self.items()))
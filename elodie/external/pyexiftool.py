@@ -192,6 +192,13 @@ class ExifTool(object):
 
        A Boolean value indicating whether this instance is currently
        associated with a running subprocess.
+
+    .. py:attribute:: bytes_read
+
+       The number of bytes the subprocess has read from storage so far,
+       if ``bytes_read_available`` is True.  Files served from the page
+       cache aren't counted, so this can be lower than the size of the
+       files read.
     """
 
     def __init__(self, executable_=None, addedargs=None):
@@ -210,6 +217,8 @@ class ExifTool(object):
         
         self.running = False
         self.waiting_time = 0
+        self.bytes_read = 0
+        self.bytes_read_available = False
 
     def start(self):
         """Start an ``exiftool`` process in batch mode for this instance.
@@ -287,9 +296,29 @@ class ExifTool(object):
         result = output.strip()[:-len(sentinel)]
         waiting_time = (time.time() - start_time)
         self.waiting_time += waiting_time
+        self._update_bytes_read()
         log.debug("[ ] Reading metadata took {} s".format(waiting_time))
         return result
 
+    def _update_bytes_read(self):
+        """Update :py:attr:`bytes_read` from the kernel's I/O counters.
+
+        The counter is ``read_bytes``, the bytes the ``exiftool`` process
+        caused to be fetched from storage.  Unlike ``rchar`` it doesn't
+        count the commands we write to it through the pipe, but reads
+        served from the page cache aren't counted either.  It's only
+        available on systems with ``/proc/<pid>/io`` (Linux).
+        """
+        try:
+            with open('/proc/{}/io'.format(self._process.pid)) as f:
+                for line in f:
+                    if line.startswith('read_bytes:'):
+                        self.bytes_read = int(line.split()[1])
+                        self.bytes_read_available = True
+                        return
+        except (IOError, OSError, ValueError):
+            pass
+
     def execute_json(self, *params):
         """Execute the given batch of parameters and parse the JSON output.
 
@@ -322,6 +351,97 @@ class ExifTool(object):
         except UnicodeDecodeError as e:
             return json.loads(self.execute(b"-j", *params).decode("latin-1"))
 
+    def iter_execute_json(self, *params):
+        """Execute the given batch of parameters and yield JSON records.
+
+        This method is similar to :py:meth:`execute_json()`, but each
+        record is parsed and yielded as soon as ``exiftool`` has written
+        it, instead of after the whole batch has finished. The output is
+        decoded as utf-8, with undecodable bytes kept as surrogates so
+        file names round trip through :py:func:`os.fsencode`.
+
+        If the generator is closed before the last record, the rest of
+        the batch's output is read and discarded, so it isn't taken for
+        the output of the next command.
+        """
+        start_time = time.time()
+        if not self.running:
+            raise ValueError("ExifTool instance not running.")
+        params = tuple(map(fsencode, params))
+        self._process.stdin.write(b"\n".join((b"-j",) + params + (b"-execute\n",)))
+        self._process.stdin.flush()
+
+        decoder = codecs.getincrementaldecoder("utf-8")("surrogateescape")
+        json_decoder = json.JSONDecoder()
+        fd = self._process.stdout.fileno()
+        text = ""
+        finished = False
+        try:
+            while True:
+                chunk = os.read(fd, block_size)
+                if not chunk:
+                    finished = True
+                    raise ValueError("ExifTool instance exited unexpectedly.")
+                text += decoder.decode(chunk)
+
+                position = 0
+                while True:
+                    # Skip the array delimiters between records.
+                    while position < len(text) and text[position] in "[],\r\n\t ":
+                        position += 1
+                    if text.startswith("{ready}", position):
+                        finished = True
+                        waiting_time = (time.time() - start_time)
+                        self.waiting_time += waiting_time
+                        self._update_bytes_read()
+                        log.debug("[ ] Reading metadata took {} s".format(waiting_time))
+                        return
+                    if position < len(text) and text[position] != "{":
+                        # Not JSON (i.e. a message from exiftool); skip the line.
+                        newline = text.find("\n", position)
+                        if newline == -1:
+                            break
+                        position = newline + 1
+                        continue
+                    try:
+                        record, position = json_decoder.raw_decode(text, position)
+                    except ValueError:
+                        # The record hasn't been completely written yet.
+                        break
+                    yield record
+                text = text[position:]
+        finally:
+            if not finished:
+                self._discard_output(text.encode("utf-8", "surrogateescape"))
+
+    def _discard_output(self, output=b""):
+        """Read and discard output up to the end-of-output sentinel.
+
+        :param bytes output: The output already read but not yet used.
+        """
+        fd = self._process.stdout.fileno()
+        while not output[-32:].strip().endswith(sentinel):
+            chunk = os.read(fd, block_size)
+            if not chunk:
+                return
+            output = output[-32:] + chunk
+
+    def iter_metadata_directory(self, directory, extensions):
+        """Recursively yield meta-data for the files in a directory.
+
+        ``exiftool`` walks the directory itself (including hidden
+        directories) and only reads files with one of the given
+        extensions, so no file list has to be built or sent to it.
+
+        The records have the format described in the documentation of
+        :py:meth:`execute_json()`.
+        """
+        params = ["-q", "-r."]
+        for extension in sorted(extensions):
+            params.extend(["-ext", extension])
+        params.append(directory)
+        return self.iter_execute_json(*params)
+
     def get_metadata_batch(self, filenames):
         """Return all meta-data for the given files.
 
@@ -6,41 +6,28 @@ General file system methods.
 from __future__ import print_function
 from builtins import object
 
-import hashlib
 import os
 import re
 import shutil
 import time
 
 from elodie import compatability
+from elodie import constants
+from elodie import hashing
 # from elodie import geolocation
 from elodie import log
 # from elodie.config import load_config
-from elodie.manifest import Manifest
 from elodie.media.base import Base, get_all_subclasses
 
 
-# For some reason, this was an instance method on Db/manifest.
-# TODO: should be a utility or class method somewhere.
-def checksum(file_path, blocksize=65536):
-    """Create a hash value for the given file.
+def get_mtime_ns(stat):
+    """Get the modification time of a stat result in nanoseconds.
 
-    See http://stackoverflow.com/a/3431835/1318758.
-
-    :param str file_path: Path to the file to create a hash for.
-    :param int blocksize: Read blocks of this size from the file when
-        creating the hash.
-    :returns: str or None
+    :returns: int
     """
-    hasher = hashlib.sha256()
-    with open(file_path, 'rb') as f:
-        buf = f.read(blocksize)
-
-        while len(buf) > 0:
-            hasher.update(buf)
-            buf = f.read(blocksize)
-        return hasher.hexdigest()
-    return None
+    if hasattr(stat, 'st_mtime_ns'):
+        return stat.st_mtime_ns
+    return int(stat.st_mtime * 1000000000)
 
 
 class FileSystem(object):
@@ -54,7 +41,10 @@ class FileSystem(object):
             'full_path': '%date/'
         }
         self.cached_folder_path_definition = None
+        self.cached_folder_path_pattern = None
         self.default_parts = ['album', 'city', 'state', 'country', 'origin']
+        # Parts named after where a photo was taken, see elodie.geolocation.
+        self.place_parts = ['location', 'city', 'state', 'country']
 
     def create_directory(self, directory_path):
         """Create a directory if it does not already exist.
@@ -102,10 +92,7 @@ class FileSystem(object):
         """
         # If extensions is None then we get all supported extensions
         if not extensions:
-            extensions = set()
-            subclasses = get_all_subclasses(Base)
-            for cls in subclasses:
-                extensions.update(cls.extensions)
+            extensions = self.get_valid_extensions()
 
         for dirname, dirnames, filenames in os.walk(path):
             for filename in filenames:
@@ -118,6 +105,17 @@ class FileSystem(object):
                 else:
                     yield os.path.join(dirname, filename)
 
+    def get_valid_extensions(self):
+        """Get the file extensions supported by any of the media classes.
+
+        :returns: set(str)
+        """
+        extensions = set()
+        subclasses = get_all_subclasses(Base)
+        for cls in subclasses:
+            extensions.update(cls.extensions)
+        return extensions
+
     def get_current_directory(self):
         """Get the current working directory.
 
@@ -207,7 +205,7 @@ class FileSystem(object):
         # If we've done this already then return it immediately without
         # incurring any extra work
         # TODO: This needs to be adapted for multiple targets
-        if self.cached_folder_path_definition is not None:
+        if self.cached_folder_path_definition is not None and self.cached_folder_path_pattern == pattern:
             return self.cached_folder_path_definition
 
         # If Directory is in the config we assume full_path and its
@@ -229,6 +227,7 @@ class FileSystem(object):
             # return self.default_folder_path_definition
 
         self.cached_folder_path_definition = []
+        self.cached_folder_path_pattern = pattern
         for part in path_parts:
             part = part.replace('%', '')
             # if part in config_directory:
@@ -249,6 +248,15 @@ class FileSystem(object):
 
         return self.cached_folder_path_definition
 
+    def uses_places(self, target_config):
+        """Check whether a target's folders are named after places, so the
+        place names of the files imported to it have to be looked up.
+
+        :returns: bool
+        """
+        path_parts = self.get_folder_path_definition(target_config["file_path_pattern"])
+        return any(part in self.place_parts for path_part in path_parts for part, mask in path_part)
+
     def get_folder_path(self, metadata, target_config):
         """Given a media's metadata this function returns the folder path as a string.
 
@@ -283,20 +291,29 @@ class FileSystem(object):
                     if metadata[part]:
                         path.append(metadata[part])
                         break
+                elif part in self.place_parts:
+                    place = metadata.get('place') or {}
+                    name = place.get('default' if part == 'location' else part)
+                    if name:
+                        path.append(name)
+                        break
                 elif part.startswith('"') and part.endswith('"'):
                     path.append(part[1:-1])
 
         return os.path.join(*path)
 
-    def generate_manifest(self, file_path, target_config, metadata_dict, media):
+    def generate_manifest(self, file_path, target_config, metadata_dict, media, place=None):
         metadata = media.get_metadata(metadata_dict)
+        if metadata is not None and place is not None:
+            metadata['place'] = place
         metadata_entry = {
             "sources": {
                 file_path: {}
             },
             "target": {
                 "path": self.get_folder_path(metadata, target_config),
-                "name": self.get_file_name(metadata, target_config)
+                "name": self.get_file_name(metadata, target_config),
+                "size": os.path.getsize(file_path)
             },
         }
 
@@ -310,8 +327,32 @@ class FileSystem(object):
 
         return metadata_entry
 
-    # TODO: check that the file found at destination has the expected checksum
-    def execute_manifest(self, source_path, manifest_entry, base_path, move_not_copy=False):
+    def execute_manifest(self, source_path, manifest_entry, base_path, move_not_copy=False, algorithm=None,
+                         recorded_target=None, paranoid=False, checksum=None, tree_chunk_size=None):
+        """Copy or move a file to the target described by its manifest entry.
+
+        Once the file is in place, its size, mtime_ns and digest are stored
+        in the entry's target. If the destination already exists and still
+        has the size and mtime_ns recorded in ``recorded_target``, it is
+        trusted to hold the content of the digest recorded with them and
+        isn't read again. Otherwise, or when ``paranoid`` is set, the
+        destination is hashed to compare it with the source.
+
+        :param str source_path: The file to import.
+        :param dict manifest_entry: The file's manifest entry.
+        :param str base_path: Base path of the target.
+        :param bool move_not_copy: Move instead of copying.
+        :param str algorithm: Hash algorithm to compare files with.
+        :param dict recorded_target: The target recorded in the manifest for
+            the destination, if any. Without a ``checksum`` of its own, it's
+            the target of the source's entry.
+        :param bool paranoid: Never trust recorded target state.
+        :param str checksum: Digest of the source, if it's already known.
+        :param int tree_chunk_size: Chunk size if digests are tree hashes.
+        :returns: bool
+        """
+        if algorithm is None:
+            algorithm = constants.hash_algorithm
         if move_not_copy:
           manipulate_file = shutil.move
           manipulation = "moved"
@@ -325,8 +366,18 @@ class FileSystem(object):
         destination = os.path.join(base_path, target_manifest["path"], target_manifest["name"])
         # If there's already a file there...
         if os.path.isfile(destination):
+            trusted = not paranoid and self.is_target_unchanged(destination, target_manifest, recorded_target)
+            recorded_checksum = recorded_target.get("checksum") if trusted else None
+            if checksum is None and not (trusted and recorded_checksum is None):
+                checksum = hashing.digest(source_path, algorithm, tree_chunk_size)[0]
             # Check that it's the same file. situations: a) edited but kept same name, b) corrupted
-            if checksum(destination) == checksum(source_path):
+            if trusted:
+                log.debug("[ ] File {} already exists at {} and is unchanged since it was written".format(
+                    source_path, destination))
+                same = recorded_checksum in (None, checksum)
+            else:
+                same = hashing.digest(destination, algorithm, tree_chunk_size)[0] == checksum
+            if same:
                 if os.path.getmtime(destination) == os.path.getmtime(source_path):
                     log.debug("[ ] File {} already exists at {} and is intact, with metadata; skipping".format(source_path, destination))
                 else:
@@ -336,9 +387,10 @@ class FileSystem(object):
                         ))
                     self.create_directory(os.path.join(base_path, target_manifest["path"]))
                     manipulate_file(source_path, destination)
+                self.record_target_state(destination, target_manifest, checksum)
             else:
                 target_name, target_ext = os.path.splitext(target_manifest["name"])
-                target_name_with_hash = ''.join([target_name, '.', checksum(source_path), target_ext])
+                target_name_with_hash = ''.join([target_name, '.', checksum, target_ext])
                 destination_name_with_hash = os.path.join(base_path, target_manifest["path"], target_name_with_hash)
                 manipulate_file(source_path, destination_name_with_hash)
                 log.debug("[ ] File {} already exists at {} but is corrupt or edited; copying with hash: {}".format(
@@ -352,6 +404,7 @@ class FileSystem(object):
                 if os.path.isfile(source_path):
                     self.create_directory(os.path.join(base_path, target_manifest["path"]))
                     manipulate_file(source_path, destination)
+                    self.record_target_state(destination, target_manifest, checksum)
                     log.debug("[*] File {} {} to {}".format(source_path, manipulation, destination))
                     return True
                 else:
@@ -360,6 +413,40 @@ class FileSystem(object):
                 log.warn("[!] Exception moving/copying {} to {}: {}".format(source_path, destination, e))
                 return False
 
+    def is_target_unchanged(self, destination, target_manifest, recorded_target):
+        """Check a destination against the state recorded when it was written.
+
+        :param str destination: Path of the file in the target.
+        :param dict target_manifest: The target the file is imported to.
+        :param dict recorded_target: The target recorded in the manifest.
+        :returns: bool
+        """
+        if not recorded_target or "mtime_ns" not in recorded_target:
+            return False
+        # The recorded state is only about the file at the same name.
+        if (recorded_target.get("path"), recorded_target.get("name")) != \
+                (target_manifest["path"], target_manifest["name"]):
+            return False
+        stat = os.stat(destination)
+        return stat.st_size == recorded_target.get("size") and \
+            get_mtime_ns(stat) == recorded_target["mtime_ns"]
+
+    def record_target_state(self, destination, target_manifest, checksum=None):
+        """Store the size, mtime_ns and digest of a file written to the
+        target.
+
+        :param str destination: Path of the file in the target.
+        :param dict target_manifest: The target record to update.
+        :param str checksum: Digest of the file, if it's known.
+        """
+        stat = os.stat(destination)
+        target_manifest["size"] = stat.st_size
+        target_manifest["mtime_ns"] = get_mtime_ns(stat)
+        if checksum is not None:
+            target_manifest["checksum"] = checksum
+        else:
+            target_manifest.pop("checksum", None)
+
     def process_file(self, _file, destination, media, manifest, **kwargs):
         move = False
         if('move' in kwargs):
@@ -425,8 +512,7 @@ class FileSystem(object):
             compatability._copyfile(_file, dest_path)
             self.set_utime_from_metadata(media.get_metadata(), dest_path)
 
-        db.add_hash(checksum, dest_path)
-        db.update_hash_db()
+        db.add_hash(checksum, dest_path, True)
 
         return dest_path
 
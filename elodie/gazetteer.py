@@ -0,0 +1,291 @@
+"""
+Offline reverse geocoding from a local gazetteer.
+
+The gazetteer is a GeoNames ``cities`` dump, e.g. ``cities1000.txt`` from
+https://download.geonames.org/export/dump/. State and country names are
+read from ``admin1CodesASCII.txt`` and ``countryInfo.txt`` if they're next
+to it, otherwise the codes are used.
+
+Coordinates are kept in flat arrays and indexed by a grid of cells sorted
+into a single array, so a lookup only looks at the places in the cells
+around the coordinates.
+"""
+from __future__ import division
+from builtins import object
+from builtins import range
+
+import io
+import math
+import os
+from array import array
+
+from elodie import constants
+
+#: Mean radius of the earth in kilometers.
+EARTH_RADIUS = 6371.0088
+
+#: Size of the cells of the grid index in degrees.
+CELL_SIZE = 0.5
+
+#: Columns of a GeoNames dump.
+NAME_COLUMN = 1
+LATITUDE_COLUMN = 4
+LONGITUDE_COLUMN = 5
+COUNTRY_COLUMN = 8
+ADMIN1_COLUMN = 10
+
+
+class Gazetteer(object):
+
+    """A set of named places, indexed for nearest place lookups.
+
+    :param float cell_size: Size of the cells of the grid index in degrees.
+    """
+
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.rows = int(math.ceil(180 / cell_size))
+        self.columns = int(math.ceil(360 / cell_size))
+        self.latitudes = array('d')
+        self.longitudes = array('d')
+        self.cities = []
+        # Indices into self.names, which holds each state and country once.
+        self.states = array('i')
+        self.countries = array('i')
+        self.names = []
+        self.name_ids = {}
+        # Place indices sorted by cell, and the offset in it of every cell.
+        self.order = array('i')
+        self.offsets = array('i')
+
+    def __len__(self):
+        return len(self.latitudes)
+
+    def load(self, file_path, admin1_path=None, country_path=None):
+        """Load places from a GeoNames dump and build the index.
+
+        :param str file_path: Path to the cities file.
+        :param str admin1_path: Path to ``admin1CodesASCII.txt``, defaults to
+            the one next to the cities file if it exists.
+        :param str country_path: Path to ``countryInfo.txt``, defaults to the
+            one next to the cities file if it exists.
+        :returns: Gazetteer
+        """
+        directory = os.path.dirname(os.path.abspath(file_path))
+        if admin1_path is None:
+            admin1_path = os.path.join(directory, 'admin1CodesASCII.txt')
+        if country_path is None:
+            country_path = os.path.join(directory, 'countryInfo.txt')
+        # admin1CodesASCII.txt is keyed on "<country>.<admin1>".
+        states = read_names(admin1_path, 0, 1)
+        countries = read_names(country_path, 0, 4)
+
+        with io.open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('#'):
+                    continue
+                columns = line.rstrip('\n').split('\t')
+                if len(columns) <= ADMIN1_COLUMN:
+                    continue
+                try:
+                    latitude = float(columns[LATITUDE_COLUMN])
+                    longitude = float(columns[LONGITUDE_COLUMN])
+                except ValueError:
+                    continue
+                country_code = columns[COUNTRY_COLUMN]
+                admin1_code = '{}.{}'.format(country_code, columns[ADMIN1_COLUMN])
+                self.add(
+                    latitude,
+                    longitude,
+                    columns[NAME_COLUMN],
+                    states.get(admin1_code, columns[ADMIN1_COLUMN]),
+                    countries.get(country_code, country_code)
+                )
+
+        self.build_index()
+        return self
+
+    def add(self, latitude, longitude, city, state=None, country=None):
+        """Add a place. :meth:`build_index` has to be called afterwards.
+
+        :param float latitude: Latitude in degrees.
+        :param float longitude: Longitude in degrees.
+        :param str city: Name of the place.
+        :param str state: Name of the state, province or region.
+        :param str country: Name of the country.
+        """
+        self.latitudes.append(latitude)
+        self.longitudes.append(longitude)
+        self.cities.append(city)
+        self.states.append(self.get_name_id(state))
+        self.countries.append(self.get_name_id(country))
+
+    def get_name_id(self, name):
+        if not name:
+            return -1
+        if name not in self.name_ids:
+            self.name_ids[name] = len(self.names)
+            self.names.append(name)
+        return self.name_ids[name]
+
+    def get_cell(self, latitude, longitude):
+        row = min(int((latitude + 90) // self.cell_size), self.rows - 1)
+        column = int((longitude + 180) // self.cell_size) % self.columns
+        return (max(row, 0), column)
+
+    def build_index(self):
+        """Sort the places into the grid index."""
+        cells = [
+            row * self.columns + column
+            for row, column in (
+                self.get_cell(latitude, longitude)
+                for latitude, longitude in zip(self.latitudes, self.longitudes)
+            )
+        ]
+        counts = array('i', [0]) * (self.rows * self.columns + 1)
+        for cell in cells:
+            counts[cell + 1] += 1
+        for cell in range(1, len(counts)):
+            counts[cell] += counts[cell - 1]
+        self.offsets = counts
+
+        order = array('i', [0]) * len(cells)
+        position = array('i', counts[:-1])
+        for index, cell in enumerate(cells):
+            order[position[cell]] = index
+            position[cell] += 1
+        self.order = order
+
+    def nearest(self, latitude, longitude, max_distance=None):
+        """Find the place nearest to coordinates.
+
+        Rings of cells around the coordinates' cell are searched until no
+        unsearched cell can hold a nearer place.
+
+        :param float latitude: Latitude in degrees.
+        :param float longitude: Longitude in degrees.
+        :param float max_distance: Kilometers beyond which places don't
+            count, defaults to ``constants.gazetteer_max_distance``.
+        :returns: tuple(int, float) of the place's index and its distance
+            in kilometers, or None.
+        """
+        if max_distance is None:
+            max_distance = constants.gazetteer_max_distance
+        if len(self) == 0:
+            return None
+
+        # Distances are compared on an equirectangular projection around
+        #   the coordinates, in degrees of latitude.
+        scale = max(math.cos(math.radians(latitude)), 0.01)
+        max_degrees = math.degrees(max_distance / EARTH_RADIUS)
+        max_rings = int(min(
+            math.ceil(max_degrees / (self.cell_size * scale)),
+            max(self.rows, self.columns)
+        )) + 1
+
+        row, column = self.get_cell(latitude, longitude)
+        best = None
+        best_distance = max_degrees ** 2
+        for ring in range(max_rings + 1):
+            for cell in self._ring(row, column, ring):
+                for position in range(self.offsets[cell], self.offsets[cell + 1]):
+                    index = self.order[position]
+                    d_latitude = self.latitudes[index] - latitude
+                    d_longitude = (self.longitudes[index] - longitude + 180) % 360 - 180
+                    distance = d_latitude ** 2 + (d_longitude * scale) ** 2
+                    if distance < best_distance:
+                        best = index
+                        best_distance = distance
+            # Places beyond this ring are at least this far away.
+            if best is not None and best_distance <= (ring * self.cell_size * scale) ** 2:
+                break
+
+        if best is None:
+            return None
+        distance = haversine(latitude, longitude, self.latitudes[best], self.longitudes[best])
+        if distance > max_distance:
+            return None
+        return (best, distance)
+
+    def _ring(self, row, column, ring):
+        if ring == 0:
+            return [row * self.columns + column]
+        cells = set()
+        span = min(ring, self.columns // 2)
+        for r in range(row - ring, row + ring + 1):
+            if r < 0 or r >= self.rows:
+                continue
+            if abs(r - row) == ring:
+                columns = range(column - span, column + span + 1)
+            elif ring <= self.columns // 2:
+                columns = (column - ring, column + ring)
+            else:
+                continue
+            for c in columns:
+                cells.add(r * self.columns + c % self.columns)
+        return cells
+
+    def place_name(self, latitude, longitude, max_distance=None):
+        """Get the name of the place nearest to coordinates.
+
+        :param float latitude: Latitude in degrees.
+        :param float longitude: Longitude in degrees.
+        :param float max_distance: Kilometers beyond which places don't
+            count.
+        :returns: dict with ``city``, ``state``, ``country`` and ``default``
+            keys in the format of :func:`elodie.geolocation.place_name`, or
+            None if there's no place near enough.
+        """
+        result = self.nearest(latitude, longitude, max_distance)
+        if result is None:
+            return None
+
+        index = result[0]
+        place = {}
+        for key, name in (
+            ('city', self.cities[index]),
+            ('state', self._get_name(self.states[index])),
+            ('country', self._get_name(self.countries[index])),
+        ):
+            if name:
+                place[key] = name
+                if 'default' not in place:
+                    place['default'] = name
+        return place
+
+    def _get_name(self, name_id):
+        if name_id < 0:
+            return None
+        return self.names[name_id]
+
+
+def haversine(latitude_a, longitude_a, latitude_b, longitude_b):
+    """Get the great circle distance between two coordinates.
+
+    :returns: float kilometers
+    """
+    latitude_a, longitude_a, latitude_b, longitude_b = map(
+        math.radians, (latitude_a, longitude_a, latitude_b, longitude_b)
+    )
+    a = math.sin((latitude_b - latitude_a) / 2) ** 2 + \
+        math.cos(latitude_a) * math.cos(latitude_b) * \
+        math.sin((longitude_b - longitude_a) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1, math.sqrt(a)))
+
+
+def read_names(file_path, key_column, name_column):
+    """Read a tab separated GeoNames code list.
+
+    :returns: dict of code to name, empty if the file doesn't exist.
+    """
+    names = {}
+    if not os.path.isfile(file_path):
+        return names
+    with io.open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('#'):
+                continue
+            columns = line.rstrip('\n').split('\t')
+            if len(columns) > max(key_column, name_column):
+                names[columns[key_column]] = columns[name_column]
+    return names
@@ -0,0 +1,133 @@
+"""
+Client for the MapQuest geocoding API, or any server which answers the same
+requests.
+
+Coordinates are rounded to ``constants.geocoding_precision`` decimal places
+before they're looked up, so photos taken a few meters apart share a
+lookup, and a batch only looks up each rounded coordinate once. Lookups in
+a batch run on a bounded number of threads which share one pooled
+``requests.Session``, so connections are reused between lookups.
+"""
+from builtins import object
+
+from multiprocessing.pool import ThreadPool
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from elodie import constants
+from elodie import log
+
+#: Path of forward lookups, from a location name to coordinates.
+SEARCH_PATH = '/geocoding/v1/address'
+
+#: Path of reverse lookups, from coordinates to an address.
+REVERSE_PATH = '/nominatim/v1/reverse.php'
+
+
+class GeocodingClient(object):
+
+    """Look up locations through a geocoding API.
+
+    :param str key: The API key.
+    :param str url: Base URL of the API, defaults to
+        ``constants.geocoding_url``.
+    :param int precision: Decimal places coordinates are rounded to,
+        defaults to ``constants.geocoding_precision``.
+    :param int workers: Number of lookups to run at once, defaults to
+        ``constants.geocoding_workers``.
+    """
+
+    def __init__(self, key, url=None, precision=None, workers=None):
+        if url is None:
+            url = constants.geocoding_url
+        if precision is None:
+            precision = constants.geocoding_precision
+        if workers is None:
+            workers = constants.geocoding_workers
+        self.key = key
+        self.url = url.rstrip('/')
+        self.precision = precision
+        self.workers = workers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.request_count = 0
+
+    def quantize(self, lat, lon):
+        """Round coordinates to the precision lookups are made at.
+
+        :returns: tuple(float, float)
+        """
+        return (round(float(lat), self.precision), round(float(lon), self.precision))
+
+    def request(self, path, params):
+        """Send a request to the API.
+
+        :param str path: Path below the base URL.
+        :param dict params: Query parameters, besides the format and key.
+        :returns: dict of the decoded JSON response, or None on errors.
+        """
+        query = {'format': 'json', 'key': self.key}
+        query.update(params)
+        self.request_count += 1
+        try:
+            r = self.session.get(
+                '{}{}'.format(self.url, path),
+                params=query,
+                headers={'Accept-Language': constants.accepted_language},
+                timeout=constants.geocoding_timeout
+            )
+        except requests.exceptions.RequestException as e:
+            log.error(str(e))
+            return None
+        try:
+            return r.json()
+        except ValueError as e:
+            log.error(r.text)
+            log.error(str(e))
+            return None
+
+    def search(self, location):
+        """Look up the coordinates of a location name.
+
+        :param str location:
+        :returns: dict or None
+        """
+        return self.request(SEARCH_PATH, {'location': location})
+
+    def reverse(self, lat, lon):
+        """Look up the address at coordinates.
+
+        :param float lat:
+        :param float lon:
+        :returns: dict or None
+        """
+        lat, lon = self.quantize(lat, lon)
+        return self.request(REVERSE_PATH, {'lat': lat, 'lon': lon})
+
+    def reverse_batch(self, coordinates):
+        """Look up the addresses at many coordinates.
+
+        Coordinates which round to the same value are looked up once.
+
+        :param list coordinates: tuples of (lat, lon).
+        :returns: list of dict or None, in the order of ``coordinates``.
+        """
+        quantized = [self.quantize(lat, lon) for lat, lon in coordinates]
+        unique = list(set(quantized))
+        if len(unique) <= 1 or self.workers <= 1:
+            results = [self.reverse(lat, lon) for lat, lon in unique]
+        else:
+            pool = ThreadPool(min(self.workers, len(unique)))
+            try:
+                results = pool.map(lambda c: self.reverse(*c), unique)
+            finally:
+                pool.close()
+                pool.join()
+        by_coordinates = dict(zip(unique, results))
+        return [by_coordinates[c] for c in quantized]
+
+    def close(self):
+        self.session.close()
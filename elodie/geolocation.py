@@ -6,26 +6,54 @@ from past.utils import old_div
 
 standard_library.install_aliases()  # noqa
 
+import atexit
 from os import path
 
-import requests
-import urllib.request
-import urllib.parse
-import urllib.error
-
 from elodie.config import load_config
 from elodie import constants
 from elodie import log
-from elodie.manifest import Manifest
+from elodie.gazetteer import Gazetteer
+from elodie.geocoding import GeocodingClient
+from elodie.location import LocationCache
 
 __KEY__ = None
+__CLIENT__ = None
+__GAZETTEER__ = None
+__GAZETTEER_MISSING__ = None
+__LOCATION_CACHE__ = None
 __DEFAULT_LOCATION__ = 'Unknown Location'
 
 
+def get_location_cache():
+    """Get the location cache, loading it on first use.
+
+    The cache is shared by every lookup in the process. It's loaded again if
+    ``constants.location_db`` points somewhere else, or if another process
+    changed it while this one has nothing unsaved.
+
+    :returns: :class:`~elodie.location.LocationCache`
+    """
+    global __LOCATION_CACHE__
+    if(
+        __LOCATION_CACHE__ is None or
+        __LOCATION_CACHE__.file_path != constants.location_db or
+        (__LOCATION_CACHE__.unsaved == 0 and __LOCATION_CACHE__.is_stale())
+    ):
+        flush_location_cache()
+        __LOCATION_CACHE__ = LocationCache().load()
+    return __LOCATION_CACHE__
+
+
+@atexit.register
+def flush_location_cache():
+    """Write places added to the location cache which weren't written yet."""
+    if(__LOCATION_CACHE__ is not None and __LOCATION_CACHE__.unsaved > 0):
+        __LOCATION_CACHE__.write()
+
+
 def coordinates_by_name(name):
     # Try to get cached location first
-    db = Manifest()
-    cached_coordinates = db.get_location_coordinates(name)
+    cached_coordinates = get_location_cache().get_coordinates(name)
     if(cached_coordinates is not None):
         return {
             'latitude': cached_coordinates[0],
@@ -103,10 +131,6 @@ def get_key():
     if __KEY__ is not None:
         return __KEY__
 
-    config_file = '%s/config.ini' % constants.application_directory
-    if not path.exists(config_file):
-        return None
-
     config = load_config()
     if('MapQuest' not in config):
         return None
@@ -115,28 +139,161 @@ def get_key():
     return __KEY__
 
 
+def is_gazetteer_selected():
+    """Check whether the config selects the offline gazetteer, in which case
+    places aren't looked up online.
+
+    :returns: bool
+    """
+    config = load_config()
+    if('Geolocation' not in config):
+        return False
+    return config['Geolocation'].get('provider', 'mapquest').lower() == 'gazetteer'
+
+
+def get_gazetteer():
+    """Load the offline gazetteer if the config selects it.
+
+    Set ``provider=gazetteer`` and ``gazetteer`` to the path of a GeoNames
+    cities file in the ``[Geolocation]`` section of config.ini.
+
+    :returns: :class:`~elodie.gazetteer.Gazetteer` or None
+    """
+    global __GAZETTEER__, __GAZETTEER_MISSING__
+    if __GAZETTEER__ is not None:
+        return __GAZETTEER__
+
+    if(not is_gazetteer_selected()):
+        return None
+
+    section = load_config()['Geolocation']
+    gazetteer_path = section.get('gazetteer')
+    if(gazetteer_path is None or not path.exists(gazetteer_path)):
+        # Only reported once, rather than for every photo.
+        if(__GAZETTEER_MISSING__ != gazetteer_path):
+            __GAZETTEER_MISSING__ = gazetteer_path
+            log.error('Gazetteer file {} not found'.format(gazetteer_path))
+        return None
+
+    __GAZETTEER__ = Gazetteer().load(
+        gazetteer_path,
+        section.get('admin1_codes'),
+        section.get('country_info')
+    )
+    return __GAZETTEER__
+
+
+def get_client():
+    """Get the geocoding client, creating it on first use.
+
+    The API's URL and the precision coordinates are looked up at can be set
+    with ``url`` and ``precision`` in the ``[Geolocation]`` section of
+    config.ini.
+
+    :returns: :class:`~elodie.geocoding.GeocodingClient` or None if there's
+        no API key.
+    """
+    global __CLIENT__
+    key = get_key()
+    if(key is None):
+        return None
+
+    if(__CLIENT__ is None or __CLIENT__.key != key):
+        config = load_config()
+        section = config['Geolocation'] if 'Geolocation' in config else {}
+        precision = section.get('precision')
+        __CLIENT__ = GeocodingClient(
+            key,
+            url=section.get('url'),
+            precision=int(precision) if precision else None
+        )
+    return __CLIENT__
+
+
 def place_name(lat, lon):
-    lookup_place_name_default = {'default': __DEFAULT_LOCATION__}
-    if(lat is None or lon is None):
-        return lookup_place_name_default
+    return place_names([(lat, lon)])[0]
 
-    # Convert lat/lon to floats
-    if(not isinstance(lat, float)):
-        lat = float(lat)
-    if(not isinstance(lon, float)):
-        lon = float(lon)
 
-    # Try to get cached location first
-    db = Manifest()
-    # 3km distace radious for a match
-    cached_place_name = db.get_location_name(lat, lon, 3000)
-    # We check that it's a dict to coerce an upgrade of the location
-    #  db from a string location to a dictionary. See gh-160.
-    if(isinstance(cached_place_name, dict)):
-        return cached_place_name
+def place_names(coordinates):
+    """Look up the place names of many coordinates at once.
 
+    Coordinates which aren't cached are looked up in one batch, see
+    :meth:`~elodie.geocoding.GeocodingClient.reverse_batch`.
+
+    :param list coordinates: tuples of (lat, lon).
+    :returns: list of dict, in the order of ``coordinates``.
+    """
+    lookup_place_name_default = {'default': __DEFAULT_LOCATION__}
+    gazetteer = get_gazetteer()
+    db = get_location_cache()
+
+    names = []
+    uncached = []
+    for lat, lon in coordinates:
+        if(lat is None or lon is None):
+            names.append(lookup_place_name_default)
+            continue
+
+        # Convert lat/lon to floats
+        if(not isinstance(lat, float)):
+            lat = float(lat)
+        if(not isinstance(lon, float)):
+            lon = float(lon)
+
+        # The gazetteer is faster than the cache so it isn't cached.
+        if(gazetteer is not None):
+            names.append(
+                gazetteer.place_name(lat, lon) or lookup_place_name_default
+            )
+            continue
+
+        # Try to get cached location first
+        # 3km distace radious for a match
+        cached_place_name = db.get_name(lat, lon, 3000)
+        # We check that it's a dict to coerce an upgrade of the location
+        #  db from a string location to a dictionary. See gh-160.
+        if(isinstance(cached_place_name, dict)):
+            names.append(cached_place_name)
+            continue
+
+        uncached.append((len(names), lat, lon))
+        names.append(lookup_place_name_default)
+
+    # Places aren't looked up online if the gazetteer is selected, even if
+    #   it couldn't be loaded.
+    if(not uncached or is_gazetteer_selected()):
+        return names
+
+    client = get_client()
+    if(client is None):
+        return names
+
+    results = client.reverse_batch([(lat, lon) for i, lat, lon in uncached])
+    cached = set()
+    for (i, lat, lon), geolocation_info in zip(uncached, results):
+        if(geolocation_info is not None):
+            geolocation_info = parse_result(geolocation_info)
+        lookup_place_name = parse_place_name(geolocation_info)
+        if(not lookup_place_name):
+            continue
+
+        names[i] = lookup_place_name
+        # Photos from the same spot share a lookup, so only cache it once.
+        if(client.quantize(lat, lon) not in cached):
+            cached.add(client.quantize(lat, lon))
+            # Written in batches, and on exit by flush_location_cache().
+            db.add(lat, lon, lookup_place_name, write=True)
+
+    return names
+
+
+def parse_place_name(geolocation_info):
+    """Get the city, state and country from a reverse lookup.
+
+    :param dict geolocation_info: The parsed lookup.
+    :returns: dict, empty if the lookup has no address.
+    """
     lookup_place_name = {}
-    geolocation_info = lookup(lat=lat, lon=lon)
     if(geolocation_info is not None and 'address' in geolocation_info):
         address = geolocation_info['address']
         for loc in ['city', 'state', 'country']:
@@ -146,50 +303,24 @@ def place_name(lat, lon):
                 #  set the most specific as the default.
                 if('default' not in lookup_place_name):
                     lookup_place_name['default'] = address[loc]
-
-    if(lookup_place_name):
-        db.add_location(lat, lon, lookup_place_name)
-        # TODO: Maybe this should only be done on exit and not for every write.
-        db.update_location_db()
-
-    if('default' not in lookup_place_name):
-        lookup_place_name = lookup_place_name_default
-
     return lookup_place_name
 
 
 def lookup(**kwargs):
-    if(
-        'location' not in kwargs and
-        'lat' not in kwargs and
-        'lon' not in kwargs
-    ):
+    client = get_client()
+    if(client is None):
         return None
 
-    key = get_key()
-
-    if(key is None):
+    if('lat' in kwargs and 'lon' in kwargs):
+        result = client.reverse(kwargs['lat'], kwargs['lon'])
+    elif('location' in kwargs):
+        result = client.search(kwargs['location'])
+    else:
         return None
 
-    try:
-        params = {'format': 'json', 'key': key}
-        params.update(kwargs)
-        path = '/geocoding/v1/address'
-        if('lat' in kwargs and 'lon' in kwargs):
-            path = '/nominatim/v1/reverse.php'
-        url = 'https://open.mapquestapi.com%s?%s' % (
-                    path,
-                    urllib.parse.urlencode(params)
-              )
-        r = requests.get(url)
-        return parse_result(r.json())
-    except requests.exceptions.RequestException as e:
-        log.error(e)
-        return None
-    except ValueError as e:
-        log.error(r.text)
-        log.error(e)
+    if(result is None):
         return None
+    return parse_result(result)
 
 
 def parse_result(result):
@@ -0,0 +1,331 @@
+"""
+Methods for hashing files. The manifest keys every entry on the digest of
+the file's content, using the algorithm recorded in the manifest.
+
+Files are read into a single reused buffer with ``readinto``, or mapped
+with ``mmap`` when they're large, so streaming a library doesn't allocate
+a new ``bytes`` object per block. Reads are announced to the kernel as
+sequential, and pages are dropped from the cache afterwards so hashing
+terabytes doesn't evict what other processes have cached.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+from multiprocessing.pool import ThreadPool
+
+from elodie import constants
+
+#: Algorithms a manifest can be keyed on.
+ALGORITHMS = ('sha256', 'blake2b')
+
+#: Algorithm of manifests written before the algorithm was recorded.
+LEGACY_ALGORITHM = 'sha256'
+
+#: Size of the blocks small files are read in.
+BLOCK_SIZE = 65536
+
+#: Size of the blocks large files are read in. Larger reads mean fewer
+#: system calls and fewer trips through the GIL.
+LARGE_BLOCK_SIZE = 1024 * 1024
+
+#: Files at least this large are read in :data:`LARGE_BLOCK_SIZE` blocks.
+LARGE_FILE_SIZE = 16 * 1024 * 1024
+
+#: Ranges at least this large are hashed through ``mmap`` if
+#: ``constants.hash_mmap`` is set.
+MMAP_SIZE = 64 * 1024 * 1024
+
+#: Size of the slices of a mapped file passed to the hash in one update.
+MMAP_BLOCK_SIZE = 8 * 1024 * 1024
+
+#: Default chunk size of tree hashes.
+TREE_CHUNK_SIZE = 64 * 1024 * 1024
+
+__TREE_POOL__ = None
+
+
+def new(algorithm):
+    """Create a hash object for an algorithm.
+
+    :param str algorithm: One of :data:`ALGORITHMS`.
+    :returns: hashlib hash object
+    :raises ValueError: If the algorithm isn't supported.
+    """
+    if algorithm not in ALGORITHMS:
+        raise ValueError('Unsupported hash algorithm {}'.format(algorithm))
+    return hashlib.new(algorithm)
+
+
+def get_block_size(size):
+    """Choose the size of the blocks to read a file of a given size in.
+
+    :param int size: Number of bytes to read.
+    :returns: int
+    """
+    if size < BLOCK_SIZE:
+        return max(size, 1)
+    if size < LARGE_FILE_SIZE:
+        return BLOCK_SIZE
+    return LARGE_BLOCK_SIZE
+
+
+def checksum(file_path, algorithm=LEGACY_ALGORITHM, blocksize=None, drop_cache=None):
+    """Create a hash value for the given file.
+
+    See http://stackoverflow.com/a/3431835/1318758.
+
+    :param str file_path: Path to the file to create a hash for.
+    :param str algorithm: One of :data:`ALGORITHMS`.
+    :param int blocksize: Read blocks of this size from the file when
+        creating the hash. Chosen from the file size by default.
+    :param bool drop_cache: Whether to drop the file from the page cache
+        afterwards, defaults to ``constants.hash_drop_cache``.
+    :returns: str or None
+    """
+    digests = checksums(file_path, (algorithm,), blocksize, drop_cache)
+    if digests is None:
+        return None
+    return digests[algorithm]
+
+
+def checksums(file_path, algorithms, blocksize=None, drop_cache=None):
+    """Hash a file with several algorithms while reading it only once.
+
+    :param str file_path: Path to the file to create hashes for.
+    :param tuple algorithms: Names from :data:`ALGORITHMS`.
+    :param int blocksize: Read blocks of this size from the file.
+    :param bool drop_cache: Whether to drop the file from the page cache
+        afterwards.
+    :returns: dict of algorithm to hex digest, or None if the file could not
+        be read.
+    """
+    hashers = [(algorithm, new(algorithm)) for algorithm in algorithms]
+    try:
+        hash_range(file_path, [hasher for algorithm, hasher in hashers],
+                   blocksize=blocksize, drop_cache=drop_cache)
+    except (IOError, OSError, ValueError):
+        return None
+    return dict((algorithm, hasher.hexdigest()) for algorithm, hasher in hashers)
+
+
+def hash_range(file_path, hashers, offset=0, length=None, blocksize=None, drop_cache=None):
+    """Feed a range of a file to one or more hash objects.
+
+    :param str file_path: Path to the file.
+    :param list hashers: hashlib hash objects to update.
+    :param int offset: Offset to start reading at.
+    :param int length: Number of bytes to read, defaults to the rest of the
+        file.
+    :param int blocksize: Read blocks of this size, chosen from the length
+        by default.
+    :param bool drop_cache: Whether to drop the range from the page cache
+        afterwards, defaults to ``constants.hash_drop_cache``.
+    :returns: int number of bytes read
+    :raises IOError: If the file could not be read.
+    """
+    if drop_cache is None:
+        drop_cache = constants.hash_drop_cache
+
+    # Unbuffered, so readinto() reads straight into our buffer.
+    with open(file_path, 'rb', buffering=0) as f:
+        fd = f.fileno()
+        size = os.fstat(fd).st_size
+        end = size if length is None else min(size, offset + length)
+        if end <= offset:
+            return 0
+
+        _advise(fd, offset, end - offset, 'POSIX_FADV_SEQUENTIAL')
+        if constants.hash_mmap and end - offset >= MMAP_SIZE:
+            _hash_mapped(fd, hashers, offset, end)
+        else:
+            if blocksize is None:
+                blocksize = get_block_size(end - offset)
+            buf = memoryview(bytearray(blocksize))
+            f.seek(offset)
+            position = offset
+            while position < end:
+                count = f.readinto(buf[:min(blocksize, end - position)])
+                if not count:
+                    break
+                for hasher in hashers:
+                    hasher.update(buf[:count])
+                position += count
+            end = position
+        if drop_cache:
+            _advise(fd, offset, end - offset, 'POSIX_FADV_DONTNEED')
+    return end - offset
+
+
+def _hash_mapped(fd, hashers, offset, end):
+    # The mapping has to start at a multiple of the allocation granularity.
+    start = offset - offset % mmap.ALLOCATIONGRANULARITY
+    mapped = mmap.mmap(fd, end - start, access=mmap.ACCESS_READ, offset=start)
+    try:
+        if hasattr(mapped, 'madvise'):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        view = memoryview(mapped)
+        try:
+            for position in range(offset - start, end - start, MMAP_BLOCK_SIZE):
+                block = view[position:min(position + MMAP_BLOCK_SIZE, end - start)]
+                for hasher in hashers:
+                    hasher.update(block)
+                block.release()
+        finally:
+            view.release()
+    finally:
+        mapped.close()
+
+
+def _advise(fd, offset, length, advice):
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        os.posix_fadvise(fd, offset, length, getattr(os, advice))
+    except OSError:
+        pass
+
+
+def fingerprint(file_path, algorithm=LEGACY_ALGORITHM, blocksize=BLOCK_SIZE):
+    """Create a cheap fingerprint of a file from its size and its first,
+    middle and last blocks.
+
+    Files with different fingerprints have different content. Files with
+    the same fingerprint may still differ and need a full checksum.
+
+    :param str file_path: Path to the file.
+    :param str algorithm: One of :data:`ALGORITHMS`.
+    :param int blocksize: Size of each of the three blocks.
+    :returns: str or None if the file could not be read.
+    """
+    hasher = new(algorithm)
+    try:
+        with open(file_path, 'rb') as f:
+            f.seek(0, 2)
+            size = f.tell()
+            hasher.update(str(size).encode('ascii'))
+            if size <= 3 * blocksize:
+                f.seek(0)
+                hasher.update(f.read())
+            else:
+                for offset in (0, (size - blocksize) // 2, size - blocksize):
+                    f.seek(offset)
+                    hasher.update(f.read(blocksize))
+    except (IOError, OSError):
+        return None
+    return hasher.hexdigest()
+
+
+def digest(file_path, algorithm=LEGACY_ALGORITHM, tree_chunk_size=None, drop_cache=None):
+    """Hash a file the way a manifest keys it.
+
+    :param str file_path: Path to the file.
+    :param str algorithm: One of :data:`ALGORITHMS`.
+    :param int tree_chunk_size: Chunk size if the manifest is tree hashed.
+    :param bool drop_cache: Whether to drop the file from the page cache
+        afterwards.
+    :returns: tuple(str, list) of the digest and the chunk digests of a
+        tree hash with more than one chunk, otherwise None. The digest is
+        None if the file could not be read.
+    """
+    if tree_chunk_size is None:
+        return (checksum(file_path, algorithm, drop_cache=drop_cache), None)
+
+    result = tree_checksum(file_path, algorithm, tree_chunk_size, drop_cache)
+    if result is None:
+        return (None, None)
+    root, chunks = result
+    return (root, chunks if len(chunks) > 1 else None)
+
+
+def tree_checksum(file_path, algorithm=LEGACY_ALGORITHM, chunk_size=TREE_CHUNK_SIZE, drop_cache=None):
+    """Create a tree hash of a file, hashing its chunks in parallel.
+
+    The file is split into chunks of ``chunk_size`` bytes which are hashed
+    in separate threads. The root digest is the hash of the chunk size and
+    the binary chunk digests. Files no larger than one chunk have a single
+    chunk and their root digest is their plain :func:`checksum`.
+
+    :param str file_path: Path to the file to create a hash for.
+    :param str algorithm: One of :data:`ALGORITHMS`.
+    :param int chunk_size: Size of each chunk.
+    :param bool drop_cache: Whether to drop the file from the page cache
+        afterwards.
+    :returns: tuple(str, list) of the root digest and the chunk digests, or
+        None if the file could not be read.
+    """
+    new(algorithm)
+    try:
+        size = os.path.getsize(file_path)
+    except OSError:
+        return None
+
+    if size <= chunk_size:
+        digest = checksum(file_path, algorithm, drop_cache=drop_cache)
+        if digest is None:
+            return None
+        return (digest, [digest])
+
+    offsets = range(0, size, chunk_size)
+    chunks = _get_tree_pool().map(
+        lambda offset: _chunk_checksum(file_path, algorithm, offset, chunk_size, drop_cache),
+        offsets
+    )
+    if None in chunks:
+        return None
+    return (combine_chunks(chunks, algorithm, chunk_size), chunks)
+
+
+def combine_chunks(chunks, algorithm, chunk_size):
+    """Combine chunk digests into the root digest of a tree hash.
+
+    :param list chunks: Hex digests of the chunks, in order.
+    :param str algorithm: One of :data:`ALGORITHMS`.
+    :param int chunk_size: Size of each chunk.
+    :returns: str
+    """
+    if len(chunks) == 1:
+        return chunks[0]
+    hasher = new(algorithm)
+    hasher.update(b'elodie-tree' + struct.pack('>Q', chunk_size))
+    for chunk in chunks:
+        hasher.update(bytearray.fromhex(chunk))
+    return hasher.hexdigest()
+
+
+def verify_chunks(file_path, chunks, algorithm=LEGACY_ALGORITHM, chunk_size=TREE_CHUNK_SIZE, indices=None):
+    """Re-hash some or all chunks of a tree hashed file.
+
+    :param str file_path: Path to the file.
+    :param list chunks: The chunk digests recorded for the file.
+    :param str algorithm: One of :data:`ALGORITHMS`.
+    :param int chunk_size: Size of each chunk.
+    :param list indices: Indices of the chunks to check, defaults to all.
+    :returns: list of the indices of chunks which don't match.
+    """
+    if indices is None:
+        indices = range(len(chunks))
+    actual = _get_tree_pool().map(
+        lambda index: _chunk_checksum(file_path, algorithm, index * chunk_size, chunk_size),
+        indices
+    )
+    return [index for index, digest in zip(indices, actual) if digest != chunks[index]]
+
+
+def _chunk_checksum(file_path, algorithm, offset, chunk_size, drop_cache=None):
+    hasher = new(algorithm)
+    try:
+        hash_range(file_path, [hasher], offset, chunk_size, drop_cache=drop_cache)
+    except (IOError, OSError, ValueError):
+        return None
+    return hasher.hexdigest()
+
+
+def _get_tree_pool():
+    # Shared by every caller, so hashing several files at once doesn't
+    #   multiply the number of threads.
+    global __TREE_POOL__
+    if __TREE_POOL__ is None:
+        __TREE_POOL__ = ThreadPool(constants.tree_hash_workers)
+    return __TREE_POOL__
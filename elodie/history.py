@@ -0,0 +1,444 @@
+"""
+Compressed snapshots of a manifest, kept in ``.manifest_history`` next to
+it.
+
+Every write of a manifest adds a snapshot. Most snapshots are deltas which
+only hold the entries set or removed since the snapshot before them, so
+they scale with the size of the change rather than the manifest. A full
+snapshot is written when there's no snapshot of the version of the
+manifest which was loaded, and after every
+``constants.history_full_interval`` deltas, so rebuilding a version only
+reads a bounded chain. Snapshots are manifest files compressed with gzip,
+with an ``@snapshot`` object after the header describing them, and a
+delta's base is the snapshot before it.
+
+Old snapshots are thinned out after each write, keeping the latest few and
+one per day and week for a while. A snapshot which is dropped is folded
+into the one after it, so every snapshot kept can still be rebuilt.
+"""
+from builtins import object
+
+from datetime import datetime
+from datetime import timedelta
+import os
+import re
+
+from elodie import constants
+from elodie import log
+from elodie import sidecar as elodie_sidecar
+from elodie.entries import CompactEntries
+from elodie.manifest_stream import ManifestReader
+from elodie.manifest_stream import ManifestWriter
+
+#: Directory the snapshots of a manifest are kept in, next to it.
+DIRECTORY = '.manifest_history'
+
+#: Key of the object describing a snapshot, written after its header.
+SNAPSHOT_KEY = '@snapshot'
+
+FULL = 'full'
+DELTA = 'delta'
+
+TIMESTAMP_FORMAT = '%Y-%m-%d_%H-%M-%S-%f'
+
+# Uncompressed full copies written before snapshots were compressed have
+#   neither a kind nor microseconds, and are read as full snapshots.
+_SNAPSHOT_FILE = re.compile(
+    r'^(?P<name>.+)_(?P<timestamp>\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}(?:-\d{6})?)'
+    r'(?:\.(?P<kind>full|delta))?\.json(?:\.gz)?$'
+)
+
+
+class Snapshot(object):
+
+    """A snapshot file of a manifest.
+
+    :param str directory: The history directory.
+    :param str file_name: Name of the snapshot file.
+    :param str name: Name of the manifest file without its extension.
+    :param str timestamp: UTC time the snapshot was written, as in its name.
+    :param str kind: :data:`FULL` or :data:`DELTA`.
+    """
+
+    def __init__(self, directory, file_name, name, timestamp, kind):
+        self.directory = directory
+        self.file_name = file_name
+        self.name = name
+        self.timestamp = timestamp
+        self.kind = kind
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, self.file_name)
+
+    def get_datetime(self):
+        return datetime.strptime(self.timestamp[:19], '%Y-%m-%d_%H-%M-%S')
+
+    def open(self):
+        """Open the snapshot for reading.
+
+        :returns: tuple(:class:`~elodie.manifest_stream.ManifestReader`,
+            dict) of the reader, positioned on the first entry, and what
+            the snapshot records about itself.
+        """
+        reader = ManifestReader(self.path)
+        # Old snapshots have no metadata.
+        metadata = reader.read_key(SNAPSHOT_KEY) or {}
+        return (reader, metadata)
+
+    def read_metadata(self):
+        reader, metadata = self.open()
+        reader.close()
+        return metadata
+
+    def read(self):
+        """Read the whole snapshot.
+
+        :returns: tuple(dict, dict, dict) of its header, metadata and
+            entries.
+        """
+        reader, metadata = self.open()
+        with reader:
+            return (reader.header, metadata, dict(reader))
+
+    def __repr__(self):
+        return 'Snapshot({!r})'.format(self.file_name)
+
+
+def get_directory(file_path):
+    return os.path.join(os.path.dirname(os.path.abspath(file_path)), DIRECTORY)
+
+
+def get_name(file_path):
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+
+def get_file_state(file_path):
+    """Get the size and mtime of a manifest file, to tell which version a
+    snapshot is of.
+
+    :returns: list(int, int) or None if the file doesn't exist.
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return [stat.st_size, elodie_sidecar.get_mtime_ns(stat)]
+
+
+def list_snapshots(directory, name=None):
+    """List the snapshots in a history directory, oldest first.
+
+    :param str directory: The history directory.
+    :param str name: Only list the snapshots of this manifest file name,
+        without its extension.
+    :returns: list of :class:`Snapshot`
+    """
+    if not os.path.isdir(directory):
+        return []
+    snapshots = []
+    for file_name in os.listdir(directory):
+        match = _SNAPSHOT_FILE.match(file_name)
+        if match is None or (name is not None and match.group('name') != name):
+            continue
+        snapshots.append(Snapshot(
+            directory,
+            file_name,
+            match.group('name'),
+            match.group('timestamp'),
+            match.group('kind') or FULL
+        ))
+    # Names come first, so a manifest's snapshots are together.
+    snapshots.sort(key=lambda snapshot: (snapshot.name, snapshot.timestamp))
+    return snapshots
+
+
+def write_snapshot(file_path, header, entries, changes=None, loaded_state=None, written=True, now=None):
+    """Add a snapshot of a manifest file to its history.
+
+    :param str file_path: Path of the manifest file.
+    :param dict header: The manifest's header.
+    :param entries: All of the manifest's entries.
+    :param list changes: Keys set or removed since the manifest was loaded,
+        or None if they weren't recorded.
+    :param list loaded_state: :func:`get_file_state` of the file when it
+        was loaded.
+    :param bool written: Whether the manifest file was just written with
+        these entries.
+    :returns: str path of the snapshot
+    """
+    if now is None:
+        now = datetime.utcnow()
+    directory = get_directory(file_path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    name = get_name(file_path)
+
+    metadata = {"kind": FULL, "base": None, "depth": 0, "removed": []}
+    snapshots = list_snapshots(directory, name)
+    if changes is not None and loaded_state is not None and len(snapshots) > 0:
+        latest = snapshots[-1]
+        latest_metadata = latest.read_metadata()
+        # Only a delta if the latest snapshot is of the version loaded.
+        if (
+            latest_metadata.get("file") == loaded_state and
+            latest_metadata.get("depth", 0) < constants.history_full_interval
+        ):
+            metadata.update(kind=DELTA, base=latest.timestamp, depth=latest_metadata.get("depth", 0) + 1)
+    metadata["file"] = get_file_state(file_path) if written else None
+
+    if metadata["kind"] == DELTA:
+        changes = sorted(changes)
+        metadata["removed"] = [key for key in changes if key not in entries]
+        pairs = ((key, entries[key]) for key in changes if key in entries)
+    else:
+        pairs = entries.items()
+
+    timestamp = now.strftime(TIMESTAMP_FORMAT)
+    while len(snapshots) > 0 and timestamp <= snapshots[-1].timestamp:
+        # Snapshots are ordered by name, so they have to be later.
+        now += timedelta(microseconds=1)
+        timestamp = now.strftime(TIMESTAMP_FORMAT)
+    snapshot_path = os.path.join(directory, '{}_{}.{}.json.gz'.format(name, timestamp, metadata["kind"]))
+    _write(snapshot_path, header, metadata, pairs)
+
+    prune(directory, name, now)
+    return snapshot_path
+
+
+class _ReaderEntries(object):
+
+    # Lets a snapshot be written from a reader, one entry at a time.
+    def __init__(self, reader):
+        self.reader = reader
+
+    def items(self):
+        return iter(self.reader)
+
+
+def snapshot_file(file_path, header=None, now=None):
+    """Add a full snapshot of a manifest file as it is now, unless the
+    latest snapshot is already of this version of it.
+
+    The file is read one entry at a time, so it can be snapshotted after
+    it's been rewritten without loading it.
+
+    :param str file_path: Path of the manifest file.
+    :param dict header: Header of a file which no longer exists, which is
+        snapshotted without entries.
+    :returns: str path of the snapshot, or None if none was needed.
+    """
+    state = get_file_state(file_path)
+    snapshots = list_snapshots(get_directory(file_path), get_name(file_path))
+    if len(snapshots) == 0 and state is None:
+        return None
+    if len(snapshots) > 0 and snapshots[-1].read_metadata().get("file") == state:
+        return None
+    if state is None:
+        return write_snapshot(file_path, header, {}, now=now)
+    with ManifestReader(file_path) as reader:
+        return write_snapshot(file_path, reader.header, _ReaderEntries(reader), now=now)
+
+
+def _write(snapshot_path, header, metadata, pairs):
+    with ManifestWriter(snapshot_path, header) as writer:
+        writer.write(SNAPSHOT_KEY, metadata)
+        for key, entry in pairs:
+            writer.write(key, entry)
+
+
+def reconstruct(snapshots, index):
+    """Rebuild the manifest a snapshot is of.
+
+    :param list snapshots: The manifest's snapshots, see
+        :func:`list_snapshots`.
+    :param int index: Index of the snapshot to rebuild.
+    :returns: tuple(dict, :class:`~elodie.entries.CompactEntries`) of the
+        header and entries.
+    :raises ValueError: If a delta's base is missing.
+    """
+    start = index
+    while snapshots[start].kind == DELTA:
+        start -= 1
+        if start < 0:
+            raise ValueError('The full snapshot {} is based on is missing'.format(snapshots[index].file_name))
+
+    header = None
+    entries = CompactEntries()
+    for position in range(start, index + 1):
+        reader, metadata = snapshots[position].open()
+        with reader:
+            if metadata.get("kind", FULL) == DELTA:
+                if metadata.get("base") != snapshots[position - 1].timestamp:
+                    raise ValueError('{} is based on {}, which is missing'.format(
+                        snapshots[position].file_name, metadata.get("base")))
+                for key in metadata.get("removed", []):
+                    if key in entries:
+                        del entries[key]
+            else:
+                entries = CompactEntries()
+            for key, entry in reader:
+                entries[key] = entry
+            header = reader.header
+    return (header, entries)
+
+
+def find_snapshot(snapshots, at=None):
+    """Find the latest snapshot written at or before a time.
+
+    :param list snapshots: Snapshots of one manifest, oldest first.
+    :param str at: ``YYYY-MM-DD`` with an optional `` HH:MM:SS``, in UTC.
+        A date on its own includes the whole day. None for the latest.
+    :returns: int index or None
+    """
+    if at is None:
+        return len(snapshots) - 1 if len(snapshots) > 0 else None
+    date_time = at.strip().replace(' ', '_').replace(':', '-')
+    # Sorts after any snapshot from the same day or second.
+    limit = date_time + ('_99' if len(date_time) == 10 else '-999999')
+    found = None
+    for index, snapshot in enumerate(snapshots):
+        if snapshot.timestamp <= limit:
+            found = index
+    return found
+
+
+def get_retained(snapshots, now=None):
+    """Select the snapshots of one manifest to keep.
+
+    The latest ``constants.history_keep_last`` are kept, and the latest of
+    each of the last ``constants.history_keep_daily`` days and
+    ``constants.history_keep_weekly`` weeks.
+
+    :returns: set of snapshot file names
+    """
+    if now is None:
+        now = datetime.utcnow()
+    retained = set()
+    if len(snapshots) == 0:
+        return retained
+    retained.add(snapshots[-1].file_name)
+    if constants.history_keep_last > 0:
+        retained.update(snapshot.file_name for snapshot in snapshots[-constants.history_keep_last:])
+
+    days = set()
+    weeks = set()
+    for snapshot in reversed(snapshots):
+        date_time = snapshot.get_datetime()
+        day = date_time.date()
+        if (now.date() - day).days < constants.history_keep_daily and day not in days:
+            days.add(day)
+            retained.add(snapshot.file_name)
+        week = day - timedelta(days=day.weekday())
+        if (now.date() - week).days < 7 * constants.history_keep_weekly and week not in weeks:
+            weeks.add(week)
+            retained.add(snapshot.file_name)
+    return retained
+
+
+def prune(directory, name, now=None):
+    """Remove the snapshots of a manifest which aren't retained, folding
+    each into the snapshot after it.
+
+    :returns: int number of snapshots removed
+    """
+    snapshots = list_snapshots(directory, name)
+    retained = get_retained(snapshots, now)
+    removed = 0
+    index = 0
+    while index < len(snapshots) - 1:
+        if snapshots[index].file_name in retained:
+            index += 1
+            continue
+        if snapshots[index + 1].kind == DELTA:
+            snapshots[index + 1] = _fold(snapshots, index)
+        os.remove(snapshots[index].path)
+        del snapshots[index]
+        removed += 1
+    return removed
+
+
+def _fold(snapshots, index):
+    # Rewrites the delta after a snapshot so it no longer needs it.
+    older, newer = snapshots[index], snapshots[index + 1]
+    if older.kind == FULL:
+        header, entries = reconstruct(snapshots, index + 1)
+        reader, metadata = newer.open()
+        reader.close()
+        metadata = dict(metadata, kind=FULL, base=None, depth=0, removed=[])
+        pairs = entries.items()
+    else:
+        header, older_metadata, older_entries = older.read()
+        header, metadata, entries = newer.read()
+        removed = set(metadata.get("removed", []))
+        pairs = dict((k, v) for k, v in older_entries.items() if k not in removed)
+        pairs.update(entries)
+        removed.update(older_metadata.get("removed", []))
+        metadata = dict(
+            metadata,
+            base=older_metadata.get("base"),
+            depth=older_metadata.get("depth", 1),
+            removed=sorted(removed.difference(pairs))
+        )
+        pairs = sorted(pairs.items())
+
+    file_name = '{}_{}.{}.json.gz'.format(newer.name, newer.timestamp, metadata["kind"])
+    snapshot = Snapshot(newer.directory, file_name, newer.name, newer.timestamp, metadata["kind"])
+    _write(snapshot.path, header, metadata, pairs)
+    if snapshot.file_name != newer.file_name:
+        os.remove(newer.path)
+    return snapshot
+
+
+def get_manifest_history(manifest_path):
+    """Get where the snapshots of a manifest are, and which of them are its.
+
+    A sharded manifest keeps the snapshots of its shards in its directory.
+
+    :returns: tuple(str, list) of the history directory and the names the
+        snapshots are under.
+    """
+    if os.path.isdir(manifest_path):
+        directory = os.path.join(manifest_path, DIRECTORY)
+        return (directory, sorted(set(snapshot.name for snapshot in list_snapshots(directory))))
+    return (get_directory(manifest_path), [get_name(manifest_path)])
+
+
+def restore(manifest_path, output_path, at=None):
+    """Rebuild a manifest as it was at a time into one file.
+
+    :param str manifest_path: Path of the manifest file or sharded manifest.
+    :param str output_path: Path to write the rebuilt manifest to.
+    :param str at: Time to rebuild it at, see :func:`find_snapshot`.
+    :returns: int number of entries written, or None if there's no snapshot
+        from before then.
+    """
+    directory, names = get_manifest_history(manifest_path)
+    writer = None
+    skipped = []
+    try:
+        # One shard at a time, so only one is held in memory.
+        for name in names:
+            snapshots = list_snapshots(directory, name)
+            index = find_snapshot(snapshots, at)
+            if index is None:
+                skipped.append(name)
+                continue
+            header, entries = reconstruct(snapshots, index)
+            if writer is None:
+                writer = ManifestWriter(output_path, header)
+            for key, entry in entries.items():
+                writer.write(key, entry)
+    except Exception:
+        if writer is not None:
+            writer.abort()
+        raise
+    if writer is None:
+        return None
+    if len(skipped) > 0:
+        # Either the shards were added later, or their older snapshots
+        #   were pruned.
+        log.warn("[!] No snapshot of shards {} from before {}; their entries are left out".format(
+            ', '.join(skipped), at or 'now'))
+    writer.close()
+    return writer.count
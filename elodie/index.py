@@ -0,0 +1,208 @@
+"""
+Indexes over the entries of a manifest, for answering queries without
+scanning every entry.
+
+Entries are indexed on the values :func:`get_terms` gets from them: target
+names, source paths, dates taken, and camera make and model, album and
+origin lower cased. Each kind of value is kept in a sorted table which is
+searched by bisection, so exact, prefix and range queries only touch the
+entries they return. :class:`ManifestIndex` keeps the tables in memory,
+and :mod:`elodie.sidecar` writes them next to the manifest.
+"""
+from builtins import object
+
+import os
+import time
+from bisect import bisect_left
+from bisect import bisect_right
+
+#: Metadata of a source which is looked up by exact, case insensitive value.
+VALUE_FIELDS = ('camera_make', 'camera_model', 'album', 'origin')
+
+#: Tables of values entries are indexed on, see :func:`get_terms`.
+TABLES = ('name', 'source', 'date') + VALUE_FIELDS
+
+#: Criteria :func:`match_entry` accepts.
+_SCAN_FIELDS = ('key', 'name', 'name_prefix', 'source', 'date_from', 'date_to') + VALUE_FIELDS
+
+#: Sorts after every character which can follow a prefix.
+_HIGHEST = u'\U0010ffff'
+
+
+def get_terms(entry):
+    """Get the values an entry is indexed on.
+
+    :param dict entry: The entry.
+    :returns: list of tuple(str, str) of table and value
+    """
+    terms = []
+    target = entry.get("target") or {}
+    if target.get("name") is not None:
+        terms.append(('name', target["name"]))
+    for source, metadata in (entry.get("sources") or {}).items():
+        terms.append(('source', source))
+        date_taken = format_date_taken(metadata.get("date_taken"))
+        if date_taken is not None:
+            terms.append(('date', date_taken))
+        for field in VALUE_FIELDS:
+            value = metadata.get(field)
+            if value:
+                terms.append((field, value.lower()))
+    return terms
+
+
+def get_ranges(name=None, name_prefix=None, source=None, date_from=None, date_to=None, **values):
+    """Get the ranges of indexed values of the entries matching query
+    criteria.
+
+    Takes the keyword arguments of :meth:`ManifestIndex.find` besides
+    ``key``.
+
+    :returns: list of lists of tuple(str, str, str) of table, lowest and
+        highest value. Matching entries have a value in one of the ranges of
+        every list.
+    :raises TypeError: For unknown criteria.
+    """
+    ranges = []
+    if name is not None:
+        ranges.append([('name', name, name)])
+    if name_prefix is not None:
+        ranges.append([('name', name_prefix, name_prefix + _HIGHEST)])
+    if source is not None:
+        source = source.rstrip(os.sep) or os.sep
+        directory = source if source.endswith(os.sep) else source + os.sep
+        ranges.append([('source', source, source), ('source', directory, directory + _HIGHEST)])
+    if date_from is not None or date_to is not None:
+        low = date_from or u''
+        high = _HIGHEST if date_to is None else date_to + _HIGHEST
+        ranges.append([('date', low, high)])
+    for field, value in values.items():
+        if field not in VALUE_FIELDS:
+            raise TypeError('Unknown query field {}'.format(field))
+        if value is not None:
+            ranges.append([(field, value.lower(), value.lower())])
+    return ranges
+
+
+class ManifestIndex(object):
+
+    """Indexes over the entries of a manifest, held in memory.
+
+    The index isn't updated when entries change afterwards.
+
+    :param dict entries: The manifest's entries, see
+        :attr:`elodie.manifest.Manifest.entries`.
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+        tables = dict((table, []) for table in TABLES)
+        for key, entry in entries.items():
+            for table, value in get_terms(entry):
+                tables[table].append((value, key))
+
+        # Parallel lists, so bisect compares plain strings.
+        self.tables = dict((table, _unzip(sorted(set(pairs)))) for table, pairs in tables.items())
+
+    def find(self, key=None, **criteria):
+        """Find the keys of the entries matching every given criterion.
+
+        :param str key: The entry's key, its checksum.
+        :param str name: Exact target file name.
+        :param str name_prefix: Start of the target file name.
+        :param str source: Source file path, or a directory to find every
+            file under it.
+        :param str date_from: Earliest date taken, as ``YYYY-MM-DD`` with an
+            optional `` HH:MM:SS``.
+        :param str date_to: Latest date taken, in the same format. A date
+            on its own includes the whole day.
+        :param criteria: Also any of :data:`VALUE_FIELDS`, matched case
+            insensitively.
+        :returns: sorted list of keys
+        """
+        matches = []
+        if key is not None:
+            matches.append(set([key]) if key in self.entries else set())
+        for alternatives in get_ranges(**criteria):
+            found = set()
+            for table, low, high in alternatives:
+                values, keys = self.tables[table]
+                found.update(keys[bisect_left(values, low):bisect_right(values, high)])
+            matches.append(found)
+
+        if len(matches) == 0:
+            return []
+        matches.sort(key=len)
+        found = set(matches[0])
+        for match in matches[1:]:
+            found.intersection_update(match)
+        return sorted(found)
+
+
+def match_entry(key, entry, criteria):
+    """Check whether one entry matches every criterion of
+    :meth:`ManifestIndex.find`, for scanning entries as they're read instead
+    of indexing them all.
+
+    :param str key: The entry's key.
+    :param dict entry: The entry.
+    :param dict criteria: Keyword arguments of :meth:`ManifestIndex.find`.
+    :returns: bool
+    """
+    for field in criteria:
+        if field not in _SCAN_FIELDS:
+            raise TypeError('Unknown query field {}'.format(field))
+    if criteria.get('key') is not None and key != criteria['key']:
+        return False
+
+    name = (entry.get("target") or {}).get("name")
+    if criteria.get('name') is not None and name != criteria['name']:
+        return False
+    if criteria.get('name_prefix') is not None and not (name or u'').startswith(criteria['name_prefix']):
+        return False
+
+    sources = entry.get("sources") or {}
+    source = criteria.get('source')
+    if source is not None:
+        source = source.rstrip(os.sep) or os.sep
+        directory = source if source.endswith(os.sep) else source + os.sep
+        if not any(path == source or path.startswith(directory) for path in sources):
+            return False
+
+    date_from, date_to = criteria.get('date_from'), criteria.get('date_to')
+    if date_from is not None or date_to is not None:
+        low = date_from or u''
+        high = _HIGHEST if date_to is None else date_to + _HIGHEST
+        dates = [format_date_taken(metadata.get("date_taken")) for metadata in sources.values()]
+        if not any(date is not None and low <= date <= high for date in dates):
+            return False
+
+    for field in VALUE_FIELDS:
+        value = criteria.get(field)
+        if value is not None and value.lower() not in set(
+            metadata[field].lower() for metadata in sources.values() if metadata.get(field)
+        ):
+            return False
+    return True
+
+
+def format_date_taken(date_taken):
+    """Format a date taken as stored in a manifest for sorting.
+
+    Entries store the date taken as a time tuple, which may be wrapped in a
+    list.
+
+    :returns: str ``YYYY-MM-DD HH:MM:SS`` or None
+    """
+    if isinstance(date_taken, (list, tuple)) and len(date_taken) == 1:
+        date_taken = date_taken[0]
+    if isinstance(date_taken, (list, tuple, time.struct_time)) and len(date_taken) >= 6:
+        try:
+            return u'{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}'.format(*[int(v) for v in date_taken[:6]])
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def _unzip(pairs):
+    return ([pair[0] for pair in pairs], [pair[1] for pair in pairs])
@@ -0,0 +1,193 @@
+"""
+Cache of the place names looked up for coordinates.
+
+Cached places are indexed by a grid of cells keyed on their coordinates, so
+finding a cached place within a radius only looks at the places in the
+cells the radius covers. New places are written to disk in batches.
+"""
+from __future__ import division
+from builtins import object
+from builtins import range
+
+import json
+import math
+import os
+import tempfile
+
+from elodie import compatability
+from elodie import constants
+
+#: Mean radius of the earth in meters.
+EARTH_RADIUS = 6371000
+
+#: Size of the cells of the grid index in degrees, about 11km of latitude.
+CELL_SIZE = 0.1
+
+#: Number of cells around a circle of latitude.
+COLUMNS = int(round(360 / CELL_SIZE))
+
+
+class LocationCache(object):
+
+    """Place names keyed on coordinates, as stored in the location db.
+
+    :param str file_path: Path of the location db, defaults to
+        ``constants.location_db``.
+    """
+
+    def __init__(self, file_path=None):
+        if file_path is None:
+            file_path = constants.location_db
+        self.file_path = file_path
+        self.locations = []
+        self.cells = {}
+        self.names = {}
+        self.unsaved = 0
+        self.file_state = None
+
+    def __len__(self):
+        return len(self.locations)
+
+    def load(self):
+        """Load the location db from disk, if it exists."""
+        self.locations = []
+        self.cells = {}
+        self.names = {}
+        self.unsaved = 0
+        self.file_state = self.get_file_state()
+        if os.path.isfile(self.file_path):
+            try:
+                with open(self.file_path, 'r') as f:
+                    locations = json.load(f)
+            except ValueError:
+                locations = []
+            for location in locations:
+                self._index(location)
+        return self # Allow chaining
+
+    def get_file_state(self):
+        try:
+            stat = os.stat(self.file_path)
+        except OSError:
+            return None
+        return (stat.st_mtime, stat.st_size)
+
+    def is_stale(self):
+        """Check whether the db on disk changed since it was loaded or
+        written, e.g. by another process.
+
+        :returns: bool
+        """
+        return self.get_file_state() != self.file_state
+
+    def add(self, latitude, longitude, name, write=False):
+        """Add a place.
+
+        :param float latitude: Latitude in degrees.
+        :param float longitude: Longitude in degrees.
+        :param name: The place name, as returned by
+            :func:`elodie.geolocation.place_name`.
+        :param bool write: Whether to write the db to disk once
+            ``constants.location_db_flush_size`` places are unsaved.
+        """
+        self._index({'lat': latitude, 'long': longitude, 'name': name})
+        self.unsaved += 1
+        if write and self.unsaved >= constants.location_db_flush_size:
+            self.write()
+
+    def _index(self, location):
+        index = len(self.locations)
+        self.locations.append(location)
+        self.cells.setdefault(self.get_cell(location['lat'], location['long']), []).append(index)
+        name = location['name']
+        if not isinstance(name, dict) and name not in self.names:
+            self.names[name] = index
+
+    def get_cell(self, latitude, longitude):
+        return (
+            int(math.floor(latitude / CELL_SIZE)),
+            int(math.floor(longitude / CELL_SIZE)) % COLUMNS
+        )
+
+    def get_name(self, latitude, longitude, threshold_m):
+        """Get the name of the nearest cached place within a radius.
+
+        :param float latitude: Latitude in degrees.
+        :param float longitude: Longitude in degrees.
+        :param float threshold_m: Radius in meters.
+        :returns: The place name or None.
+        """
+        d_latitude = math.degrees(threshold_m / EARTH_RADIUS)
+        d_longitude = d_latitude / max(math.cos(math.radians(latitude)), 0.01)
+        rows = range(
+            int(math.floor((latitude - d_latitude) / CELL_SIZE)),
+            int(math.floor((latitude + d_latitude) / CELL_SIZE)) + 1
+        )
+        # Not wrapped yet, so a radius across the antimeridian is one range.
+        columns = range(
+            int(math.floor((longitude - d_longitude) / CELL_SIZE)),
+            int(math.floor((longitude + d_longitude) / CELL_SIZE)) + 1
+        )
+
+        if len(rows) * min(len(columns), COLUMNS) > len(self.cells):
+            candidates = range(len(self.locations))
+        else:
+            candidates = (
+                index
+                for row in rows
+                for column in set(c % COLUMNS for c in columns)
+                for index in self.cells.get((row, column), ())
+            )
+
+        name = None
+        best_distance = threshold_m
+        for index in candidates:
+            location = self.locations[index]
+            distance = get_distance(latitude, longitude, location['lat'], location['long'])
+            if distance <= best_distance:
+                name = location['name']
+                best_distance = distance
+        return name
+
+    def get_coordinates(self, name):
+        """Get the coordinates of a cached place by name.
+
+        :param str name: The name of the place.
+        :returns: tuple(float, float) or None
+        """
+        index = self.names.get(name)
+        if index is None:
+            return None
+        return (self.locations[index]['lat'], self.locations[index]['long'])
+
+    def write(self):
+        """Write the location db to disk.
+
+        The db is written to a temporary file which then replaces the old
+        one, so an interrupted write never leaves a truncated db behind.
+        """
+        directory = os.path.dirname(os.path.abspath(self.file_path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with tempfile.NamedTemporaryFile('w', dir=directory, prefix='.location.', suffix='.tmp', delete=False) as f:
+            json.dump(self.locations, f)
+        compatability._rename(f.name, self.file_path)
+        self.unsaved = 0
+        self.file_state = self.get_file_state()
+
+
+def get_distance(latitude_a, longitude_a, latitude_b, longitude_b):
+    """Get the distance between two nearby coordinates.
+
+    The earth is treated as flat, which is precise enough over the few
+    kilometers places are cached for.
+
+    :returns: float meters
+    """
+    latitude_a, longitude_a, latitude_b, longitude_b = map(
+        math.radians, (latitude_a, longitude_a, latitude_b, longitude_b)
+    )
+    d_longitude = (longitude_b - longitude_a + math.pi) % (2 * math.pi) - math.pi
+    x = d_longitude * math.cos(0.5 * (latitude_a + latitude_b))
+    y = latitude_b - latitude_a
+    return EARTH_RADIUS * math.sqrt(x * x + y * y)
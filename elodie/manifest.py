@@ -4,28 +4,46 @@ Methods for interacting with information Elodie caches about stored media.
 from builtins import map
 from builtins import object
 
-import collections
-from datetime import datetime
-import hashlib
+import heapq
 import json
 import os
+import shutil
+import tempfile
 import time
 
-from math import radians, cos, sqrt
+from multiprocessing.pool import ThreadPool
 from shutil import copyfile
 from time import strftime
 
+try:
+    from collections.abc import Mapping
+except ImportError:  # Python 2
+    from collections import Mapping
+
+from elodie import compatability
 from elodie import constants
 from elodie import filesystem
+from elodie import hashing
+from elodie import history
 from elodie import log
+from elodie.entries import CompactEntries
+from elodie.location import LocationCache
+from elodie.manifest_stream import HEADER_KEY
+from elodie.manifest_stream import ManifestReader
+from elodie.manifest_stream import ManifestWriter
+from elodie import shards
+from elodie.shards import ShardedEntries
+
+#: Version of the manifest file format written by this code.
+MANIFEST_VERSION = 2
 
 
 # https://stackoverflow.com/questions/3232943/update-value-of-a-nested-dictionary-of-varying-depth
 def deep_merge(d, u):
     if d is None: return u
     for k, v in u.items():
-        if isinstance(d, collections.Mapping):
-            if isinstance(v, collections.Mapping):
+        if isinstance(d, Mapping):
+            if isinstance(v, Mapping):
                 r = deep_merge(d.get(k, {}), v)
                 d[k] = r
             else:
@@ -35,75 +53,624 @@ def deep_merge(d, u):
     return d
 
 
+#: Fields of a target describing the file written there, see
+#: :meth:`elodie.filesystem.FileSystem.record_target_state`.
+TARGET_STATE = ('size', 'mtime_ns', 'checksum')
+
+
+def is_target_moved(target, update):
+    """Check whether an update of a target changes its path or name.
+
+    :param dict target: The current target, or None.
+    :param dict update: The target merged in.
+    :returns: bool
+    """
+    if not isinstance(target, Mapping) or not isinstance(update, Mapping):
+        return False
+    return (target.get("path"), target.get("name")) != (update.get("path"), update.get("name"))
+
+
+def merge_entry(entry, update):
+    """Merge an entry into the entry with the same key from another manifest.
+
+    Sources are combined, and metadata ``update`` has for a source replaces
+    what ``entry`` has, besides nulls. Targets with a different path or
+    name conflict, in which case ``update``'s target is kept, as loading
+    the manifests one after the other would keep it, without the state
+    recorded for the other target.
+
+    :param dict entry: The entry merged into, which may be changed.
+    :param dict update: The entry merged in.
+    :returns: tuple(dict, bool) of the merged entry and whether the targets
+        conflicted.
+    """
+    conflict = False
+    for k, v in update.items():
+        current = entry.get(k)
+        if k == "sources" and isinstance(current, Mapping) and isinstance(v, Mapping):
+            for source, metadata in v.items():
+                current_metadata = current.get(source)
+                if isinstance(current_metadata, Mapping) and isinstance(metadata, Mapping):
+                    current_metadata.update(
+                        (m, n) for m, n in metadata.items() if n is not None or m not in current_metadata
+                    )
+                else:
+                    current[source] = metadata
+        elif k == "target" and isinstance(current, Mapping) and isinstance(v, Mapping):
+            if is_target_moved(current, v):
+                conflict = True
+                entry[k] = v
+            else:
+                current.update(v)
+        elif isinstance(current, Mapping) and isinstance(v, Mapping):
+            entry[k] = deep_merge(current, v)
+        else:
+            entry[k] = v
+    return (entry, conflict)
+
+
+def merge_files(manifest_paths, output_path, indent=False, sidecar=False, run_size=None, shard_count=None):
+    """Merge manifest files into a new one without loading them into memory.
+
+    Each manifest is read incrementally in runs of ``run_size`` entries,
+    which are sorted by key and written to temporary files unless they all
+    fit in one run. The sorted runs of every manifest are then merged,
+    entries with the same key combined with :func:`merge_entry` and written
+    out one at a time, sorted by key.
+
+    :param list manifest_paths: Paths of the manifests, in the order they
+        would be loaded in.
+    :param str output_path: Path to write the merged manifest to.
+    :param bool indent: Whether to indent the JSON.
+    :param bool sidecar: Whether to write a lookup index next to the
+        merged manifest, see :mod:`elodie.sidecar`.
+    :param int run_size: Number of entries held in memory, defaults to
+        ``constants.merge_run_size``.
+    :param int shard_count: Write a sharded manifest with this many shards,
+        see :mod:`elodie.shards`. An existing sharded manifest at
+        ``output_path`` is rewritten with its own number of shards.
+    :returns: tuple(int, int) of the number of entries written and the
+        number of conflicting targets.
+    :raises ValueError: If the manifests are keyed on different hashes.
+    """
+    if run_size is None:
+        run_size = constants.merge_run_size
+    header = Manifest()
+    keyed = False
+    runs = []
+    held = 0
+    directory = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(output_path)), prefix='.merge.')
+    try:
+        for manifest_path in manifest_paths:
+            log.info("[ ] Reading {}...".format(manifest_path))
+            with shards.open_reader(manifest_path) as reader:
+                # Empty manifests don't decide how the merged one is keyed.
+                if reader.has_entries() or not keyed:
+                    hashing_settings = (header.algorithm, header.tree_chunk_size)
+                    header.merge_header(reader.header, reader.has_entries())
+                    if keyed and (header.algorithm, header.tree_chunk_size) != hashing_settings:
+                        raise ValueError(
+                            "Cannot merge a {} manifest into a {} manifest; migrate one of them first".format(
+                                header.describe_hashing(header.algorithm, header.tree_chunk_size),
+                                header.describe_hashing(*hashing_settings)))
+                    keyed = keyed or reader.has_entries()
+
+                run = []
+                for pair in reader:
+                    run.append(pair)
+                    if len(run) == run_size:
+                        held = _add_run(runs, run, held, run_size, directory)
+                        run = []
+                if run:
+                    held = _add_run(runs, run, held, run_size, directory)
+
+        count = 0
+        conflicts = 0
+        if shard_count is None and shards.is_sharded(output_path):
+            shard_count = (shards.read_header(output_path) or {}).get("shards", constants.manifest_shards)
+        if shard_count is not None:
+            writer = shards.ShardedWriter(output_path, header.get_header(), shard_count, indent, sidecar)
+        else:
+            writer = ManifestWriter(output_path, header.get_header(), indent, sidecar)
+        with writer:
+            for key, entry, key_conflicts in _merge_runs(runs):
+                writer.write(key, entry)
+                count += 1
+                conflicts += key_conflicts
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return (count, conflicts)
+
+
+def sort_entries(pairs, directory, run_size=None):
+    """Sort manifest entries by key without holding them all in memory.
+
+    Entries are sorted in runs of ``run_size``, written to temporary files
+    unless they all fit in one run, and merged as they're read back, the
+    same way :func:`merge_files` does. Entries with the same key are
+    combined with :func:`merge_entry`.
+
+    :param pairs: Iterable of tuple(str, dict) of key and entry.
+    :param str directory: Directory to write the runs to.
+    :param int run_size: Number of entries held in memory, defaults to
+        ``constants.merge_run_size``.
+    :returns: generator of tuple(str, dict) sorted by key
+    """
+    if run_size is None:
+        run_size = constants.merge_run_size
+    runs = []
+    held = 0
+    run = []
+    for pair in pairs:
+        run.append(pair)
+        if len(run) == run_size:
+            held = _add_run(runs, run, held, run_size, directory)
+            run = []
+    if run:
+        held = _add_run(runs, run, held, run_size, directory)
+    for key, entry, conflicts in _merge_runs(runs):
+        yield (key, entry)
+
+
+def _add_run(runs, run, held, run_size, directory):
+    # Sort on keys alone, entries are dicts which don't compare.
+    run.sort(key=lambda pair: pair[0])
+    if held + len(run) <= run_size:
+        runs.append(run)
+        return held + len(run)
+    with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.run', delete=False) as f:
+        for pair in run:
+            f.write(json.dumps(pair))
+            f.write('\n')
+    runs.append(f.name)
+    return held
+
+
+def _merge_runs(runs):
+    # Yields each key once with its entries combined, and how many times
+    #   their targets conflicted. Runs are numbered in the order they were read,
+    #   which breaks ties.
+    key, entry, conflicts = None, None, 0
+    for next_key, number, position, next_entry in heapq.merge(*[_iter_run(n, run) for n, run in enumerate(runs)]):
+        if next_key == key:
+            entry, conflict = merge_entry(entry, next_entry)
+            if conflict:
+                conflicts += 1
+                log.warn("Conflicting targets for {}, keeping {}".format(
+                    key, os.path.join(entry["target"].get("path", ""), entry["target"].get("name", ""))))
+            continue
+        if key is not None:
+            yield (key, entry, conflicts)
+        key, entry, conflicts = next_key, next_entry, 0
+    if key is not None:
+        yield (key, entry, conflicts)
+
+
+def _iter_run(number, run):
+    # The position breaks ties between keys a file has more than once.
+    if isinstance(run, list):
+        for position, (key, entry) in enumerate(run):
+            yield (key, number, position, entry)
+        return
+    with open(run, 'r') as f:
+        for position, line in enumerate(f):
+            key, entry = json.loads(line)
+            yield (key, number, position, entry)
+
+
 class Manifest(object):
 
     """A class for interacting with the JSON files created by Elodie."""
 
-    def __init__(self):
+    def __init__(self, algorithm=None, tree_chunk_size=None):
+        if algorithm is None:
+            algorithm = constants.hash_algorithm
+        if tree_chunk_size is None:
+            tree_chunk_size = constants.tree_chunk_size
+        hashing.new(algorithm)  # Fail early on unsupported algorithms
         self.entries = {}
+        self.algorithm = algorithm
+        self.tree_chunk_size = tree_chunk_size
         self.file_path = os.path.join(os.getcwd(), 'manifest.json')
+        self.file_state = None
+        self.hash_db = {}
+        self.hash_db_unsaved = 0
+        self.location_db = LocationCache()
+
+    @property
+    def entries(self):
+        """The entries, keyed on the digest of their file's content.
+
+        A mapping which can be used like a dict, see
+        :class:`~elodie.entries.CompactEntries`. Entries read from it are
+        copies.
+        """
+        return self._entries
+
+    @entries.setter
+    def entries(self, entries):
+        current = self.__dict__.get('_entries')
+        if entries is not current:
+            self._target_keys = None
+        if isinstance(current, ShardedEntries) and not isinstance(entries, ShardedEntries):
+            # Stays sharded, with every shard rewritten.
+            if entries is not current:
+                entries = dict(entries.items())
+                current.clear()
+                current.update(entries)
+            return
+        if not isinstance(entries, (CompactEntries, ShardedEntries)):
+            entries = CompactEntries(entries)
+        self._entries = entries
 
     def load_from_file(self, file_path):
+        # A directory, or a path ending in a separator for a new one, holds
+        #   a sharded manifest.
+        if shards.is_sharded(file_path) or file_path.endswith(os.sep):
+            return self.load_from_directory(file_path.rstrip(os.sep) or os.sep)
+
         self.file_path = file_path  # To allow re-saving afterwards
 
         if not os.path.isfile(file_path):
             log.info("Specified manifest file {} does not exist, creating...".format(file_path))
             with open(file_path, 'a') as f:
-                json.dump({}, f)
+                json.dump({HEADER_KEY: self.get_header()}, f)
                 os.utime(file_path, None)
 
         log.info("[ ] Loading from {}...".format(file_path))
-        with open(file_path, 'r') as f:
-            self.merge(json.load(f))
+        # Changes are only known relative to the file if it's the only one
+        #   loaded, see write_history.
+        is_only_file = len(self.entries) == 0
+        self.file_state = history.get_file_state(file_path)
+        # Entries are parsed and stored one at a time, so the whole file is
+        #   never held in memory as text or as dicts.
+        with ManifestReader(file_path) as reader:
+            self.merge_header(reader.header, reader.has_entries())
+            for key, entry in reader:
+                if key in self.entries:
+                    entry = deep_merge(self.entries[key], entry)
+                self.entries[key] = entry
+        self.entries.track_changes(is_only_file)
         log.info("[*] Load complete.".format(file_path))
         return self # Allow chaining
 
+    def load_from_directory(self, directory, shard_count=None):
+        """Load a sharded manifest, see :mod:`elodie.shards`.
+
+        Shards are only read once their entries are used.
+
+        :param str directory: Directory of the shards, created if it
+            doesn't exist.
+        :param int shard_count: Number of shards of a new sharded manifest,
+            defaults to ``constants.manifest_shards``.
+        """
+        self.file_path = directory
+
+        header = shards.read_header(directory) if os.path.isdir(directory) else None
+        if header is None:
+            log.info("Specified manifest directory {} does not exist, creating...".format(directory))
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            if shard_count is None:
+                shard_count = constants.manifest_shards
+            header = dict(self.get_header(), shards=shard_count)
+            shards.write_header(directory, header)
+
+        log.info("[ ] Loading from {}...".format(directory))
+        entries = ShardedEntries(directory, header.get("shards"))
+        self.merge_header(header, len(entries.get_shard_names()) > 0)
+        previous = self.entries
+        self.entries = entries
+        if isinstance(previous, CompactEntries):
+            for key, entry in previous.items():
+                self.merge({key: entry})
+        log.info("[*] Load complete.")
+        return self # Allow chaining
+
+    def is_sharded(self):
+        return isinstance(self.entries, ShardedEntries)
+
+    def iter_entries(self):
+        """Iterate over (key, entry) pairs, without loading the shards of a
+        sharded manifest which aren't loaded yet.
+        """
+        if self.is_sharded():
+            return self.entries.iter_items()
+        return iter(self.entries.items())
+
+    def get_header(self):
+        """Get the header written at the top of the manifest file.
+
+        :returns: dict
+        """
+        header = {"version": MANIFEST_VERSION, "algorithm": self.algorithm}
+        if self.tree_chunk_size is not None:
+            header["tree_chunk_size"] = self.tree_chunk_size
+        return header
+
+    def merge_header(self, header, has_entries=True):
+        """Adopt or check the hashing settings of a manifest being loaded.
+
+        Files without a header were written before the algorithm was
+        recorded and are keyed on :data:`hashing.LEGACY_ALGORITHM`.
+
+        :param dict header: The header of the loaded file, or None.
+        :param bool has_entries: Whether the loaded file has any entries.
+        :raises ValueError: If the entries of both manifests are keyed
+            differently.
+        """
+        if header is None:
+            if not has_entries:
+                return
+            header = {}
+        elif header.get("version", MANIFEST_VERSION) > MANIFEST_VERSION:
+            raise ValueError("Manifest version {} is newer than this version of Elodie supports".format(
+                header["version"]))
+
+        algorithm = header.get("algorithm", hashing.LEGACY_ALGORITHM)
+        tree_chunk_size = header.get("tree_chunk_size")
+        if (algorithm, tree_chunk_size) == (self.algorithm, self.tree_chunk_size):
+            return
+        if len(self.entries) > 0 and has_entries:
+            raise ValueError("Cannot merge a {} manifest into a {} manifest; migrate one of them first".format(
+                self.describe_hashing(algorithm, tree_chunk_size),
+                self.describe_hashing(self.algorithm, self.tree_chunk_size)))
+        hashing.new(algorithm)
+        self.algorithm = algorithm
+        self.tree_chunk_size = tree_chunk_size
+
+    @staticmethod
+    def describe_hashing(algorithm, tree_chunk_size):
+        if tree_chunk_size is None:
+            return algorithm
+        return "{} tree ({} byte chunks)".format(algorithm, tree_chunk_size)
+
     def merge(self, manifest_entry):
+        for key, entry in manifest_entry.items():
+            target = entry.get("target") if isinstance(entry, Mapping) else None
+            if target is not None and key in self.entries:
+                current = self.entries[key]
+                if is_target_moved(current.get("target"), target):
+                    # What was recorded about the old target doesn't hold for the new one.
+                    for field in TARGET_STATE:
+                        current["target"].pop(field, None)
+                    self.entries[key] = current
         self.entries = deep_merge(self.entries, manifest_entry)
+        if self._target_keys is not None:
+            for key, entry in manifest_entry.items():
+                self._index_target(key, entry.get("target"))
+
+    def _index_target(self, key, target):
+        # Only targets with recorded state are of use to imports.
+        if isinstance(target, Mapping) and "mtime_ns" in target:
+            self._target_keys[(target.get("path"), target.get("name"))] = key
+
+    def get_target_key(self, path, name):
+        """Get the key of the entry whose target was written at a path and
+        name, so an import can trust the file there without reading it.
+
+        Targets are indexed the first time this is called, and the index is
+        kept up to date by :meth:`merge`.
+
+        :param str path: Path of the target, below its base path.
+        :param str name: Name of the target.
+        :returns: str or None if no entry recorded writing a file there.
+        """
+        if self._target_keys is None:
+            self._target_keys = {}
+            for key, entry in self.entries.items():
+                self._index_target(key, entry.get("target"))
+        key = self._target_keys.get((path, name))
+        if key is None:
+            return None
+        # Entries can be changed without merging them.
+        target = (self.entries.get(key) or {}).get("target") or {}
+        if (target.get("path"), target.get("name")) != (path, name):
+            return None
+        return key
 
     # TODO: Cut out any date that's already there
     def write(self, write_path=None, indent=False, overwrite=True):
-        file_path, file_name = os.path.split(self.file_path)
-        name, ext = os.path.splitext(file_name)
-
-        if write_path is None:
-            filesystem.FileSystem().create_directory(os.path.join(file_path, '.manifest_history'))
-
-            write_name = "{}{}".format('_'.join([name, datetime.utcnow().strftime('%Y-%m-%d_%H-%M-%S')]), ext)
-            # TODO: check to see if you're already in a manifest_history directory, so as to not nest another one
-            write_path = os.path.join(file_path, '.manifest_history', write_name)
-
-            if overwrite is True and os.path.exists(self.file_path):
-                log.info("Writing manifest to {}".format(self.file_path))
-                with open(self.file_path, 'w') as f:
-                    if indent:
-                        json.dump(self.entries, f, indent=2, separators=(',', ': '))
-                    else:
-                        json.dump(self.entries, f, separators=(',', ':'))
-            else:
-                log.warn("Not overwriting manifest at {}".format(self.file_path))
+        if write_path is None and self.is_sharded():
+            self.write_shards(indent, overwrite)
+            return
+
+        if write_path is not None:
+            log.info("Writing manifest to {}".format(write_path))
+            self.dump(write_path, indent, sidecar=constants.manifest_sidecar)
+            log.info("Manifest written.")
+            return
+
+        written = False
+        if overwrite is True and os.path.exists(self.file_path):
+            log.info("Writing manifest to {}".format(self.file_path))
+            self.dump(self.file_path, indent, sidecar=constants.manifest_sidecar)
+            written = True
+        else:
+            log.warn("Not overwriting manifest at {}".format(self.file_path))
 
-        log.info("Writing manifest to {}".format(write_path))
-        with open(write_path, 'w') as f:
-            if indent:
-                json.dump(self.entries, f, indent=2, separators=(',', ': '))
-            else:
-                json.dump(self.entries, f, separators=(',', ':'))
+        self.file_state = self.write_history(self.file_path, self.entries, self.file_state, written)
+        log.info("Manifest written.")
+
+    def write_shards(self, indent=False, overwrite=True):
+        """Write the shards of a sharded manifest which changed since they
+        were loaded, each replaced atomically and with a history copy of its
+        own.
+        """
+        entries = self.entries
+        if overwrite is not True:
+            log.warn("Not overwriting manifest at {}".format(self.file_path))
+
+        for name in sorted(entries.dirty):
+            shard = entries.get_shard(name)
+            shard_path = shards.get_shard_path(entries.directory, name)
+            if overwrite is True:
+                log.info("Writing manifest shard to {}".format(shard_path))
+                if len(shard) > 0:
+                    self.dump(shard_path, indent, sidecar=constants.manifest_sidecar, entries=shard)
+                else:
+                    shards.remove_shard(entries.directory, name)
+
+            entries.file_states[name] = self.write_history(
+                shard_path, shard, entries.file_states.get(name), overwrite is True)
+
+        if overwrite is True:
+            shards.write_header(entries.directory, dict(self.get_header(), shards=entries.shards))
+            entries.dirty.clear()
 
         log.info("Manifest written.")
 
+    def write_history(self, file_path, entries, loaded_state, written):
+        """Add a snapshot of a manifest file to its history, see
+        :mod:`elodie.history`, and start recording changes afresh.
+
+        :param str file_path: Path of the manifest file.
+        :param entries: The file's entries, recording changes since it was
+            loaded if they're known.
+        :param list loaded_state: State of the file when it was loaded.
+        :param bool written: Whether the file was just written.
+        :returns: The state of the file the entries are now relative to, or
+            None if the file wasn't written.
+        """
+        snapshot_path = history.write_snapshot(file_path, self.get_header(), entries, entries.get_changes(),
+                                               loaded_state, written)
+        log.info("Writing manifest history to {}".format(snapshot_path))
+        if not written:
+            entries.track_changes(False)
+            return None
+        entries.track_changes()
+        return history.get_file_state(file_path)
+
+    def dump(self, file_path, indent=False, sidecar=False, entries=None):
+        """Write the header and entries to a file.
+
+        Entries are serialized one at a time, so the offset of each one in
+        the file is known.
+
+        :param str file_path: Path to write to.
+        :param bool indent: Whether to indent the JSON.
+        :param bool sidecar: Whether to write a lookup index next to the
+            file, see :mod:`elodie.sidecar`.
+        :param entries: Entries to write instead of all of them, such as a
+            shard's.
+        """
+        if entries is None:
+            entries = self.entries
+        with ManifestWriter(file_path, self.get_header(), indent, sidecar) as writer:
+            for key, entry in entries.items():
+                writer.write(key, entry)
+
     def __len__(self):
         return len(self.entries)
 
+    def get_entry_paths(self, entry, base_path=None):
+        """Get the paths an entry's file may be read from.
+
+        :param dict entry: A manifest entry.
+        :param str base_path: Base path of the target, if known.
+        :returns: list of paths, target first
+        """
+        paths = []
+        target = entry.get("target")
+        if base_path is not None and target:
+            paths.append(os.path.join(base_path, target["path"], target["name"]))
+        paths.extend(entry.get("sources", {}).keys())
+        return paths
+
+    def migrate(self, algorithm, base_path=None, workers=1, tree_chunk_size=None):
+        """Re-key the entries on another hash algorithm without copying files.
+
+        A file is only used when its digest under the current settings
+        still matches the entry's key. Unless tree hashing is involved, each
+        file is read once and hashed with both algorithms. Files are hashed
+        in parallel.
+
+        :param str algorithm: The algorithm to migrate to.
+        :param str base_path: Base path of the target, so files can be read
+            from there rather than from the sources.
+        :param int workers: Number of files to hash at once.
+        :param int tree_chunk_size: Chunk size to tree hash with, 0 to stop
+            tree hashing, or None to keep the current setting.
+        :returns: list of keys which could not be re-keyed. The manifest is
+            only changed when the list is empty.
+        """
+        hashing.new(algorithm)
+        if tree_chunk_size is None:
+            tree_chunk_size = self.tree_chunk_size
+        elif tree_chunk_size == 0:
+            tree_chunk_size = None
+        if (algorithm, tree_chunk_size) == (self.algorithm, self.tree_chunk_size):
+            return []
+
+        current_algorithm = self.algorithm
+        current_tree_chunk_size = self.tree_chunk_size
+
+        def rehash(item):
+            key, entry = item
+            for path in self.get_entry_paths(entry, base_path):
+                if current_tree_chunk_size is None and tree_chunk_size is None:
+                    digests = hashing.checksums(path, (current_algorithm, algorithm))
+                    if digests is not None and digests[current_algorithm] == key:
+                        return (key, digests[algorithm], None)
+                elif hashing.digest(path, current_algorithm, current_tree_chunk_size)[0] == key:
+                    new_key, chunks = hashing.digest(path, algorithm, tree_chunk_size)
+                    if new_key is not None:
+                        return (key, new_key, chunks)
+            return (key, None, None)
+
+        migrated = {}
+        migrated_chunks = {}
+        failed = []
+        pool = ThreadPool(workers)
+        try:
+            for key, new_key, chunks in pool.imap_unordered(rehash, self.entries.items(), chunksize=16):
+                if new_key is None:
+                    log.warn("[!] Could not find an intact file for {}".format(key))
+                    failed.append(key)
+                else:
+                    migrated[new_key] = self.entries[key]
+                    migrated_chunks[new_key] = chunks
+                log.progress('x' if new_key is None else '.')
+        finally:
+            pool.close()
+            pool.join()
+        log.progress('', True)
+
+        if len(failed) == 0:
+            for key, entry in migrated.items():
+                self.set_chunks(entry, migrated_chunks[key])
+            self.entries = migrated
+            self.algorithm = algorithm
+            self.tree_chunk_size = tree_chunk_size
+        return failed
+
+    def set_chunks(self, entry, chunks):
+        """Record the chunk digests of a tree hash in an entry.
+
+        :param dict entry: A manifest entry.
+        :param list chunks: Chunk digests, or None if the file wasn't tree
+            hashed or fits in a single chunk.
+        """
+        target = entry.get("target")
+        if target is None:
+            return
+        if chunks is None:
+            target.pop("chunks", None)
+        else:
+            target["chunks"] = chunks
+
     def add_hash(self, key, value, write=False):
         """Add a hash to the hash db.
 
         :param str key:
         :param str value:
-        :param bool write: If true, write the hash db to disk.
+        :param bool write: If true, write the hash db to disk once
+            constants.hash_db_flush_size hashes were added since it was
+            last written. Callers still call update_hash_db() when done.
         """
         self.hash_db[key] = value
-        if(write is True):
+        self.hash_db_unsaved += 1
+        if(write is True and self.hash_db_unsaved >= constants.hash_db_flush_size):
             self.update_hash_db()
 
     def backup_hash_db(self):
@@ -122,25 +689,28 @@ class Manifest(object):
         """
         return key in self.hash_db
 
-    def checksum(self, file_path, blocksize=65536):
-        """Create a hash value for the given file.
-
-        See http://stackoverflow.com/a/3431835/1318758.
+    def checksum(self, file_path, blocksize=None):
+        """Create a hash value for the given file with the manifest's algorithm.
 
         :param str file_path: Path to the file to create a hash for.
         :param int blocksize: Read blocks of this size from the file when
-            creating the hash.
+            creating the hash. Chosen from the file size by default.
         :returns: str or None
         """
-        hasher = hashlib.sha256()
-        with open(file_path, 'rb') as f:
-            buf = f.read(blocksize)
-
-            while len(buf) > 0:
-                hasher.update(buf)
-                buf = f.read(blocksize)
-            return hasher.hexdigest()
-        return None
+        if self.tree_chunk_size is not None:
+            return self.hash_file(file_path)[0]
+        return hashing.checksum(file_path, self.algorithm, blocksize)
+
+    def hash_file(self, file_path, drop_cache=None):
+        """Hash a file the way the manifest keys it.
+
+        :param str file_path: Path to the file.
+        :param bool drop_cache: Whether to drop the file from the page cache
+            afterwards. Pass False if the file is about to be read again.
+        :returns: tuple(str, list) of the digest and, for tree hashed files
+            larger than one chunk, the chunk digests.
+        """
+        return hashing.digest(file_path, self.algorithm, self.tree_chunk_size, drop_cache)
 
     def get_hash(self, key):
         """Get the hash value for a given key.
@@ -160,15 +730,65 @@ class Manifest(object):
         for checksum, path in self.hash_db.items():
             yield (checksum, path)
 
+    def load_hash_db(self):
+        """Load the hash db from disk, if it exists."""
+        if os.path.isfile(constants.hash_db):
+            with open(constants.hash_db, 'r') as f:
+                self.hash_db = json.load(f)
+        self.hash_db_unsaved = 0
+        return self # Allow chaining
+
     def reset_hash_db(self):
         self.hash_db = {}
 
     def update_hash_db(self):
-        """Write the hash db to disk."""
-        with open(constants.hash_db, 'w') as f:
+        """Write the hash db to disk.
+
+        The db is written to a temporary file which then replaces the old
+        one, so an interrupted write never leaves a truncated db behind.
+        """
+        directory = os.path.dirname(constants.hash_db)
+        filesystem.FileSystem().create_directory(directory)
+        with tempfile.NamedTemporaryFile('w', dir=directory, prefix='.hash.', suffix='.tmp', delete=False) as f:
             json.dump(self.hash_db, f)
+        compatability._rename(f.name, constants.hash_db)
+        self.hash_db_unsaved = 0
+
+    def add_location(self, latitude, longitude, place, write=False):
+        """Add a location to the location db.
+
+        :param float latitude:
+        :param float longitude:
+        :param place: The place name.
+        :param bool write: If true, write the location db to disk once
+            constants.location_db_flush_size locations were added since it
+            was last written.
+        """
+        self.location_db.add(latitude, longitude, place, write)
+
+    def get_location_name(self, latitude, longitude, threshold_m):
+        """Find the name of the nearest location within a radius.
+
+        :param float latitude:
+        :param float longitude:
+        :param float threshold_m: Radius in meters.
+        :returns: The place name or None.
+        """
+        return self.location_db.get_name(latitude, longitude, threshold_m)
+
+    def get_location_coordinates(self, name):
+        """Find the coordinates of a location by name.
+
+        :param str name:
+        :returns: tuple(float, float) or None
+        """
+        return self.location_db.get_coordinates(name)
+
+    def load_location_db(self):
+        """Load the location db from disk, if it exists."""
+        self.location_db = LocationCache().load()
+        return self # Allow chaining
 
     def update_location_db(self):
         """Write the location db to disk."""
-        with open(constants.location_db, 'w') as f:
-            json.dump(self.location_db, f)
+        self.location_db.write()
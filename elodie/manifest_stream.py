@@ -0,0 +1,267 @@
+"""
+Read and write manifest files one entry at a time.
+
+A manifest is a single JSON object of digest to entry, which ``json.load``
+can only parse as a whole. :class:`ManifestReader` parses the object
+incrementally, reading the file in blocks and decoding one key and entry
+at a time, so only the entry being read is held in memory.
+:class:`ManifestWriter` writes entries as they come, laid out exactly as
+``json.dump`` would lay out the whole object, to a temporary file which
+replaces the manifest once it's complete. Files named ``.gz`` are
+compressed with gzip.
+"""
+from builtins import object
+
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from elodie import compatability
+from elodie import sidecar as elodie_sidecar
+from elodie.index import get_terms
+
+#: Key of the header object stored alongside the entries in a manifest file.
+HEADER_KEY = '@manifest'
+
+#: Suffix of compressed manifest files.
+COMPRESSED_SUFFIX = '.gz'
+
+#: Number of characters read from a manifest at a time.
+BLOCK_SIZE = 1 << 16
+
+_WHITESPACE = ' \t\n\r'
+
+
+class ManifestReader(object):
+
+    """Iterate over the entries of a manifest file.
+
+    The header is read when the reader is created. Iterating yields tuples
+    of (key, entry) in the order of the file, without the header.
+
+    :param str file_path: Path of the manifest.
+    :raises ValueError: If the file isn't a JSON object.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        if file_path.endswith(COMPRESSED_SUFFIX):
+            self.file = gzip.open(file_path, 'rt', encoding='utf-8')
+        else:
+            self.file = io.open(file_path, 'r', encoding='utf-8')
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+        self.pending = None
+        self.header = None
+        try:
+            self.pairs = self._parse()
+            pair = next(self.pairs, None)
+            if pair is not None and pair[0] == HEADER_KEY:
+                self.header = pair[1]
+                pair = next(self.pairs, None)
+            self.pending = pair
+        except ValueError:
+            self.close()
+            raise
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def has_entries(self):
+        """Check whether the manifest has any entries, without reading them.
+
+        :returns: bool
+        """
+        return self.pending is not None
+
+    def read_key(self, key):
+        """Read the value of a key which is written before the entries,
+        if it's next.
+
+        :param str key: The key.
+        :returns: The value, or None if the next key is another one.
+        """
+        if self.pending is None or self.pending[0] != key:
+            return None
+        value = self.pending[1]
+        self.pending = next(self.pairs, None)
+        return value
+
+    def __iter__(self):
+        while self.pending is not None:
+            pair = self.pending
+            self.pending = next(self.pairs, None)
+            if pair[0] == HEADER_KEY:
+                # Only written first, but hand edited files may differ.
+                if self.header is None:
+                    self.header = pair[1]
+                continue
+            yield pair
+
+    def _fill(self):
+        # Drop what's been parsed before reading more.
+        if self.position > 0:
+            self.buffer = self.buffer[self.position:]
+            self.position = 0
+        block = self.file.read(BLOCK_SIZE)
+        if not block:
+            self.eof = True
+            return False
+        self.buffer += block
+        return True
+
+    def _skip_whitespace(self):
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in _WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer) or not self._fill():
+                return
+
+    def _expect(self, characters):
+        self._skip_whitespace()
+        if self.position >= len(self.buffer) or self.buffer[self.position] not in characters:
+            raise ValueError('Expecting one of {!r} at character {} of {}'.format(
+                characters, self.position, self.file_path))
+        self.position += 1
+        return self.buffer[self.position - 1]
+
+    def _decode(self):
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except ValueError:
+                if self._fill():
+                    continue
+                raise
+            # A number at the end of the buffer may continue in the file.
+            if end == len(self.buffer) and not self.eof and self._fill():
+                continue
+            self.position = end
+            return value
+
+    def _parse(self):
+        self._expect('{')
+        self._skip_whitespace()
+        if self.buffer[self.position:self.position + 1] == '}':
+            return
+        while True:
+            key = self._decode()
+            if not isinstance(key, str):
+                raise ValueError('Expecting a key in {}'.format(self.file_path))
+            self._expect(':')
+            yield (key, self._decode())
+            if self._expect(',}') == '}':
+                return
+
+
+class ManifestWriter(object):
+
+    """Write a manifest file one entry at a time.
+
+    :param str file_path: Path to write to.
+    :param dict header: The manifest's header.
+    :param bool indent: Whether to indent the JSON.
+    :param bool sidecar: Whether to write a lookup index next to the file
+        once it's closed, see :mod:`elodie.sidecar`. Compressed files don't
+        get one.
+    """
+
+    def __init__(self, file_path, header, indent=False, sidecar=False):
+        self.file_path = file_path
+        self.indent = indent
+        self.compressed = file_path.endswith(COMPRESSED_SUFFIX)
+        self.sidecar = sidecar and not self.compressed
+        self.locations = []
+        self.count = 0
+        if indent:
+            self.separators = (',', ': ')
+            opening, self.delimiter, self.closing = '{\n', ',\n', '\n}'
+        else:
+            self.separators = (',', ':')
+            opening, self.delimiter, self.closing = '{', ',', '}'
+
+        # json.dumps escapes anything which isn't ASCII, so characters are bytes.
+        directory, name = os.path.split(os.path.abspath(file_path))
+        fd, self.temporary_path = tempfile.mkstemp(dir=directory, prefix='.{}.'.format(name), suffix='.tmp')
+        if self.compressed:
+            os.close(fd)
+            self.file = gzip.open(self.temporary_path, 'wt', encoding='utf-8')
+        else:
+            self.file = io.open(fd, 'w', encoding='utf-8')
+        self.file.write(opening)
+        self.position = len(opening)
+        pair, value_offset = self._serialize(HEADER_KEY, header)
+        self.file.write(pair)
+        self.position += len(pair)
+
+    def _serialize(self, key, value):
+        # Laid out as json.dump would lay it out inside the manifest.
+        if self.indent:
+            value = json.dumps(value, indent=2, separators=self.separators).replace('\n', '\n  ')
+            prefix = '  {}: '.format(json.dumps(key))
+        else:
+            value = json.dumps(value, separators=self.separators)
+            prefix = '{}:'.format(json.dumps(key))
+        return (prefix + value, len(prefix))
+
+    def write(self, key, entry):
+        """Write an entry.
+
+        :param str key: The entry's key.
+        :param dict entry: The entry.
+        """
+        pair, value_offset = self._serialize(key, entry)
+        self.file.write(self.delimiter)
+        self.file.write(pair)
+        self.position += len(self.delimiter)
+        if self.sidecar:
+            self.locations.append((
+                key,
+                (entry.get("target") or {}).get("name"),
+                self.position + value_offset,
+                len(pair) - value_offset,
+                get_terms(entry)
+            ))
+        self.position += len(pair)
+        self.count += 1
+
+    def close(self):
+        """Finish the file, move it in place of the manifest and write its
+        sidecar if it has one."""
+        if self.file.closed:
+            return
+        self.file.write(self.closing)
+        self.file.close()
+        if os.path.exists(self.file_path):
+            shutil.copymode(self.file_path, self.temporary_path)
+        compatability._rename(self.temporary_path, self.file_path)
+        if self.sidecar:
+            elodie_sidecar.write(self.file_path, self.locations)
+
+    def abort(self):
+        """Discard what's been written, leaving the manifest as it was."""
+        if self.file.closed:
+            return
+        self.file.close()
+        os.remove(self.temporary_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
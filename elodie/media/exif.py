@@ -0,0 +1,313 @@
+"""
+The exif module reads the small set of EXIF and XMP tags Elodie needs from
+JPEG and TIFF-based RAW files (DNG, NEF, ARW, CR2) without launching ExifTool.
+
+Only the APP1 segments of a JPEG, or the IFDs of a TIFF, are read. The
+returned dictionary uses the same keys ExifTool produces with ``-G -n`` so
+that :class:`~elodie.media.media.Media` can consume it unchanged.
+"""
+from __future__ import division
+
+import io
+import struct
+import xml.etree.ElementTree as ElementTree
+
+#: Extensions which are parsed as JPEG files.
+JPEG_EXTENSIONS = ('jpg', 'jpeg')
+
+#: Extensions which are parsed as TIFF structured (RAW) files.
+TIFF_EXTENSIONS = ('arw', 'cr2', 'dng', 'nef')
+
+EXIF_HEADER = b'Exif\x00\x00'
+XMP_HEADER = b'http://ns.adobe.com/xap/1.0/\x00'
+
+# Sizes in bytes of the TIFF field types we know how to decode.
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+
+# Guard against corrupt files pointing us at huge or looping structures.
+MAX_IFD_ENTRIES = 1000
+MAX_VALUE_SIZE = 1024 * 1024
+
+IFD0_TAGS = {
+    0x010F: 'EXIF:Make',
+    0x0110: 'EXIF:Model',
+    0x0132: 'EXIF:ModifyDate',
+}
+EXIF_IFD_TAGS = {
+    0x9003: 'EXIF:DateTimeOriginal',
+    0x9004: 'EXIF:CreateDate',
+}
+EXIF_IFD_POINTER = 0x8769
+GPS_IFD_POINTER = 0x8825
+XMP_TAG = 0x02BC
+
+# XMP properties (by local name) and the ExifTool tag names they map to.
+XMP_PROPERTIES = {
+    'title': 'XMP:Title',
+    'Album': 'XMP:Album',
+    'album': 'XMP:Album',
+    'OriginalFileName': 'XMP:OriginalFileName',
+    'OriginalFilename': 'XMP:OriginalFileName',
+}
+RDF_NAMESPACE = '{http://www.w3.org/1999/02/22-rdf-syntax-ns#}'
+
+
+def get_metadata(source):
+    """Read EXIF and XMP tags from a JPEG or TIFF-based file.
+
+    :param str source: Path to the file.
+    :returns: dict keyed like ExifTool's ``-G -n`` output, or None if the
+        file could not be parsed.
+    """
+    try:
+        with open(source, 'rb') as f:
+            head = f.read(4)
+            if head[:2] == b'\xff\xd8':
+                metadata = _parse_jpeg(f)
+            elif head in (b'II*\x00', b'MM\x00*'):
+                f.seek(0)
+                metadata = _parse_tiff(f, 0)
+            else:
+                return None
+    except (IOError, OSError, ValueError, struct.error):
+        return None
+
+    if metadata is None:
+        return None
+
+    metadata['SourceFile'] = source
+    return metadata
+
+
+def _parse_jpeg(f):
+    """Walk the JPEG markers up to the start of the image data.
+
+    :param file f: File object positioned after the SOI marker.
+    :returns: dict or None
+    """
+    metadata = {}
+    found_exif = False
+    f.seek(2)
+    while True:
+        marker = f.read(4)
+        if len(marker) < 4 or marker[0:1] != b'\xff':
+            break
+        marker_type = marker[1]
+        # Start of scan or end of image; no metadata segments follow.
+        if marker_type in (0xDA, 0xD9):
+            break
+        length = struct.unpack('>H', marker[2:4])[0] - 2
+        if length < 0:
+            break
+        if marker_type != 0xE1:
+            f.seek(length, io.SEEK_CUR)
+            continue
+
+        segment = f.read(length)
+        if segment.startswith(EXIF_HEADER) and not found_exif:
+            tiff = _parse_tiff(io.BytesIO(segment[len(EXIF_HEADER):]), 0)
+            if tiff is not None:
+                metadata.update(tiff)
+                found_exif = True
+        elif segment.startswith(XMP_HEADER):
+            metadata.update(_parse_xmp(segment[len(XMP_HEADER):]))
+
+    if not found_exif and not metadata:
+        return None
+    return metadata
+
+
+def _parse_tiff(f, base):
+    """Read the tags we need from a TIFF structure.
+
+    :param file f: File object containing the TIFF structure.
+    :param int base: Offset of the TIFF header within ``f``.
+    :returns: dict or None
+    """
+    reader = _TiffReader(f, base)
+    if not reader.read_header():
+        return None
+
+    metadata = {}
+    ifd0 = reader.read_ifd(reader.ifd0_offset)
+    if ifd0 is None:
+        return None
+
+    for tag, key in IFD0_TAGS.items():
+        if tag in ifd0:
+            value = reader.read_string(ifd0[tag])
+            if value:
+                metadata[key] = value
+
+    if EXIF_IFD_POINTER in ifd0:
+        exif_ifd = reader.read_ifd(reader.read_int(ifd0[EXIF_IFD_POINTER]))
+        if exif_ifd is not None:
+            for tag, key in EXIF_IFD_TAGS.items():
+                if tag in exif_ifd:
+                    value = reader.read_string(exif_ifd[tag])
+                    if value:
+                        metadata[key] = value
+
+    if GPS_IFD_POINTER in ifd0:
+        gps_ifd = reader.read_ifd(reader.read_int(ifd0[GPS_IFD_POINTER]))
+        if gps_ifd is not None:
+            metadata.update(_parse_gps(reader, gps_ifd))
+
+    if XMP_TAG in ifd0:
+        metadata.update(_parse_xmp(reader.read_bytes(ifd0[XMP_TAG])))
+
+    return metadata
+
+
+def _parse_gps(reader, gps_ifd):
+    """Convert the GPS IFD into ExifTool's numeric (``-n``) representation.
+
+    :returns: dict
+    """
+    metadata = {}
+    for ref_tag, value_tag, name in ((1, 2, 'Latitude'), (3, 4, 'Longitude')):
+        if ref_tag in gps_ifd:
+            ref = reader.read_string(gps_ifd[ref_tag])
+            if ref:
+                metadata['EXIF:GPS{}Ref'.format(name)] = ref
+        if value_tag in gps_ifd:
+            parts = reader.read_rationals(gps_ifd[value_tag])
+            if parts is not None and len(parts) == 3:
+                degrees, minutes, seconds = parts
+                metadata['EXIF:GPS{}'.format(name)] = \
+                    degrees + minutes / 60 + seconds / 3600
+    return metadata
+
+
+def _parse_xmp(packet):
+    """Extract title, album and original name from an XMP packet.
+
+    Properties may be stored as attributes of ``rdf:Description`` or as
+    child elements, optionally wrapped in an ``rdf:Alt``/``rdf:Seq``.
+
+    :returns: dict
+    """
+    start = packet.find(b'<x:xmpmeta')
+    end = packet.rfind(b'</x:xmpmeta>')
+    if start == -1 or end == -1:
+        return {}
+
+    try:
+        root = ElementTree.fromstring(packet[start:end + len('</x:xmpmeta>')])
+    except ElementTree.ParseError:
+        return {}
+
+    metadata = {}
+    for description in root.iter(RDF_NAMESPACE + 'Description'):
+        for attribute, value in description.attrib.items():
+            key = XMP_PROPERTIES.get(_local_name(attribute))
+            if key is not None and value:
+                metadata.setdefault(key, value)
+        for child in description:
+            key = XMP_PROPERTIES.get(_local_name(child.tag))
+            if key is None:
+                continue
+            value = child.text.strip() if child.text else ''
+            for item in child.iter(RDF_NAMESPACE + 'li'):
+                if item.text and item.text.strip():
+                    value = item.text.strip()
+                    break
+            if value:
+                metadata.setdefault(key, value)
+    return metadata
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+class _TiffReader(object):
+
+    """Decode TIFF IFD entries with small seek/read calls.
+
+    :param file f: File object containing the TIFF structure.
+    :param int base: Offset of the TIFF header within ``f``.
+    """
+
+    def __init__(self, f, base):
+        self.f = f
+        self.base = base
+        self.endian = '<'
+        self.ifd0_offset = 0
+
+    def read(self, offset, size):
+        self.f.seek(self.base + offset)
+        data = self.f.read(size)
+        if len(data) != size:
+            raise ValueError('Unexpected end of TIFF data')
+        return data
+
+    def read_header(self):
+        header = self.read(0, 8)
+        if header[:2] == b'II':
+            self.endian = '<'
+        elif header[:2] == b'MM':
+            self.endian = '>'
+        else:
+            return False
+        magic, self.ifd0_offset = struct.unpack(self.endian + 'HI', header[2:8])
+        return magic == 42
+
+    def read_ifd(self, offset):
+        """Read an IFD into a dict of tag -> (type, count, raw value field).
+
+        :returns: dict or None
+        """
+        if offset <= 0:
+            return None
+        count = struct.unpack(self.endian + 'H', self.read(offset, 2))[0]
+        if count > MAX_IFD_ENTRIES:
+            return None
+        data = self.read(offset + 2, count * 12)
+        entries = {}
+        for i in range(count):
+            tag, field_type, value_count = struct.unpack(
+                self.endian + 'HHI', data[i * 12:i * 12 + 8])
+            entries[tag] = (field_type, value_count, data[i * 12 + 8:i * 12 + 12])
+        return entries
+
+    def read_bytes(self, entry):
+        field_type, count, value = entry
+        if field_type not in TYPE_SIZES:
+            return b''
+        size = TYPE_SIZES[field_type] * count
+        if size <= 4:
+            return value[:size]
+        if size > MAX_VALUE_SIZE:
+            return b''
+        offset = struct.unpack(self.endian + 'I', value)[0]
+        return self.read(offset, size)
+
+    def read_int(self, entry):
+        field_type, count, value = entry
+        if field_type == 3:
+            return struct.unpack(self.endian + 'H', value[:2])[0]
+        return struct.unpack(self.endian + 'I', value)[0]
+
+    def read_string(self, entry):
+        if entry[0] != 2:
+            return None
+        value = self.read_bytes(entry).split(b'\x00', 1)[0].strip()
+        try:
+            return value.decode('utf-8')
+        except UnicodeDecodeError:
+            return value.decode('latin-1')
+
+    def read_rationals(self, entry):
+        if entry[0] not in (5, 10):
+            return None
+        data = self.read_bytes(entry)
+        fmt = 'I' if entry[0] == 5 else 'i'
+        values = struct.unpack(
+            '{}{}{}'.format(self.endian, entry[1] * 2, fmt), data)
+        rationals = []
+        for i in range(0, len(values), 2):
+            if values[i + 1] == 0:
+                return None
+            rationals.append(values[i] / values[i + 1])
+        return rationals
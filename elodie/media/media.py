@@ -11,9 +11,12 @@ are used to represent the actual files.
 from __future__ import print_function
 
 import os
+import socket
 
 # load modules
 from elodie import constants
+from elodie import daemon
+from elodie import log
 from elodie.dependencies import get_exiftool
 from elodie.external.pyexiftool import ExifTool
 from elodie.media.base import Base
@@ -58,6 +61,7 @@ class Media(Base):
             u'"{}"'.format(constants.exiftool_config)
         ]
         self.exif_metadata = None
+        self.rescanned = False
 
     def get_album(self):
         """Get album from EXIF
@@ -127,13 +131,12 @@ class Media(Base):
         if self.exif_metadata is not None:
             return self.exif_metadata
 
-        source = self.source
-        exiftool = get_exiftool()
-        if(exiftool is None):
-            return False
+        metadata = None
+        if constants.native_metadata:
+            metadata = self.get_native_attributes()
 
-        with ExifTool(addedargs=self.exiftool_addedargs) as et:
-            metadata = et.get_metadata(source)
+        if metadata is None:
+            metadata = self.read_exiftool_metadata()
             if not metadata:
                 return False
 
@@ -180,6 +183,56 @@ class Media(Base):
 
         return None
 
+    def get_date_taken_attributes(self):
+        """Get the attributes used to read the date taken.
+
+        If a header-only scan may have skipped the date taken keys we
+        re-read the file in full, so the date doesn't depend on the scan
+        mode.
+
+        :returns: dict, or False if exiftool was not available.
+        """
+        exif = self.get_exiftool_attributes()
+        if exif and not self.has_date_taken_key(exif):
+            missing_keys = self.get_scan_mode_missing_keys()
+            for key in self.exif_map['date_taken']:
+                if key in missing_keys:
+                    return self.rescan_exiftool_attributes()
+
+        return exif
+
+    def get_native_attributes(self):
+        """Read attributes with a built-in header parser instead of exiftool.
+
+        Sub-classes override this for file types they can parse. The
+        returned dict must use the same keys as exiftool's ``-G -n`` output.
+
+        :returns: dict, or None to fall back to exiftool.
+        """
+        return None
+
+    def get_scan_mode_missing_keys(self):
+        """Get the keys exiftool may skip in the configured scan mode.
+
+        See constants.exiftool_scan_mode. Sub-classes override this for
+        file types where the header-only scans stop before all metadata.
+
+        :returns: list
+        """
+        return []
+
+    def has_date_taken_key(self, attributes):
+        """Check whether any of the date taken keys are in the attributes.
+
+        :param dict attributes: Attributes keyed like exiftool's output.
+        :returns: bool
+        """
+        for key in self.exif_map['date_taken']:
+            if key in attributes:
+                return True
+
+        return False
+
     def get_original_name(self):
         """Get the original name stored in EXIF.
 
@@ -216,6 +269,46 @@ class Media(Base):
 
         return exiftool_attributes[self.title_key]
 
+    def read_exiftool_metadata(self):
+        """Read metadata for this file with exiftool.
+
+        The daemon's warm exiftool workers are used if it's running.
+
+        :returns: dict, or None if exiftool was not available.
+        """
+        client = daemon.get_client()
+        if client is not None:
+            try:
+                return client.get_metadata(self.source)
+            except (socket.error, daemon.DaemonError) as e:
+                log.warn('[!] Daemon request failed, running exiftool: {}'.format(e))
+
+        if get_exiftool() is None:
+            return None
+
+        with ExifTool(addedargs=self.exiftool_addedargs) as et:
+            return et.get_metadata(self.source)
+
+    def rescan_exiftool_attributes(self):
+        """Read attributes again with a full exiftool scan.
+
+        A file is only rescanned once.
+
+        :returns: dict, or False if exiftool was not available.
+        """
+        if self.rescanned:
+            return self.exif_metadata
+
+        self.rescanned = True
+        metadata = self.read_exiftool_metadata()
+        if not metadata:
+            return False
+
+        metadata["origin"] = self.get_origin()
+
+        self.exif_metadata = metadata
+        return metadata
+
     def reset_cache(self):
         """Resets any internal cache
         """
@@ -328,6 +421,13 @@ class Media(Base):
 
         source = self.source
 
+        client = daemon.get_client()
+        if client is not None:
+            try:
+                return client.set_tags(tags, source) != ''
+            except (socket.error, daemon.DaemonError) as e:
+                log.warn('[!] Daemon request failed, running exiftool: {}'.format(e))
+
         status = ''
         with ExifTool(addedargs=self.exiftool_addedargs) as et:
             status = et.set_tags(tags, source)
@@ -15,7 +15,9 @@ from datetime import datetime
 from re import compile
 
 
+from elodie import constants
 from elodie import log
+from . import exif
 from .media import Media
 
 
@@ -50,7 +52,7 @@ class Photo(Media):
         source = self.source
         seconds_since_epoch = min(os.path.getmtime(source), os.path.getctime(source))  # noqa
 
-        exif = self.get_exiftool_attributes()
+        exif = self.get_date_taken_attributes()
         if not exif:
             return None  # seconds_since_epoch
 
@@ -83,6 +85,39 @@ class Photo(Media):
 
         return time.gmtime(seconds_since_epoch)
 
+    def get_native_attributes(self):
+        """Read EXIF and XMP from JPEG and TIFF-based RAW files directly.
+
+        We fall back to exiftool when the file can't be parsed or none of
+        the date taken keys were found, since exiftool also looks in maker
+        notes and other places our parser doesn't.
+
+        :returns: dict or None
+        """
+        extension = os.path.splitext(self.source)[1][1:].lower()
+        if extension not in exif.JPEG_EXTENSIONS + exif.TIFF_EXTENSIONS:
+            return None
+
+        metadata = exif.get_metadata(self.source)
+        if metadata is None or not self.has_date_taken_key(metadata):
+            return None
+
+        return metadata
+
+    def get_scan_mode_missing_keys(self):
+        """Get the keys exiftool may skip in the configured scan mode.
+
+        -fast2 stops reading PNG files at the IDAT chunk and metadata may
+        be stored after it.
+
+        :returns: list
+        """
+        if(constants.exiftool_scan_mode == 'fast2' and
+                os.path.splitext(self.source)[1][1:].lower() == 'png'):
+            return self.exif_map['date_taken']
+
+        return []
+
     def is_valid(self):
         """Check the file extension against valid file extensions.
 
@@ -0,0 +1,242 @@
+"""
+The quicktime module walks the atom tree of QuickTime and MP4 files (MOV,
+MP4, M4V, M4A, 3GP) to read creation dates, make and model without
+launching ExifTool.
+
+Only atom headers are read while walking, so large ``mdat`` atoms are
+skipped with a seek. The returned dictionary uses the same ``QuickTime:*``
+keys ExifTool produces with ``-G -n``.
+"""
+
+import re
+import struct
+import time
+
+#: Extensions which are parsed as QuickTime/ISO base media files.
+EXTENSIONS = ('3gp', 'm4a', 'm4v', 'mov', 'mp4')
+
+# Seconds between the QuickTime epoch (1904-01-01) and the Unix epoch.
+QUICKTIME_EPOCH_OFFSET = 2082844800
+
+# Atoms we descend into on the way to the metadata.
+CONTAINER_ATOMS = (b'moov', b'trak', b'mdia', b'udta')
+
+# Upper bound for reading the content of a single metadata atom.
+MAX_ATOM_READ = 1024 * 1024
+
+# Maximum number of atoms we look at in a single container.
+MAX_ATOMS = 10000
+
+# QuickTime keys (moov/meta/keys) and the ExifTool tag names they map to.
+KEYS = {
+    'com.apple.quicktime.creationdate': 'QuickTime:CreationDate',
+    'com.apple.quicktime.make': 'QuickTime:Make',
+    'com.apple.quicktime.model': 'QuickTime:Model',
+    'com.apple.quicktime.location.ISO6709': 'QuickTime:GPSCoordinates',
+}
+
+# User data (udta) and item list (ilst) atoms and their ExifTool tag names.
+USER_DATA = {
+    b'\xa9day': 'QuickTime:ContentCreateDate',
+    b'\xa9mak': 'QuickTime:Make',
+    b'\xa9mod': 'QuickTime:Model',
+    b'\xa9xyz': 'QuickTime:GPSCoordinates',
+}
+
+ISO6709 = re.compile(r'([+-]\d+(?:\.\d+)?)([+-]\d+(?:\.\d+)?)')
+ISO8601 = re.compile(
+    r'^(\d{4})-?(\d{2})-?(\d{2})(?:[T ](\d{2}):?(\d{2}):?(\d{2})(?:\.\d+)?)?'
+    r'(Z|[+-]\d{2}:?\d{2})?'
+)
+
+
+def get_metadata(source):
+    """Read QuickTime dates, make, model and location from a file.
+
+    :param str source: Path to the file.
+    :returns: dict keyed like ExifTool's ``-G -n`` output, or None if the
+        file could not be parsed.
+    """
+    metadata = {}
+    try:
+        with open(source, 'rb') as f:
+            f.seek(0, 2)
+            end = f.tell()
+            found_moov = False
+            for atom_type, start, size in _atoms(f, 0, end):
+                if atom_type == b'moov':
+                    _parse_container(f, atom_type, start, size, metadata)
+                    found_moov = True
+                    break
+    except (IOError, OSError, ValueError, struct.error):
+        return None
+
+    if not found_moov:
+        return None
+
+    # ExifTool derives these Composite tags from GPSCoordinates.
+    if 'QuickTime:GPSCoordinates' in metadata:
+        match = ISO6709.match(metadata['QuickTime:GPSCoordinates'])
+        if match is not None:
+            metadata['Composite:GPSLatitude'] = float(match.group(1))
+            metadata['Composite:GPSLongitude'] = float(match.group(2))
+
+    metadata['SourceFile'] = source
+    return metadata
+
+
+def _atoms(f, start, end):
+    """Generator over the atoms between two offsets.
+
+    :returns: tuple(bytes, int, int) of type, content offset and content size
+    """
+    position = start
+    count = 0
+    while position + 8 <= end and count < MAX_ATOMS:
+        f.seek(position)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, atom_type = struct.unpack('>I4s', header)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            header_size = 16
+        elif size == 0:
+            size = end - position
+        if size < header_size or position + size > end:
+            return
+        yield atom_type, position + header_size, size - header_size
+        position += size
+        count += 1
+
+
+def _read(f, start, size):
+    if size > MAX_ATOM_READ:
+        raise ValueError('Atom too large to read')
+    f.seek(start)
+    return f.read(size)
+
+
+def _parse_container(f, container_type, start, size, metadata):
+    for atom_type, atom_start, atom_size in _atoms(f, start, start + size):
+        if atom_type in CONTAINER_ATOMS:
+            _parse_container(f, atom_type, atom_start, atom_size, metadata)
+        elif atom_type == b'mvhd':
+            _parse_header(_read(f, atom_start, min(atom_size, 20)),
+                          'QuickTime:CreateDate', 'QuickTime:ModifyDate', metadata)
+        elif atom_type == b'mdhd':
+            _parse_header(_read(f, atom_start, min(atom_size, 20)),
+                          'QuickTime:MediaCreateDate', 'QuickTime:MediaModifyDate', metadata)
+        elif atom_type == b'meta':
+            _parse_meta(f, atom_start, atom_size, metadata)
+        elif container_type == b'udta' and atom_type in USER_DATA:
+            _parse_user_data(_read(f, atom_start, atom_size), USER_DATA[atom_type], metadata)
+
+
+def _parse_header(data, create_key, modify_key, metadata):
+    """Read the creation and modification times of a mvhd or mdhd atom."""
+    if len(data) < 12:
+        return
+    if data[0:1] == b'\x01':
+        created, modified = struct.unpack('>QQ', data[4:20])
+    else:
+        created, modified = struct.unpack('>II', data[4:12])
+    for key, value in ((create_key, created), (modify_key, modified)):
+        # Only the first track's media dates are reported, like ExifTool.
+        if value != 0 and key not in metadata:
+            metadata[key] = time.strftime(
+                '%Y:%m:%d %H:%M:%S',
+                time.gmtime(value - QUICKTIME_EPOCH_OFFSET)
+            )
+
+
+def _parse_user_data(data, key, metadata):
+    """Read a QuickTime ``\\xa9xxx`` user data string."""
+    if len(data) < 4 or key in metadata:
+        return
+    length = struct.unpack('>H', data[:2])[0]
+    value = _decode(data[4:4 + length])
+    if value:
+        metadata[key] = _convert(key, value)
+
+
+def _parse_meta(f, start, size, metadata):
+    """Read the keys and item list of a meta atom.
+
+    The ISO flavour of the atom has a version/flags field before its
+    children while the QuickTime flavour doesn't.
+    """
+    peek = _read(f, start, min(size, 12))
+    if peek[8:12] == b'hdlr' or peek[8:12] == b'keys':
+        start += 4
+        size -= 4
+
+    keys = []
+    for atom_type, atom_start, atom_size in _atoms(f, start, start + size):
+        if atom_type == b'keys':
+            keys = _parse_keys(_read(f, atom_start, atom_size))
+        elif atom_type == b'ilst':
+            _parse_item_list(f, atom_start, atom_size, keys, metadata)
+
+
+def _parse_keys(data):
+    keys = []
+    position = 8
+    while position + 8 <= len(data):
+        key_size = struct.unpack('>I', data[position:position + 4])[0]
+        if key_size < 8:
+            break
+        keys.append(_decode(data[position + 8:position + key_size]))
+        position += key_size
+    return keys
+
+
+def _parse_item_list(f, start, size, keys, metadata):
+    for atom_type, atom_start, atom_size in _atoms(f, start, start + size):
+        if atom_type in USER_DATA:
+            key = USER_DATA[atom_type]
+        else:
+            index = struct.unpack('>I', atom_type)[0]
+            if index < 1 or index > len(keys) or keys[index - 1] not in KEYS:
+                continue
+            key = KEYS[keys[index - 1]]
+
+        if key in metadata:
+            continue
+
+        for data_type, data_start, data_size in _atoms(f, atom_start, atom_start + atom_size):
+            if data_type != b'data' or data_size < 8:
+                continue
+            value = _decode(_read(f, data_start + 8, data_size - 8))
+            if value:
+                metadata[key] = _convert(key, value)
+            break
+
+
+def _convert(key, value):
+    """Format dates the way ExifTool does (``2015:01:19 12:45:11-08:00``)."""
+    if not key.endswith('Date'):
+        return value
+
+    match = ISO8601.match(value)
+    if match is None:
+        return value
+
+    year, month, day, hour, minute, second, offset = match.groups()
+    converted = '{}:{}:{} {}:{}:{}'.format(
+        year, month, day, hour or '00', minute or '00', second or '00')
+    if offset == 'Z':
+        converted += 'Z'
+    elif offset is not None:
+        offset = offset.replace(':', '')
+        converted += '{}:{}'.format(offset[:3], offset[3:])
+    return converted
+
+
+def _decode(value):
+    value = value.split(b'\x00', 1)[0].strip()
+    try:
+        return value.decode('utf-8')
+    except UnicodeDecodeError:
+        return value.decode('latin-1')
@@ -15,6 +15,8 @@ import os
 import re
 import time
 
+from elodie import constants
+from . import quicktime
 from .media import Media
 
 
@@ -52,6 +54,41 @@ class Video(Media):
         self.longitude_ref_key = 'EXIF:GPSLongitudeRef'
         self.set_gps_ref = False
 
+    def get_scan_mode_missing_keys(self):
+        """Get the keys exiftool may skip in the configured scan mode.
+
+        -fast stops reading AVI files at the audio/video data and -fast2
+        stops QuickTime files at the mdat atom. Metadata may follow both.
+
+        :returns: list
+        """
+        scan_mode = constants.exiftool_scan_mode
+        extension = os.path.splitext(self.source)[1][1:].lower()
+        if((scan_mode == 'fast' and extension == 'avi') or
+                scan_mode == 'fast2'):
+            return self.exif_map['date_taken'] + self.camera_make_keys + \
+                self.camera_model_keys
+
+        return []
+
+    def get_native_attributes(self):
+        """Read the QuickTime atoms of MOV/MP4 based files directly.
+
+        We fall back to exiftool when the file can't be parsed or none of
+        the date taken keys were found.
+
+        :returns: dict or None
+        """
+        extension = os.path.splitext(self.source)[1][1:].lower()
+        if extension not in quicktime.EXTENSIONS:
+            return None
+
+        metadata = quicktime.get_metadata(self.source)
+        if metadata is None or not self.has_date_taken_key(metadata):
+            return None
+
+        return metadata
+
     def get_date_taken(self):
         """Get the date which the photo was taken.
 
@@ -65,7 +102,7 @@ class Video(Media):
         source = self.source
         seconds_since_epoch = min(os.path.getmtime(source), os.path.getctime(source))  # noqa
 
-        exif = self.get_exiftool_attributes()
+        exif = self.get_date_taken_attributes()
         for date_key in self.exif_map['date_taken']:
             if date_key in exif:
                 # Example date strings we want to parse
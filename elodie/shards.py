@@ -0,0 +1,370 @@
+"""
+A manifest stored as a directory of shard files keyed by digest prefix.
+
+Each shard holds the entries whose keys start with the same hex digits, 2
+digits for 256 shards or 3 for 4096, and is an ordinary manifest file
+named after its prefix, e.g. ``3f.json``. Keys which don't start with
+lower case hex digits go in ``_.json``. ``@manifest.json`` holds the
+header, with the number of shards.
+
+Shards are loaded the first time one of their keys is looked up, so a
+lookup only reads one small file, and only the shards which changed are
+written back.
+"""
+from builtins import object
+
+import io
+import json
+import os
+import re
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:  # Python 2
+    from collections import MutableMapping
+
+from elodie import history
+from elodie import sidecar as elodie_sidecar
+from elodie.entries import CompactEntries
+from elodie.manifest_stream import HEADER_KEY
+from elodie.manifest_stream import ManifestReader
+from elodie.manifest_stream import ManifestWriter
+
+#: Name of the file holding the header of a sharded manifest.
+HEADER_FILE = HEADER_KEY + '.json'
+
+#: Supported numbers of shards, and the hex digits of their prefixes.
+PREFIX_LENGTHS = {256: 2, 4096: 3}
+
+#: Shard of keys which don't start with a hex prefix.
+OTHER_SHARD = '_'
+
+_SHARD_FILE = re.compile(r'^([0-9a-f]+|_)\.json$')
+
+_HEX_DIGITS = frozenset('0123456789abcdef')
+
+
+def is_sharded(path):
+    """Check whether a manifest path is a sharded manifest's directory.
+
+    :returns: bool
+    """
+    return os.path.isdir(path)
+
+
+def get_shard_name(key, prefix_length):
+    prefix = key[:prefix_length]
+    if len(prefix) == prefix_length and _HEX_DIGITS.issuperset(prefix):
+        return prefix
+    return OTHER_SHARD
+
+
+def get_shard_path(directory, name):
+    return os.path.join(directory, '{}.json'.format(name))
+
+
+def get_shard_names(directory, prefix_length):
+    """Get the names of the shards stored in a directory.
+
+    :returns: sorted list of str
+    """
+    names = []
+    for file_name in os.listdir(directory):
+        match = _SHARD_FILE.match(file_name)
+        if match and (len(match.group(1)) == prefix_length or match.group(1) == OTHER_SHARD):
+            names.append(match.group(1))
+    return sorted(names)
+
+
+def read_header(directory):
+    """Read the header of a sharded manifest.
+
+    :returns: dict or None if the directory has no header.
+    """
+    path = os.path.join(directory, HEADER_FILE)
+    if not os.path.isfile(path):
+        return None
+    with io.open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get(HEADER_KEY)
+
+
+def write_header(directory, header):
+    # Written like a manifest without entries, so it's replaced atomically.
+    ManifestWriter(os.path.join(directory, HEADER_FILE), header).close()
+
+
+def get_prefix_length(shards):
+    """Get the length of the prefixes of a number of shards.
+
+    :raises ValueError: If the number isn't supported.
+    """
+    if shards not in PREFIX_LENGTHS:
+        raise ValueError('Manifests are sharded in {} shards, not {}'.format(
+            ' or '.join(str(n) for n in sorted(PREFIX_LENGTHS)), shards))
+    return PREFIX_LENGTHS[shards]
+
+
+class ShardedEntries(MutableMapping):
+
+    """A mapping of manifest keys to entries, loaded and saved per shard.
+
+    :param str directory: Directory of the shards.
+    :param int shards: Number of shards, see :data:`PREFIX_LENGTHS`.
+    """
+
+    def __init__(self, directory, shards):
+        self.directory = directory
+        self.shards = shards
+        self.prefix_length = get_prefix_length(shards)
+        self.loaded = {}
+        self.file_states = {}
+        self.dirty = set()
+
+    def get_shard(self, name):
+        """Get a shard's entries, loading them if they're not loaded yet.
+
+        :param str name: The shard's prefix.
+        :returns: :class:`~elodie.entries.CompactEntries`
+        """
+        shard = self.loaded.get(name)
+        if shard is None:
+            shard = CompactEntries()
+            path = get_shard_path(self.directory, name)
+            self.file_states[name] = history.get_file_state(path)
+            if os.path.isfile(path):
+                with ManifestReader(path) as reader:
+                    for key, entry in reader:
+                        shard[key] = entry
+            shard.track_changes()
+            self.loaded[name] = shard
+        return shard
+
+    def get_shard_names(self):
+        if not os.path.isdir(self.directory):
+            return sorted(self.loaded)
+        return sorted(set(get_shard_names(self.directory, self.prefix_length)) | set(self.loaded))
+
+    def __getitem__(self, key):
+        return self.get_shard(get_shard_name(key, self.prefix_length))[key]
+
+    def __setitem__(self, key, entry):
+        name = get_shard_name(key, self.prefix_length)
+        self.get_shard(name)[key] = entry
+        self.dirty.add(name)
+
+    def __delitem__(self, key):
+        name = get_shard_name(key, self.prefix_length)
+        del self.get_shard(name)[key]
+        self.dirty.add(name)
+
+    def __contains__(self, key):
+        return key in self.get_shard(get_shard_name(key, self.prefix_length))
+
+    def __iter__(self):
+        for name in self.get_shard_names():
+            for key in self.get_shard(name):
+                yield key
+
+    def iter_items(self):
+        """Iterate over (key, entry) pairs one shard at a time.
+
+        Shards which aren't loaded are read from their files without
+        loading them, so only one is in memory at a time.
+        """
+        for name in self.get_shard_names():
+            if name in self.loaded:
+                for pair in self.loaded[name].items():
+                    yield pair
+            else:
+                with ManifestReader(get_shard_path(self.directory, name)) as reader:
+                    for pair in reader:
+                        yield pair
+
+    def __len__(self):
+        count = 0
+        for name in self.get_shard_names():
+            if name in self.loaded:
+                count += len(self.loaded[name])
+            else:
+                # Counted without keeping the shard in memory.
+                with ManifestReader(get_shard_path(self.directory, name)) as reader:
+                    count += sum(1 for pair in reader)
+        return count
+
+    def clear(self):
+        for name in self.get_shard_names():
+            self.loaded[name] = CompactEntries()
+            self.dirty.add(name)
+
+    def __repr__(self):
+        return 'ShardedEntries({!r}, {!r})'.format(self.directory, self.shards)
+
+
+class ShardedReader(object):
+
+    """Iterate over the entries of a sharded manifest one shard at a time,
+    like :class:`~elodie.manifest_stream.ManifestReader`.
+
+    :param str directory: Directory of the shards.
+    :param str key: Only read the shard this key would be in.
+    """
+
+    def __init__(self, directory, key=None):
+        self.directory = directory
+        self.header = read_header(directory)
+        if self.header is None:
+            raise ValueError('{} is not a sharded manifest'.format(directory))
+        prefix_length = get_prefix_length(self.header.get("shards"))
+        self.names = get_shard_names(directory, prefix_length)
+        if key is not None:
+            name = get_shard_name(key, prefix_length)
+            self.names = [n for n in self.names if n == name]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def has_entries(self):
+        # Shards without entries aren't kept.
+        return len(self.names) > 0
+
+    def __iter__(self):
+        for name in self.names:
+            with ManifestReader(get_shard_path(self.directory, name)) as reader:
+                for pair in reader:
+                    yield pair
+
+
+class ShardedWriter(object):
+
+    """Write a sharded manifest from entries sorted by key, one shard at a
+    time, like :class:`~elodie.manifest_stream.ManifestWriter`.
+
+    Shards already in the directory which aren't written are removed once
+    the writer is closed.
+
+    :param str directory: Directory of the shards, created if needed.
+    :param dict header: The manifest's header.
+    :param int shards: Number of shards, see :data:`PREFIX_LENGTHS`.
+    :param bool indent: Whether to indent the JSON.
+    :param bool sidecar: Whether to write a lookup index next to each shard.
+    """
+
+    def __init__(self, directory, header, shards, indent=False, sidecar=False):
+        self.directory = directory
+        self.header = header
+        self.shards = shards
+        self.prefix_length = get_prefix_length(shards)
+        self.indent = indent
+        self.sidecar = sidecar
+        self.writers = {}
+        self.written = set()
+        self.count = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def write(self, key, entry):
+        name = get_shard_name(key, self.prefix_length)
+        writer = self.writers.get(name)
+        if writer is None:
+            if name in self.written:
+                raise ValueError('Keys of a sharded manifest must be written in order')
+            # Keys are sorted, so a hex prefix never comes back once the
+            #   next one starts.
+            for other in [n for n in self.writers if n != OTHER_SHARD]:
+                self.writers.pop(other).close()
+            writer = ManifestWriter(get_shard_path(self.directory, name), self.header, self.indent, self.sidecar)
+            self.writers[name] = writer
+            self.written.add(name)
+        writer.write(key, entry)
+        self.count += 1
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+        for name in get_shard_names(self.directory, self.prefix_length):
+            if name not in self.written:
+                remove_shard(self.directory, name)
+        write_header(self.directory, dict(self.header, shards=self.shards))
+
+    def abort(self):
+        for writer in self.writers.values():
+            writer.abort()
+        self.writers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def remove_shard(directory, name):
+    """Remove a shard and its sidecar, if they exist."""
+    path = get_shard_path(directory, name)
+    for file_path in (path, elodie_sidecar.get_path(path)):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+def get_key_shard_path(directory, key):
+    """Get the path of the shard a key would be in.
+
+    :raises ValueError: If the directory isn't a sharded manifest.
+    """
+    header = read_header(directory)
+    if header is None:
+        raise ValueError('{} is not a sharded manifest'.format(directory))
+    return get_shard_path(directory, get_shard_name(key, get_prefix_length(header.get("shards"))))
+
+
+def open_sidecars(manifest_path, key=None):
+    """Open the sidecars of a manifest, whether it's sharded or not.
+
+    :param str manifest_path: Path of a manifest file or sharded manifest.
+    :param str key: Only the sidecar of this key's shard is needed, if the
+        manifest is sharded.
+    :returns: list of :class:`~elodie.sidecar.ManifestSidecar`, or None if
+        any of them is missing or out of date.
+    """
+    if not is_sharded(manifest_path):
+        paths = [manifest_path]
+    elif key is not None:
+        paths = [get_key_shard_path(manifest_path, key)]
+        if not os.path.isfile(paths[0]):
+            return []
+    else:
+        prefix_length = get_prefix_length(read_header(manifest_path).get("shards"))
+        paths = [get_shard_path(manifest_path, name) for name in get_shard_names(manifest_path, prefix_length)]
+    sidecars = []
+    for path in paths:
+        sidecar = elodie_sidecar.ManifestSidecar.open(path)
+        if sidecar is None:
+            for opened in sidecars:
+                opened.close()
+            return None
+        sidecars.append(sidecar)
+    return sidecars
+
+
+def open_reader(manifest_path, key=None):
+    """Open a reader of a manifest's entries, whether it's sharded or not.
+
+    :param str manifest_path: Path of a manifest file or sharded manifest.
+    :param str key: Only the shard of this key needs to be read, if the
+        manifest is sharded.
+    :returns: :class:`~elodie.manifest_stream.ManifestReader` or
+        :class:`ShardedReader`
+    """
+    if is_sharded(manifest_path):
+        return ShardedReader(manifest_path, key)
+    return ManifestReader(manifest_path)
@@ -0,0 +1,388 @@
+"""
+A binary lookup index written next to a manifest, so lookups don't have to
+parse the whole JSON file.
+
+The sidecar holds one fixed-width record per entry, sorted by key, with the
+byte offset and length of the entry's JSON in the manifest, followed by a
+hash table of target names. After those come a sorted table for each kind
+of value entries are indexed on, see :data:`elodie.index.TABLES`, of the
+values' offsets in a table of strings and the numbers of the records they
+belong to. Everything is read through ``mmap``: keys and values are found
+by binary search and names by probing the hash table, and only the matching
+entries are parsed.
+
+The sidecar records the size and mtime of the manifest it was written for
+and is ignored once the manifest changes.
+"""
+from builtins import object
+from builtins import range
+
+import binascii
+import json
+import mmap
+import os
+import re
+import struct
+import tempfile
+import zlib
+
+from elodie import compatability
+from elodie.index import TABLES
+from elodie.index import get_ranges
+from elodie.index import get_terms
+
+#: Appended to the manifest's path to get the sidecar's path.
+SUFFIX = '.idx'
+
+MAGIC = b'ELDX'
+VERSION = 2
+
+#: Magic, version, key format, key size, manifest size, manifest mtime_ns,
+#: record count and hash table slot count.
+HEADER = struct.Struct('>4sBBHQQQQ')
+
+#: Size of the sidecar, then the offset and length of each of the tables of
+#: :data:`elodie.index.TABLES`.
+TABLES_HEADER = struct.Struct('>Q' + 'QQ' * len(TABLES))
+
+#: Offset and length of an entry's JSON, following its key.
+LOCATION = struct.Struct('>QI')
+
+#: Name hash and record number plus one, 0 for an empty slot.
+SLOT = struct.Struct('>II')
+
+#: Offset of a value in the sidecar and the record number it belongs to.
+TERM = struct.Struct('>QI')
+
+#: Length of a value's UTF-8, preceding it.
+STRING = struct.Struct('>I')
+
+#: Keys are stored as the bytes of their hex digits.
+KEY_HEX = 0
+
+#: Keys are stored as ASCII, padded with NUL.
+KEY_ASCII = 1
+
+_HEX_KEY = re.compile(r'^[0-9a-f]+\Z')
+
+
+def get_path(manifest_path):
+    return manifest_path + SUFFIX
+
+
+def write(manifest_path, locations):
+    """Write the sidecar of a manifest which was just written.
+
+    :param str manifest_path: Path of the manifest.
+    :param list locations: tuples of (key, target name, offset, length,
+        terms) of every entry in the manifest, where terms are those of
+        :func:`elodie.index.get_terms`.
+    """
+    keys = [location[0] for location in locations]
+    key_format = KEY_HEX
+    key_size = 0
+    if keys and all(_is_hex(key) for key in keys) and len(set(len(key) for key in keys)) == 1:
+        key_size = len(keys[0]) // 2
+    else:
+        key_format = KEY_ASCII
+        key_size = max([len(key.encode('utf-8')) for key in keys] or [0])
+
+    records = sorted(
+        ((_encode_key(key, key_format, key_size), name, offset, length, terms)
+         for key, name, offset, length, terms in locations),
+        key=lambda record: record[0]
+    )
+    slot_count = 1
+    while slot_count < 2 * len(records):
+        slot_count *= 2
+    slots = [(0, 0)] * slot_count
+    tables = dict((table, set()) for table in TABLES)
+    for number, record in enumerate(records):
+        for table, value in record[4]:
+            tables[table].add((value.encode('utf-8'), number))
+        name = record[1]
+        if name is None:
+            continue
+        name_hash = get_name_hash(name)
+        slot = name_hash & (slot_count - 1)
+        while slots[slot][1] != 0:
+            slot = (slot + 1) & (slot_count - 1)
+        slots[slot] = (name_hash, number + 1)
+
+    # UTF-8 sorts by code point, so the tables can be searched on bytes.
+    tables = [sorted(tables[table]) for table in TABLES]
+    offset = HEADER.size + TABLES_HEADER.size + len(records) * (key_size + LOCATION.size) + \
+        slot_count * SLOT.size
+    table_locations = []
+    for table in tables:
+        table_locations.extend((offset, len(table)))
+        offset += len(table) * TERM.size
+    # Values are stored once, however many entries have them.
+    strings = {}
+    for table in tables:
+        for value, number in table:
+            if value not in strings:
+                strings[value] = offset
+                offset += STRING.size + len(value)
+
+    stat = os.stat(manifest_path)
+    directory = os.path.dirname(os.path.abspath(manifest_path))
+    with tempfile.NamedTemporaryFile('wb', dir=directory, suffix='.tmp', delete=False) as f:
+        f.write(HEADER.pack(MAGIC, VERSION, key_format, key_size, stat.st_size, get_mtime_ns(stat),
+                            len(records), slot_count))
+        f.write(TABLES_HEADER.pack(offset, *table_locations))
+        for key, name, value_offset, length, terms in records:
+            f.write(key)
+            f.write(LOCATION.pack(value_offset, length))
+        for name_hash, number in slots:
+            f.write(SLOT.pack(name_hash, number))
+        for table in tables:
+            for value, number in table:
+                f.write(TERM.pack(strings[value], number))
+        for value, value_offset in sorted(strings.items(), key=lambda item: item[1]):
+            f.write(STRING.pack(len(value)))
+            f.write(value)
+    compatability._rename(f.name, get_path(manifest_path))
+
+
+def get_name_hash(name):
+    return zlib.crc32(name.encode('utf-8')) & 0xffffffff
+
+
+def get_mtime_ns(stat):
+    if hasattr(stat, 'st_mtime_ns'):
+        return stat.st_mtime_ns
+    return int(stat.st_mtime * 1000000000)
+
+
+def _is_hex(key):
+    # bytearray.fromhex skips whitespace, so it can't tell hex keys apart.
+    return len(key) % 2 == 0 and _HEX_KEY.match(key) is not None
+
+
+def _encode_key(key, key_format, key_size):
+    if key_format == KEY_HEX:
+        if not _is_hex(key):
+            raise ValueError('Not a hex key: {}'.format(key))
+        return bytes(bytearray.fromhex(key))
+    return key.encode('utf-8').ljust(key_size, b'\0')
+
+
+class ManifestSidecar(object):
+
+    """A manifest's sidecar, opened for lookups.
+
+    Use :meth:`open` rather than creating it directly.
+    """
+
+    def __init__(self, manifest_path, manifest_file, sidecar_file):
+        self.manifest_path = manifest_path
+        self.manifest_file = manifest_file
+        self.sidecar_file = sidecar_file
+        self.map = mmap.mmap(sidecar_file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.key_format, self.key_size, self.manifest_size, self.manifest_mtime_ns,
+         self.record_count, self.slot_count) = HEADER.unpack_from(self.map, 0)
+        tables_header = TABLES_HEADER.unpack_from(self.map, HEADER.size)
+        self.tables = dict(zip(TABLES, zip(tables_header[1::2], tables_header[2::2])))
+        self.record_size = self.key_size + LOCATION.size
+        self.records_offset = HEADER.size + TABLES_HEADER.size
+        self.slots_offset = self.records_offset + self.record_count * self.record_size
+
+    @classmethod
+    def open(cls, manifest_path):
+        """Open the sidecar of a manifest, if it's there and up to date.
+
+        :param str manifest_path: Path of the manifest.
+        :returns: :class:`ManifestSidecar` or None
+        """
+        sidecar_path = get_path(manifest_path)
+        try:
+            sidecar_file = open(sidecar_path, 'rb')
+        except (IOError, OSError):
+            return None
+        try:
+            header = sidecar_file.read(HEADER.size + TABLES_HEADER.size)
+            if len(header) != HEADER.size + TABLES_HEADER.size:
+                sidecar_file.close()
+                return None
+            magic, version, key_format, key_size, size, mtime_ns, record_count, slot_count = \
+                HEADER.unpack_from(header)
+            stat = os.stat(manifest_path)
+            if (
+                magic != MAGIC or version != VERSION or
+                (size, mtime_ns) != (stat.st_size, get_mtime_ns(stat)) or
+                os.fstat(sidecar_file.fileno()).st_size != TABLES_HEADER.unpack_from(header, HEADER.size)[0]
+            ):
+                sidecar_file.close()
+                return None
+            return cls(manifest_path, open(manifest_path, 'rb'), sidecar_file)
+        except (IOError, OSError, ValueError):
+            sidecar_file.close()
+            return None
+
+    def close(self):
+        self.map.close()
+        self.sidecar_file.close()
+        self.manifest_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.record_count
+
+    def is_stale(self):
+        """Check whether the manifest changed since the sidecar was opened.
+
+        :returns: bool
+        """
+        try:
+            stat = os.stat(self.manifest_path)
+        except OSError:
+            return True
+        return (stat.st_size, get_mtime_ns(stat)) != (self.manifest_size, self.manifest_mtime_ns)
+
+    def _get_record(self, number):
+        offset = self.records_offset + number * self.record_size
+        key = self.map[offset:offset + self.key_size]
+        location = LOCATION.unpack_from(self.map, offset + self.key_size)
+        return (key, location)
+
+    def _find_number(self, key):
+        try:
+            encoded = _encode_key(key, self.key_format, self.key_size)
+        except (TypeError, ValueError):
+            return None
+        if len(encoded) != self.key_size:
+            return None
+        low, high = 0, self.record_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._get_record(middle)[0] < encoded:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.record_count and self._get_record(low)[0] == encoded:
+            return low
+        return None
+
+    def _find_record(self, key):
+        number = self._find_number(key)
+        if number is None:
+            return None
+        return self._get_record(number)
+
+    def _get_term(self, table, index):
+        value_offset, number = TERM.unpack_from(self.map, self.tables[table][0] + index * TERM.size)
+        length = STRING.unpack_from(self.map, value_offset)[0]
+        start = value_offset + STRING.size
+        return (self.map[start:start + length], number)
+
+    def _bisect(self, table, value, right):
+        low, high = 0, self.tables[table][1]
+        while low < high:
+            middle = (low + high) // 2
+            term = self._get_term(table, middle)[0]
+            if term < value or (right and term == value):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _find_range(self, table, low, high):
+        """Get the numbers of the records with a value from low to high in a
+        table.
+
+        :returns: set of int
+        """
+        low = self._bisect(table, low.encode('utf-8'), False)
+        high = self._bisect(table, high.encode('utf-8'), True)
+        return set(self._get_term(table, index)[1] for index in range(low, high))
+
+    def _decode_key(self, key):
+        if self.key_format == KEY_HEX:
+            return binascii.hexlify(key).decode('ascii')
+        return bytes(key).rstrip(b'\0').decode('utf-8')
+
+    def _read_entry(self, location):
+        offset, length = location
+        self.manifest_file.seek(offset)
+        return json.loads(self.manifest_file.read(length).decode('utf-8'))
+
+    def __contains__(self, key):
+        return self._find_record(key) is not None
+
+    def contains(self, key):
+        """Check whether the manifest has an entry for a key.
+
+        :param str key:
+        :returns: bool
+        """
+        return key in self
+
+    def get(self, key):
+        """Get an entry by key.
+
+        :param str key:
+        :returns: dict or None
+        """
+        record = self._find_record(key)
+        if record is None:
+            return None
+        return self._read_entry(record[1])
+
+    def find_by_name(self, name):
+        """Find entries by target file name.
+
+        :param str name:
+        :returns: dict of key to entry
+        """
+        entries = {}
+        if self.slot_count == 0:
+            return entries
+        name_hash = get_name_hash(name)
+        slot = name_hash & (self.slot_count - 1)
+        for i in range(self.slot_count):
+            slot_hash, number = SLOT.unpack_from(self.map, self.slots_offset + slot * SLOT.size)
+            if number == 0:
+                break
+            if slot_hash == name_hash:
+                key, location = self._get_record(number - 1)
+                entry = self._read_entry(location)
+                if (entry.get("target") or {}).get("name") == name:
+                    entries[self._decode_key(key)] = entry
+            slot = (slot + 1) & (self.slot_count - 1)
+        return entries
+
+    def find(self, key=None, **criteria):
+        """Find the entries matching every given criterion.
+
+        Takes the same criteria as :meth:`elodie.index.ManifestIndex.find`.
+
+        :returns: dict of key to entry
+        :raises TypeError: For unknown criteria.
+        """
+        matches = []
+        if key is not None:
+            number = self._find_number(key)
+            matches.append(set([number]) if number is not None else set())
+        for alternatives in get_ranges(**criteria):
+            found = set()
+            for table, low, high in alternatives:
+                found.update(self._find_range(table, low, high))
+            matches.append(found)
+
+        entries = {}
+        if len(matches) == 0:
+            return entries
+        matches.sort(key=len)
+        found = set(matches[0])
+        for match in matches[1:]:
+            found.intersection_update(match)
+        for number in sorted(found):
+            key, location = self._get_record(number)
+            entries[self._decode_key(key)] = self._read_entry(location)
+        return entries
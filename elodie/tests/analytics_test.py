@@ -0,0 +1,114 @@
+from __future__ import absolute_import
+# Project imports
+import csv
+import json
+import os
+import mock
+import shutil
+import sys
+
+from io import StringIO
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from . import helper
+from elodie import analytics
+
+os.environ['TZ'] = 'GMT'
+
+ENTRIES = [
+    ('aa', {
+        'sources': {
+            '/a.jpg': {'date_taken': [[2015, 12, 5, 0, 59, 26, 5, 339, 0]], 'camera_model': 'EOS 5D'},
+            '/backup/a.jpg': {'origin': 'Backup'},
+        },
+        'target': {'path': '2015-12-Dec', 'name': '2015-12-05-a.JPG', 'size': 100},
+    }),
+    ('bb', {
+        'sources': {'/b.jpg': {'date_taken': [[2015, 12, 6, 0, 0, 0, 6, 340, 0]], 'camera_model': 'EOS 5D'}},
+        'target': {'path': '2015-12-Dec', 'name': '2015-12-06-b.jpg', 'size': 50},
+    }),
+    ('cc', {
+        'sources': {'/c.mov': {}, '/d/c.mov': {}, '/e/c.mov': {}},
+        'target': {'path': 'Unknown', 'name': 'c.mov', 'size': 1000},
+    }),
+    ('dd', {'sources': {'/d.png': {}}}),
+]
+
+def _totals(top=analytics.TOP):
+    totals = analytics.Analytics(top)
+    for key, entry in ENTRIES:
+        totals.add(key, entry)
+    return totals
+
+def test_counter():
+    counter = analytics.Counter()
+    for value, size in (('b', 1), (None, 2), ('a', 3), ('b', 4)):
+        counter.add(value, size)
+
+    assert counter.rows() == [('b', 2, 5), ('a', 1, 3), (None, 1, 2)], counter.rows()
+    assert counter.rows(by_count=False) == [('a', 1, 3), ('b', 2, 5), (None, 1, 2)], counter.rows(False)
+
+def test_totals():
+    totals = _totals()
+
+    assert (totals.entries, totals.sources, totals.bytes) == (4, 7, 1150)
+    assert totals.get_rows('year') == [('2015', 2, 150), (None, 2, 1000)], totals.get_rows('year')
+    assert totals.get_rows('month') == [('2015-12', 2, 150), (None, 2, 1000)], totals.get_rows('month')
+    assert totals.get_rows('camera_model') == [('EOS 5D', 2, 150), (None, 2, 1000)], totals.get_rows('camera_model')
+    assert totals.get_rows('origin') == [(None, 3, 1050), ('Backup', 1, 100)], totals.get_rows('origin')
+    assert totals.get_rows('extension') == [('jpg', 2, 150), ('mov', 1, 1000), ('png', 1, 0)], totals.get_rows('extension')
+
+def test_unsized_entries_are_not_looked_up():
+    with mock.patch.object(analytics, 'get_source_size') as get_source_size:
+        totals = analytics.Analytics()
+        totals.add('aa', {'sources': {'a.jpg': {}}, 'target': {'path': '2015', 'name': 'a.jpg'}})
+
+    assert not get_source_size.called
+    assert totals.bytes == 0, totals.bytes
+    assert totals.unsized == 1, totals.unsized
+
+def test_size_from_source_file():
+    temporary_folder, folder = helper.create_working_folder()
+    source = os.path.join(folder, 'a.jpg')
+    with open(source, 'w') as f:
+        f.write('12345')
+
+    totals = analytics.Analytics(stat_sources=True)
+    # Written before targets recorded their size.
+    totals.add('aa', {'sources': {'/gone/a.jpg': {}, source: {}}, 'target': {'path': '2015', 'name': 'a.jpg'}})
+    totals.add('bb', {'sources': {'b.jpg': {}, '/gone/b.jpg': {}}, 'target': {'path': '2015', 'name': 'b.jpg'}})
+    totals.add('cc', {'sources': {}, 'target': {'path': '2015', 'name': 'c.jpg', 'size': 0}})
+
+    shutil.rmtree(folder)
+
+    assert totals.bytes == 5, totals.bytes
+    assert totals.unsized == 1, totals.unsized
+    assert totals.to_dict()['entries_without_size'] == 1, totals.to_dict()
+
+def test_duplicates():
+    totals = _totals(top=1)
+
+    assert totals.get_duplicates() == [(2, 1), (3, 1)], totals.get_duplicates()
+    assert totals.get_largest() == [{'checksum': 'cc', 'sources': 3, 'bytes': 1000, 'name': 'c.mov'}], totals.get_largest()
+
+def test_write_json():
+    output = StringIO()
+    _totals().write_json(output)
+
+    result = json.loads(output.getvalue())
+    assert result['entries'] == 4, result
+    assert result['year'][0] == {'value': '2015', 'entries': 2, 'bytes': 150}, result
+    assert [c['checksum'] for c in result['largest_duplicates']] == ['cc', 'aa'], result
+
+def test_write_csv():
+    output = StringIO()
+    _totals().write_csv(output)
+
+    rows = list(csv.reader(StringIO(output.getvalue())))
+    assert rows[0] == ['dimension', 'value', 'entries', 'bytes'], rows
+    assert rows[1] == ['total', '', '4', '1150'], rows
+    assert rows[2] == ['without_size', '', '1', ''], rows
+    assert ['extension', 'mov', '1', '1000'] in rows, rows
+    assert ['duplicates', '3', '1', ''] in rows, rows
+    assert ['largest_duplicates', 'cc', '3', '1000'] in rows, rows
@@ -0,0 +1,188 @@
+from __future__ import absolute_import
+# Project imports
+import json
+import mock
+import os
+import shutil
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from . import helper
+from elodie import compact
+from elodie import history
+from elodie import shards
+from elodie.manifest import HEADER_KEY
+from elodie.manifest import Manifest
+
+os.environ['TZ'] = 'GMT'
+
+NOW = 1500000000
+
+DAY = 86400
+
+def _read(manifest_path):
+    with shards.open_reader(manifest_path) as reader:
+        return dict(reader)
+
+def test_remove_nulls():
+    value, removed = compact.remove_nulls({'a': None, 'b': {'c': None, 'd': 1}, 'e': [{'f': None}, 2]})
+
+    assert value == {'b': {'d': 1}, 'e': [{}, 2]}, value
+    assert removed == 3, removed
+
+def test_source_checker_skips_missing_folders():
+    temporary_folder, folder = helper.create_working_folder()
+    existing = os.path.join(folder, 'a.jpg')
+    with open(existing, 'w') as f:
+        f.write('a')
+
+    checker = compact.SourceChecker()
+    with mock.patch('os.path.exists', wraps=os.path.exists) as exists:
+        results = [checker.exists(existing), checker.exists(os.path.join(folder, 'gone', 'b.jpg')),
+                   checker.exists(os.path.join(folder, 'gone', 'c.jpg'))]
+
+    shutil.rmtree(folder)
+
+    assert results == [True, False, False], results
+    assert exists.call_count == 1, exists.call_args_list
+
+def test_compact_entry_keeps_missing_sources_for_a_while():
+    checker = mock.Mock()
+    checker.exists.side_effect = lambda path: path == '/here.jpg'
+    entry = {
+        'sources': {
+            '/here.jpg': {'missing': NOW - DAY, 'album': None},
+            '/recent.jpg': {},
+            '/old.jpg': {'missing': NOW - 31 * DAY},
+        },
+        'target': {'path': '2015', 'name': 'a.jpg'},
+    }
+
+    entry, counts = compact.compact_entry(entry, checker, NOW, 30)
+
+    assert entry['sources'] == {'/here.jpg': {}, '/recent.jpg': {'missing': NOW}}, entry
+    assert list(entry['sources']) == ['/here.jpg', '/recent.jpg'], entry
+    assert counts == {'sources_removed': 1, 'sources_missing': 1, 'sources_relative': 0, 'nulls_removed': 1}, counts
+
+def test_compact_entry_without_sources_or_target():
+    checker = mock.Mock()
+    checker.exists.return_value = False
+
+    entry, counts = compact.compact_entry({'sources': {'/gone.jpg': {}}, 'target': None}, checker, NOW, 0)
+
+    assert entry is None, entry
+    assert counts['sources_removed'] == 1, counts
+
+def test_compact_file():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+    source = os.path.join(folder, 'a.jpg')
+    with open(source, 'w') as f:
+        f.write('a')
+    with open(manifest_path, 'w') as f:
+        json.dump({
+            'aa': {'sources': {source: {'album': None}, '/gone/a.jpg': {}}, 'target': {'path': '2015', 'name': 'a.jpg'}},
+            'bb': {'sources': {'/gone/b.jpg': {}}, 'target': None},
+        }, f, indent=2)
+
+    summary = compact.compact_file(manifest_path, 0, now=NOW)
+    entries = _read(manifest_path)
+    with open(manifest_path, 'r') as f:
+        header = json.load(f)[HEADER_KEY]
+
+    shutil.rmtree(folder)
+
+    assert entries == {'aa': {'sources': {source: {}}, 'target': {'path': '2015', 'name': 'a.jpg'}}}, entries
+    # Written without a header, so keyed on the legacy algorithm.
+    assert header == {'version': 2, 'algorithm': 'sha256'}, header
+    assert summary['entries'] == 1 and summary['entries_removed'] == 1, summary
+    assert summary['sources_removed'] == 2 and summary['nulls_removed'] == 2, summary
+    assert summary['bytes_after'] < summary['bytes_before'], summary
+
+def test_compact_file_keeps_relative_sources():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+    # Imported from a relative source, which exists next to the manifest
+    #   but not in the directory compact is run from.
+    os.makedirs(os.path.join(folder, 'import'))
+    with open(os.path.join(folder, 'import', 'a.jpg'), 'w') as f:
+        f.write('a')
+    with open(manifest_path, 'w') as f:
+        json.dump({'aa': {'sources': {'import/a.jpg': {}, 'gone/b.jpg': {}}}}, f)
+
+    cwd = os.getcwd()
+    os.chdir(helper.temp_dir())
+    try:
+        summary = compact.compact_file(manifest_path, 0, now=NOW)
+    finally:
+        os.chdir(cwd)
+    entries = _read(manifest_path)
+
+    shutil.rmtree(folder)
+
+    assert entries == {'aa': {'sources': {'gone/b.jpg': {}, 'import/a.jpg': {}}}}, entries
+    assert summary['sources_relative'] == 2 and summary['sources_removed'] == 0, summary
+
+def test_compact_file_dryrun():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+    with open(manifest_path, 'w') as f:
+        json.dump({'aa': {'sources': {'/gone/a.jpg': {}}, 'target': None}}, f)
+    with open(manifest_path, 'r') as f:
+        before = f.read()
+
+    summary = compact.compact_file(manifest_path, 0, dryrun=True, now=NOW)
+    with open(manifest_path, 'r') as f:
+        after = f.read()
+
+    shutil.rmtree(folder)
+
+    assert after == before, after
+    assert summary['entries_removed'] == 1, summary
+    assert summary['bytes_after'] is None, summary
+
+def test_compact_file_can_be_rolled_back():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+    entries = {'bb': {'sources': {'/gone/b.jpg': {}}, 'target': {'path': '2015', 'name': 'b.jpg'}}}
+    with open(manifest_path, 'w') as f:
+        json.dump(entries, f)
+
+    compact.compact_file(manifest_path, 0, now=NOW)
+    snapshots = history.list_snapshots(history.get_directory(manifest_path), 'manifest')
+    before = dict(history.reconstruct(snapshots, 0)[1])
+    after = dict(history.reconstruct(snapshots, len(snapshots) - 1)[1])
+
+    shutil.rmtree(folder)
+
+    assert len(snapshots) == 2, snapshots
+    assert before == entries, before
+    assert after == {'bb': {'sources': {}, 'target': {'path': '2015', 'name': 'b.jpg'}}}, after
+
+def test_compact_sharded():
+    temporary_folder, folder = helper.create_working_folder()
+    directory = os.path.join(folder, 'manifest')
+    manifest = Manifest().load_from_file(directory + os.sep)
+    manifest.merge({
+        'ab01': {'sources': {'/gone/a.jpg': {}}, 'target': {'path': '2015', 'name': 'a.jpg'}},
+        'cd01': {'sources': {'/gone/c.jpg': {}}},
+        'not-hex': {'sources': {'/gone/d.jpg': {}}, 'target': {'path': '2015', 'name': 'd.jpg'}},
+        'ef01': {'sources': {'/gone/e.jpg': {}}, 'target': {'path': '2015', 'name': 'e.jpg'}},
+    })
+    manifest.write()
+
+    summary = compact.compact_file(directory, 0, now=NOW)
+    entries = _read(directory)
+    names = sorted(os.listdir(directory))
+    cd_snapshots = history.list_snapshots(os.path.join(directory, history.DIRECTORY), 'cd')
+    cd_entries = history.reconstruct(cd_snapshots, len(cd_snapshots) - 1)[1]
+
+    shutil.rmtree(folder)
+
+    assert sorted(entries) == ['ab01', 'ef01', 'not-hex'], entries
+    assert entries['ab01']['sources'] == {}, entries
+    assert 'cd.json' not in names, names
+    assert summary['entries'] == 3 and summary['entries_removed'] == 1, summary
+    # The removed shard's history records it without entries.
+    assert len(cd_snapshots) == 2 and dict(cd_entries) == {}, cd_snapshots
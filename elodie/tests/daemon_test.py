@@ -0,0 +1,115 @@
+from __future__ import absolute_import
+# Project imports
+import json
+import mock
+import os
+import shutil
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from . import helper
+from elodie.daemon import Client
+from elodie.daemon import Daemon
+from elodie.daemon import DaemonError
+
+os.environ['TZ'] = 'GMT'
+
+def _start_daemon(folder):
+    socket_path = os.path.join(folder, 'daemon.sock')
+    daemon = Daemon(socket_path=socket_path, workers=1)
+    thread = threading.Thread(target=daemon.serve_forever)
+    thread.start()
+
+    client = Client(socket_path)
+    for i in range(100):
+        if client.is_running():
+            break
+        time.sleep(0.05)
+    return (daemon, thread, client)
+
+def _stop_daemon(thread, client):
+    client.request('shutdown')
+    thread.join(5)
+
+def test_client_not_running():
+    temporary_folder, folder = helper.create_working_folder()
+
+    client = Client(os.path.join(folder, 'daemon.sock'))
+    running = client.is_running()
+
+    shutil.rmtree(folder)
+
+    assert running is False
+
+def test_daemon_metadata():
+    temporary_folder, folder = helper.create_working_folder()
+
+    with mock.patch('elodie.external.pyexiftool.executable', helper.create_fake_exiftool(folder)):
+        daemon, thread, client = _start_daemon(folder)
+        try:
+            running = client.is_running()
+            metadata = client.get_metadata('/some/photo.jpg')
+        finally:
+            _stop_daemon(thread, client)
+
+    socket_exists = os.path.exists(client.socket_path)
+    shutil.rmtree(folder)
+
+    assert running is True
+    assert metadata['SourceFile'] == '/some/photo.jpg', metadata
+    assert metadata['EXIF:Make'] == 'Canon', metadata
+    assert socket_exists is False
+
+def test_daemon_relative_paths():
+    temporary_folder, folder = helper.create_working_folder()
+    photos = os.path.join(folder, 'photos')
+    os.makedirs(photos)
+
+    cwd = os.getcwd()
+    with mock.patch('elodie.external.pyexiftool.executable', helper.create_fake_exiftool(folder)):
+        daemon, thread, client = _start_daemon(folder)
+        try:
+            # Relative to the caller's directory, not the daemon's.
+            os.chdir(photos)
+            metadata = client.get_metadata('photo.jpg')
+            with mock.patch.object(client, 'request', return_value={'result': ''}) as request:
+                client.set_tags({'Title': 'x'}, 'photo.jpg')
+        finally:
+            os.chdir(cwd)
+            _stop_daemon(thread, client)
+
+    shutil.rmtree(folder)
+
+    assert metadata['SourceFile'] == os.path.join(photos, 'photo.jpg'), metadata
+    assert request.call_args[1]['file'] == os.path.join(photos, 'photo.jpg'), request.call_args
+
+def test_daemon_query():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+    with open(manifest_path, 'w') as f:
+        json.dump({
+            'abc': {'sources': {}, 'target': {'path': '2015/a.jpg', 'name': 'a.jpg'}},
+            'def': {'sources': {}, 'target': {'path': '2015/b.jpg', 'name': 'b.jpg'}},
+        }, f)
+
+    with mock.patch('elodie.external.pyexiftool.executable', helper.create_fake_exiftool(folder)):
+        daemon, thread, client = _start_daemon(folder)
+        try:
+            entries = client.query(manifest_path, {'name': 'b.jpg'})
+            queried = client.query(manifest_path, {'name_prefix': 'a'})
+            try:
+                client.request('unknown')
+                unknown_error = False
+            except DaemonError:
+                unknown_error = True
+        finally:
+            _stop_daemon(thread, client)
+
+    shutil.rmtree(folder)
+
+    assert list(entries.keys()) == ['def'], entries
+    assert list(queried.keys()) == ['abc'], queried
+    assert unknown_error is True
@@ -0,0 +1,143 @@
+from __future__ import absolute_import
+# Project imports
+import json
+import os
+import shutil
+import sys
+
+from nose.tools import assert_raises
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from . import helper
+from elodie import diff
+from elodie import hashing
+from elodie.manifest import Manifest
+
+os.environ['TZ'] = 'GMT'
+
+def _entry(source, name='photo.jpg', metadata=None):
+    return {"sources": {source: metadata or {}}, "target": {"path": "2015-12-Dec", "name": name}}
+
+def _write(manifest_path, entries, algorithm='sha256'):
+    manifest = Manifest(algorithm=algorithm)
+    manifest.entries = entries
+    manifest.dump(manifest_path)
+
+class _Report(object):
+    def __init__(self):
+        self.lines = []
+    def write(self, line):
+        self.lines.append(json.loads(line))
+
+def test_join():
+    joined = list(diff.join([('a', 1), ('c', 3), ('d', 4)], [('b', 2), ('c', 33), ('e', 5)]))
+
+    assert joined == [('a', 1, None), ('b', None, 2), ('c', 3, 33), ('d', 4, None), ('e', None, 5)], joined
+
+def test_get_changes():
+    assert diff.get_changes(_entry('/a.jpg'), _entry('/a.jpg')) == []
+    assert diff.get_changes(_entry('/a.jpg'), _entry('/b.jpg')) == ['sources']
+    assert diff.get_changes(_entry('/a.jpg'), _entry('/a.jpg', metadata={'album': 'x'})) == ['metadata']
+    assert diff.get_changes(_entry('/a.jpg'), _entry('/b.jpg', 'other.jpg')) == ['sources', 'target']
+
+def test_diff_manifests():
+    temporary_folder, folder = helper.create_working_folder()
+    old_path = os.path.join(folder, 'old.json')
+    new_path = os.path.join(folder, 'new.json')
+    _write(old_path, {'aa': _entry('/a.jpg'), 'bb': _entry('/b.jpg'), 'cc': _entry('/c.jpg')})
+    _write(new_path, {'cc': _entry('/c.jpg'), 'bb': _entry('/backup/b.jpg'), 'dd': _entry('/d.jpg')})
+
+    report = _Report()
+    # Runs of one entry are spilled to files and merged back.
+    summary = diff.diff_paths(old_path, new_path, report, run_size=1)
+
+    shutil.rmtree(folder)
+
+    statuses = [(r['checksum'], r['status']) for r in report.lines]
+    assert statuses == [('aa', 'removed'), ('bb', 'changed'), ('dd', 'added')], statuses
+    assert report.lines[1]['changes'] == ['sources'], report.lines[1]
+    assert report.lines[1]['sources_added'] == ['/backup/b.jpg'], report.lines[1]
+    assert report.lines[1]['sources_removed'] == ['/b.jpg'], report.lines[1]
+    assert report.lines[1]['old'] == _entry('/b.jpg'), report.lines[1]
+    assert report.lines[2]['old'] is None, report.lines[2]
+    assert summary == {'added': 1, 'removed': 1, 'changed': 1, 'unchanged': 1}, summary
+
+def test_diff_changed_sources():
+    records = list(diff.diff(
+        [('aa', {'sources': {'/a.jpg': {}, '/b.jpg': {}}}), ('bb', _entry('/b.jpg'))],
+        [('aa', {'sources': {'/b.jpg': {}, '/c.jpg': {}, '/d.jpg': {}}}), ('bb', _entry('/b.jpg', 'other.jpg'))]
+    ))
+
+    assert records[0]['sources_added'] == ['/c.jpg', '/d.jpg'], records[0]
+    assert records[0]['sources_removed'] == ['/a.jpg'], records[0]
+    assert records[1]['changes'] == ['target'], records[1]
+    assert records[1]['sources_added'] == [] and records[1]['sources_removed'] == [], records[1]
+
+def test_diff_only_some_statuses():
+    temporary_folder, folder = helper.create_working_folder()
+    old_path = os.path.join(folder, 'old.json')
+    new_path = os.path.join(folder, 'new.json')
+    _write(old_path, {'aa': _entry('/a.jpg'), 'bb': _entry('/b.jpg')})
+    _write(new_path, {'bb': _entry('/b.jpg'), 'cc': _entry('/c.jpg')})
+
+    report = _Report()
+    diff.diff_paths(old_path, new_path, report, statuses=['unchanged', 'added'])
+
+    shutil.rmtree(folder)
+
+    statuses = [(r['checksum'], r['status']) for r in report.lines]
+    assert statuses == [('bb', 'unchanged'), ('cc', 'added')], statuses
+
+def test_diff_manifest_and_directory():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+    library = os.path.join(folder, 'library')
+    os.makedirs(os.path.join(library, '.manifest_history'))
+    for name, content in (('kept.jpg', b'kept'), ('copy.jpg', b'kept'), ('new.jpg', b'new'), ('.hidden', b'x')):
+        with open(os.path.join(library, name), 'wb') as f:
+            f.write(content)
+    with open(os.path.join(library, '.manifest_history', 'old.json'), 'wb') as f:
+        f.write(b'{}')
+    kept = hashing.checksum(os.path.join(library, 'kept.jpg'), 'sha256')
+    new = hashing.checksum(os.path.join(library, 'new.jpg'), 'sha256')
+    _write(manifest_path, {kept: _entry('/a.jpg'), 'ff': _entry('/gone.jpg')})
+
+    report = _Report()
+    summary = diff.diff_paths(manifest_path, library, report, workers=2)
+
+    shutil.rmtree(folder)
+
+    statuses = dict((r['checksum'], r['status']) for r in report.lines)
+    assert statuses == {new: 'added', 'ff': 'removed'}, statuses
+    assert summary['unchanged'] == 1, summary
+
+def test_diff_uses_manifest_hashing_for_directory():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+    library = os.path.join(folder, 'library')
+    os.makedirs(library)
+    with open(os.path.join(library, 'a.jpg'), 'wb') as f:
+        f.write(b'a')
+    key = hashing.checksum(os.path.join(library, 'a.jpg'), 'blake2b')
+    _write(manifest_path, {key: _entry('/a.jpg')}, algorithm='blake2b')
+
+    report = _Report()
+    summary = diff.diff_paths(library, manifest_path, report)
+
+    shutil.rmtree(folder)
+
+    assert report.lines == [], report.lines
+    assert summary['unchanged'] == 1, summary
+
+def test_diff_different_algorithm_fails():
+    temporary_folder, folder = helper.create_working_folder()
+    old_path = os.path.join(folder, 'old.json')
+    new_path = os.path.join(folder, 'new.json')
+    _write(old_path, {'aa': _entry('/a.jpg')}, 'sha256')
+    _write(new_path, {'bb': _entry('/b.jpg')}, 'blake2b')
+
+    assert_raises(ValueError, diff.diff_paths, old_path, new_path, _Report())
+    assert_raises(ValueError, diff.diff_paths, folder, folder, _Report())
+
+    shutil.rmtree(folder)
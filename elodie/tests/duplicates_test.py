@@ -0,0 +1,140 @@
+from __future__ import absolute_import
+# Project imports
+import mock
+import os
+import shutil
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from . import helper
+from elodie import hashing
+from elodie.duplicates import DuplicateDetector
+from elodie.manifest import Manifest
+
+os.environ['TZ'] = 'GMT'
+
+def _entry(source, size):
+    return {"sources": {source: {}}, "target": {"path": "2015", "name": os.path.basename(source), "size": size}}
+
+def _write(path, content):
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+def test_check_unique_size_is_not_hashed():
+    temporary_folder, folder = helper.create_working_folder()
+    existing = _write(os.path.join(folder, 'existing.jpg'), b'a' * 10)
+    origin = _write(os.path.join(folder, 'origin.jpg'), b'b' * 20)
+
+    manifest = Manifest(algorithm='sha256')
+    manifest.merge({hashing.checksum(existing): _entry(existing, 10)})
+    duplicates = DuplicateDetector(manifest, workers=1)
+    with mock.patch.object(manifest, 'checksum') as checksum:
+        result = duplicates.check(origin)
+    duplicates.finish()
+
+    shutil.rmtree(folder)
+
+    assert result == (False, None, None), result
+    assert checksum.called is False
+
+def test_check_same_size_different_fingerprint():
+    temporary_folder, folder = helper.create_working_folder()
+    existing = _write(os.path.join(folder, 'existing.jpg'), b'a' * 10)
+    origin = _write(os.path.join(folder, 'origin.jpg'), b'b' * 10)
+
+    manifest = Manifest(algorithm='sha256')
+    manifest.merge({hashing.checksum(existing): _entry(existing, 10)})
+    duplicates = DuplicateDetector(manifest, workers=1)
+    result = duplicates.check(origin)
+    duplicates.finish()
+
+    shutil.rmtree(folder)
+
+    assert result == (False, None, None), result
+    assert duplicates.hashed_count == 0, duplicates.hashed_count
+
+def test_check_duplicate_is_hashed():
+    temporary_folder, folder = helper.create_working_folder()
+    existing = _write(os.path.join(folder, 'existing.jpg'), b'a' * 10)
+    origin = _write(os.path.join(folder, 'origin.jpg'), b'a' * 10)
+    checksum = hashing.checksum(existing)
+
+    manifest = Manifest(algorithm='sha256')
+    manifest.merge({checksum: _entry(existing, 10)})
+    duplicates = DuplicateDetector(manifest, workers=1)
+    result = duplicates.check(origin)
+    duplicates.finish()
+
+    shutil.rmtree(folder)
+
+    assert result == (True, checksum, None), result
+
+def test_check_unsized_manifest_is_hashed():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = _write(os.path.join(folder, 'origin.jpg'), b'a' * 10)
+    checksum = hashing.checksum(origin)
+
+    manifest = Manifest(algorithm='sha256')
+    manifest.merge({'abc': {"sources": {}, "target": {"path": "2015", "name": "a.jpg"}}})
+    duplicates = DuplicateDetector(manifest, workers=1)
+    result = duplicates.check(origin)
+    duplicates.finish()
+
+    shutil.rmtree(folder)
+
+    assert result == (False, checksum, None), result
+
+def test_add_hashes_in_background():
+    temporary_folder, folder = helper.create_working_folder()
+    first = _write(os.path.join(folder, 'first.jpg'), b'a' * 10)
+    second = _write(os.path.join(folder, 'second.jpg'), b'a' * 10)
+
+    manifest = Manifest(algorithm='blake2b')
+    duplicates = DuplicateDetector(manifest, workers=1)
+    first_result = duplicates.check(first)
+    duplicates.add(first, _entry(first, 10), first_result[1])
+    # Same size and content as a file added earlier in the run.
+    second_result = duplicates.check(second)
+    success = duplicates.finish()
+
+    shutil.rmtree(folder)
+
+    assert first_result == (False, None, None), first_result
+    assert second_result[0] is True, second_result
+    assert success is True
+    assert list(manifest.entries.keys()) == [second_result[1]], manifest.entries
+
+def test_check_unsized_other_extension_is_not_hashed():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = _write(os.path.join(folder, 'origin.jpg'), b'a' * 10)
+
+    manifest = Manifest(algorithm='sha256')
+    manifest.merge({'abc': {"sources": {"/a.mov": {}}, "target": {"path": "2015", "name": "a.mov"}}})
+    duplicates = DuplicateDetector(manifest, workers=1)
+    result = duplicates.check(origin)
+    duplicates.finish()
+
+    shutil.rmtree(folder)
+
+    assert result == (False, None, None), result
+    assert duplicates.hashed_count == 0, duplicates.hashed_count
+
+def test_sharded_manifest_is_not_loaded():
+    temporary_folder, folder = helper.create_working_folder()
+    existing = _write(os.path.join(folder, 'existing.jpg'), b'a' * 10)
+    directory = os.path.join(folder, 'manifest')
+    manifest = Manifest(algorithm='sha256').load_from_file(directory + os.sep)
+    manifest.merge({hashing.checksum(existing): _entry(existing, 10)})
+    manifest.write()
+
+    manifest = Manifest().load_from_file(directory)
+    duplicates = DuplicateDetector(manifest, workers=1)
+    loaded = sorted(manifest.entries.loaded)
+    duplicates.finish()
+
+    shutil.rmtree(folder)
+
+    assert loaded == [], loaded
+    assert list(duplicates.sizes.keys()) == [10], duplicates.sizes
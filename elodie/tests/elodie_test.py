@@ -17,6 +17,7 @@ sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirna
 import helper
 elodie = load_source('elodie', os.path.abspath('{}/../../elodie.py'.format(os.path.dirname(os.path.realpath(__file__)))))
 
+from elodie import hashing
 from elodie.config import load_config
 from elodie.manifest import Manifest
 from elodie.media.audio import Audio
@@ -199,6 +200,76 @@ def test_import_file_allow_duplicate_true():
     assert dest_path2 is not None
     assert dest_path1 == dest_path2
 
+def test_import_file_trusts_recorded_target():
+    temporary_folder, folder = helper.create_working_folder()
+    temporary_folder_destination, folder_destination = helper.create_working_folder()
+
+    origin = os.path.join(folder, 'plain.jpg')
+    shutil.copyfile(helper.get_file('plain.jpg'), origin)
+    # Another version of the same photo, imported to the same name.
+    edited = os.path.join(folder, 'edited.jpg')
+    shutil.copyfile(helper.get_file('plain.jpg'), edited)
+    with open(edited, 'ab') as f:
+        f.write(b'edited')
+    config = {"targets": [{"base_path": folder_destination}]}
+    manifest = Manifest()
+    destination = os.path.join(folder_destination, '2015', 'photo.jpg')
+
+    def generate_manifest(file_path, target, metadata_dict, media, place=None):
+        return {"sources": {file_path: {}}, "target": {"path": "2015", "name": "photo.jpg"}}
+
+    with mock.patch.object(elodie.FILESYSTEM, 'generate_manifest', side_effect=generate_manifest):
+        status1 = elodie.import_file(origin, config, manifest, {})
+        with mock.patch('elodie.hashing.digest', wraps=hashing.digest) as mock_digest, \
+                mock.patch('elodie.hashing.checksum', wraps=hashing.checksum) as mock_checksum:
+            status2 = elodie.import_file(edited, config, manifest, {})
+    hashed = [c[0][0] for c in mock_digest.call_args_list + mock_checksum.call_args_list]
+    checksum = manifest.checksum(edited)
+    origin_checksum = manifest.checksum(origin)
+    recorded = manifest.entries[origin_checksum]['target']
+    target_files = sorted(os.listdir(os.path.join(folder_destination, '2015')))
+
+    shutil.rmtree(folder)
+    shutil.rmtree(folder_destination)
+
+    assert status1 is True, status1
+    assert status2 is True, status2
+    assert destination not in hashed, hashed
+    assert [c[0][0] for c in mock_digest.call_args_list] == [edited], mock_digest.call_args_list
+    assert target_files == ['photo.{}.jpg'.format(checksum), 'photo.jpg'], target_files
+    assert recorded['checksum'] == origin_checksum, recorded
+
+def test_get_places():
+    temporary_folder, folder = helper.create_working_folder()
+    files = []
+    for name, source in (('a.jpg', 'with-location.jpg'), ('b.jpg', 'with-location.jpg'), ('c.jpg', 'plain.jpg')):
+        files.append(os.path.join(folder, name))
+        shutil.copyfile(helper.get_file(source), files[-1])
+    location_db = os.path.join(folder, 'location.json')
+    target = {"base_path": folder, "file_path_pattern": '%city|"Unknown Location"'}
+
+    metadata_dict, exiftool_batch = elodie.read_native_metadata(files)
+    with mock.patch('elodie.constants.location_db', location_db), \
+            mock.patch('elodie.geolocation.__LOCATION_CACHE__', None), \
+            mock.patch('elodie.geolocation.is_gazetteer_selected', return_value=False), \
+            mock.patch('elodie.geolocation.get_gazetteer', return_value=None), \
+            mock.patch('elodie.geolocation.get_client') as get_client:
+        client = get_client.return_value
+        client.quantize.side_effect = lambda lat, lon: (round(lat, 3), round(lon, 3))
+        client.reverse_batch.side_effect = lambda coordinates: [{'address': {'city': 'Sunnyvale'}}] * len(coordinates)
+        places = elodie.get_places(files, metadata_dict, target)
+        unused = elodie.get_places(files, metadata_dict, {"file_path_pattern": '%year'})
+
+    shutil.rmtree(folder)
+
+    assert exiftool_batch == [], exiftool_batch
+    assert sorted(places) == files[:2], places
+    assert places[files[0]] == {'city': 'Sunnyvale', 'default': 'Sunnyvale'}, places
+    # Looked up in one batch.
+    assert client.reverse_batch.call_count == 1, client.reverse_batch.call_count
+    assert len(client.reverse_batch.call_args[0][0]) == 2, client.reverse_batch.call_args
+    assert unused == {}, unused
+
 def test_import_file_send_to_trash_false():
     temporary_folder, folder = helper.create_working_folder()
     temporary_folder_destination, folder_destination = helper.create_working_folder()
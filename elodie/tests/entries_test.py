@@ -0,0 +1,113 @@
+from __future__ import absolute_import
+# Project imports
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from elodie.entries import CompactEntries
+from elodie.manifest import Manifest
+
+os.environ['TZ'] = 'GMT'
+
+KEY = 'c0ffee0123456789'
+
+ENTRY = {
+    'sources': {
+        '/photos/2015/a.jpg': {
+            'date_taken': [[2015, 12, 5, 0, 59, 26, 5, 339, 0]],
+            'camera_make': 'Canon',
+            'camera_model': 'EOS 5D',
+            'latitude': 37.1234,
+            'album': None,
+            'flagged': True,
+        },
+        'a.jpg': {},
+    },
+    'target': {'path': '2015-12-Dec/Unknown Location', 'name': '2015-12-05_00-59-26-a.jpg', 'size': 123456789, 'chunks': ['ab', 'cd']},
+    'seen': 1450000000,
+}
+
+def test_round_trip():
+    entries = CompactEntries()
+    entries[KEY] = ENTRY
+
+    assert entries[KEY] == ENTRY, entries[KEY]
+    assert entries[KEY]['sources']['/photos/2015/a.jpg']['flagged'] is True
+    assert list(entries) == [KEY]
+    assert dict(entries.items()) == {KEY: ENTRY}
+
+def test_keys_which_are_not_hex():
+    entries = CompactEntries({'not-hex': ENTRY, 'ABCD': ENTRY, 'abc': ENTRY})
+
+    assert sorted(entries) == ['ABCD', 'abc', 'not-hex']
+    assert entries['ABCD'] == ENTRY
+    assert 'abcd' not in entries
+
+def test_keys_with_whitespace_are_not_hex():
+    entries = CompactEntries({'abcd': ENTRY, 'ab cd': {'sources': {}}, 'abcd\n': {'sources': {}}})
+
+    assert sorted(entries) == ['ab cd', 'abcd', 'abcd\n']
+    assert entries['abcd'] == ENTRY
+    assert entries['ab cd'] == {'sources': {}}
+
+def test_contains_len_and_delete():
+    entries = CompactEntries({KEY: ENTRY})
+
+    assert KEY in entries
+    assert 'deadbeef' not in entries
+    assert len(entries) == 1
+
+    del entries[KEY]
+
+    assert KEY not in entries
+    assert len(entries) == 0
+
+def test_values_are_shared():
+    entries = CompactEntries()
+    entries['aa'] = {'sources': {'/photos/a.jpg': {'camera_make': ''.join(['Can', 'on'])}}}
+    entries['bb'] = {'sources': {'/photos/b.jpg': {'camera_make': ''.join(['Ca', 'non'])}}}
+
+    a = entries.records[entries.encode_key('aa')]
+    b = entries.records[entries.encode_key('bb')]
+    # The directory prefix, the metadata's keys and the camera make.
+    assert a.sources[0] is b.sources[0]
+    assert a.sources[2][0] is b.sources[2][0]
+    assert a.sources[2][1] is b.sources[2][1]
+
+def test_only_shared_fields_are_interned():
+    entries = CompactEntries({KEY: ENTRY})
+    entries['aa'] = {'sources': {'/photos/b.jpg': {'title': 'Beach', 'camera_make': 'Apple'}},
+                     'target': {'path': '2016', 'name': 'b.jpg', 'mtime_ns': 1450000000000000000}}
+    del entries['aa']
+
+    assert 'Canon' in entries.values
+    assert '2015-12-Dec/Unknown Location' in entries.values
+    assert '2015-12-05_00-59-26-a.jpg' not in entries.values
+    assert 'Beach' not in entries.values
+    assert 1450000000 not in entries.values
+
+def test_reading_returns_a_copy():
+    entries = CompactEntries({KEY: ENTRY})
+
+    entry = entries[KEY]
+    entry['target']['name'] = 'changed.jpg'
+
+    assert entries[KEY]['target']['name'] == '2015-12-05_00-59-26-a.jpg'
+
+def test_manifest_stores_entries_compactly():
+    manifest = Manifest()
+    manifest.entries = {KEY: ENTRY}
+
+    assert isinstance(manifest.entries, CompactEntries)
+    assert manifest.entries[KEY] == ENTRY
+
+def test_manifest_merge():
+    manifest = Manifest()
+    manifest.merge({KEY: ENTRY})
+    manifest.merge({KEY: {'sources': {'/backup/a.jpg': {'origin': 'Backup'}}}})
+
+    entry = manifest.entries[KEY]
+    assert sorted(entry['sources']) == ['/backup/a.jpg', '/photos/2015/a.jpg', 'a.jpg']
+    assert entry['target'] == ENTRY['target']
+    assert isinstance(manifest.entries, CompactEntries)
@@ -955,3 +955,134 @@ full_path=%year/%album|%month|%"foo"/%month
         del load_config.config
 
     assert path_definition == expected, path_definition
+
+def _execute_manifest_entry(name='photo.jpg'):
+    return {"sources": {}, "target": {"path": "2015", "name": name}}
+
+def test_execute_manifest_records_target_state():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = os.path.join(folder, 'origin.jpg')
+    shutil.copyfile(helper.get_file('plain.jpg'), origin)
+    base_path = os.path.join(folder, 'target')
+    manifest_entry = _execute_manifest_entry()
+
+    filesystem = FileSystem()
+    status = filesystem.execute_manifest(origin, manifest_entry, base_path)
+    stat = os.stat(os.path.join(base_path, '2015', 'photo.jpg'))
+
+    shutil.rmtree(folder)
+
+    assert status is True, status
+    assert manifest_entry['target']['size'] == stat.st_size, manifest_entry
+    assert manifest_entry['target']['mtime_ns'] == stat.st_mtime_ns, manifest_entry
+
+@mock.patch('elodie.filesystem.hashing.checksum')
+def test_execute_manifest_trusts_unchanged_target(mock_checksum):
+    temporary_folder, folder = helper.create_working_folder()
+    origin = os.path.join(folder, 'origin.jpg')
+    shutil.copyfile(helper.get_file('plain.jpg'), origin)
+    base_path = os.path.join(folder, 'target')
+
+    filesystem = FileSystem()
+    recorded_entry = _execute_manifest_entry()
+    filesystem.execute_manifest(origin, recorded_entry, base_path)
+    status = filesystem.execute_manifest(origin, _execute_manifest_entry(), base_path,
+                                         recorded_target=recorded_entry['target'])
+
+    shutil.rmtree(folder)
+
+    assert status is True, status
+    assert mock_checksum.called is False
+
+def test_execute_manifest_records_checksum():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = os.path.join(folder, 'origin.jpg')
+    shutil.copyfile(helper.get_file('plain.jpg'), origin)
+    base_path = os.path.join(folder, 'target')
+    manifest_entry = _execute_manifest_entry()
+
+    FileSystem().execute_manifest(origin, manifest_entry, base_path, checksum='abc')
+
+    shutil.rmtree(folder)
+
+    assert manifest_entry['target']['checksum'] == 'abc', manifest_entry
+
+@mock.patch('elodie.filesystem.hashing.checksum')
+def test_execute_manifest_trusted_target_syncs_mtime(mock_checksum):
+    temporary_folder, folder = helper.create_working_folder()
+    origin = os.path.join(folder, 'origin.jpg')
+    shutil.copyfile(helper.get_file('plain.jpg'), origin)
+    base_path = os.path.join(folder, 'target')
+    destination = os.path.join(base_path, '2015', 'photo.jpg')
+
+    filesystem = FileSystem()
+    recorded_entry = _execute_manifest_entry()
+    filesystem.execute_manifest(origin, recorded_entry, base_path, checksum='abc')
+    os.utime(origin, (1000000000, 1000000000))
+    manifest_entry = _execute_manifest_entry()
+    status = filesystem.execute_manifest(origin, manifest_entry, base_path, recorded_target=recorded_entry['target'],
+                                         checksum='abc')
+    mtime = os.path.getmtime(destination)
+
+    shutil.rmtree(folder)
+
+    assert status is True, status
+    assert mock_checksum.called is False
+    # Copied again, so the target has the source's metadata.
+    assert mtime == 1000000000, mtime
+    assert manifest_entry['target']['mtime_ns'] == 1000000000 * 1000000000, manifest_entry
+
+def test_execute_manifest_paranoid_compares_target():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = os.path.join(folder, 'origin.jpg')
+    shutil.copyfile(helper.get_file('plain.jpg'), origin)
+    base_path = os.path.join(folder, 'target')
+
+    filesystem = FileSystem()
+    recorded_entry = _execute_manifest_entry()
+    filesystem.execute_manifest(origin, recorded_entry, base_path)
+    with mock.patch('elodie.filesystem.hashing.checksum', return_value='abc') as mock_checksum:
+        status = filesystem.execute_manifest(origin, _execute_manifest_entry(), base_path,
+                                             recorded_target=recorded_entry['target'], paranoid=True)
+
+    shutil.rmtree(folder)
+
+    assert status is True, status
+    assert mock_checksum.call_count == 2, mock_checksum.call_count
+
+def test_execute_manifest_compares_changed_target():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = os.path.join(folder, 'origin.jpg')
+    shutil.copyfile(helper.get_file('plain.jpg'), origin)
+    base_path = os.path.join(folder, 'target')
+
+    filesystem = FileSystem()
+    recorded_entry = _execute_manifest_entry()
+    filesystem.execute_manifest(origin, recorded_entry, base_path)
+    with open(os.path.join(base_path, '2015', 'photo.jpg'), 'ab') as f:
+        f.write(b'edited')
+    status = filesystem.execute_manifest(origin, _execute_manifest_entry(), base_path,
+                                         recorded_target=recorded_entry['target'])
+    target_files = sorted(os.listdir(os.path.join(base_path, '2015')))
+
+    shutil.rmtree(folder)
+
+    assert status is True, status
+    assert len(target_files) == 2, target_files
+
+def test_get_folder_path_with_place():
+    filesystem = FileSystem()
+    target = {"file_path_pattern": '%city|"Unknown Location"/%country'}
+    place = {'default': u'Sunnyvale', 'city': u'Sunnyvale', 'country': u'United States of America'}
+
+    path = filesystem.get_folder_path({'place': place}, target)
+    fallback = filesystem.get_folder_path({'place': {'default': u'Unknown Location'}}, target)
+
+    assert filesystem.uses_places(target) is True
+    assert path == os.path.join('Sunnyvale', 'United States of America'), path
+    assert fallback == 'Unknown Location', fallback
+
+def test_uses_places_without_places():
+    filesystem = FileSystem()
+
+    assert filesystem.uses_places({"file_path_pattern": '%year/%album|"Unsorted"'}) is False
@@ -0,0 +1,143 @@
+from __future__ import absolute_import
+# Project imports
+import io
+import mock
+import os
+import random
+import shutil
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from . import helper
+from elodie import geolocation
+from elodie.gazetteer import Gazetteer
+from elodie.gazetteer import haversine
+
+os.environ['TZ'] = 'GMT'
+
+CITIES = [
+    ('5400075', 'Sunnyvale', 37.36883, -122.03635, 'US', 'CA'),
+    ('5392171', 'San Jose', 37.33939, -121.89496, 'US', 'CA'),
+    ('5128581', 'New York City', 40.71427, -74.00597, 'US', 'NY'),
+    ('2988507', 'Paris', 48.85341, 2.3488, 'FR', '11'),
+    ('4032243', 'Nuku\'alofa', -21.13938, -175.2018, 'TO', '02'),
+    ('2110257', 'Tarawa', 1.3278, 172.97696, 'KI', '00'),
+]
+
+def _write_gazetteer(folder, with_names=True):
+    cities_path = os.path.join(folder, 'cities1000.txt')
+    with io.open(cities_path, 'w', encoding='utf-8') as f:
+        for geonameid, name, lat, lon, country, admin1 in CITIES:
+            columns = [geonameid, name, name, '', str(lat), str(lon), 'P', 'PPL', country, '', admin1, '', '', '', '1000', '', '10', 'UTC', '2020-01-01']
+            f.write(u'\t'.join(columns) + u'\n')
+    if with_names:
+        with io.open(os.path.join(folder, 'admin1CodesASCII.txt'), 'w', encoding='utf-8') as f:
+            f.write(u'US.CA\tCalifornia\tCalifornia\t5332921\n')
+            f.write(u'US.NY\tNew York\tNew York\t5128638\n')
+        with io.open(os.path.join(folder, 'countryInfo.txt'), 'w', encoding='utf-8') as f:
+            f.write(u'#ISO\tISO3\tISO-Numeric\tfips\tCountry\n')
+            f.write(u'US\tUSA\t840\tUS\tUnited States\n')
+            f.write(u'FR\tFRA\t250\tFR\tFrance\n')
+    return cities_path
+
+def test_place_name():
+    temporary_folder, folder = helper.create_working_folder()
+    gazetteer = Gazetteer().load(_write_gazetteer(folder))
+    shutil.rmtree(folder)
+
+    place = gazetteer.place_name(37.37, -122.04)
+
+    assert len(gazetteer) == len(CITIES), len(gazetteer)
+    assert place == {'city': 'Sunnyvale', 'state': 'California', 'country': 'United States', 'default': 'Sunnyvale'}, place
+
+def test_place_name_without_code_lists():
+    temporary_folder, folder = helper.create_working_folder()
+    gazetteer = Gazetteer().load(_write_gazetteer(folder, with_names=False))
+    shutil.rmtree(folder)
+
+    place = gazetteer.place_name(48.86, 2.35)
+
+    assert place == {'city': 'Paris', 'state': '11', 'country': 'FR', 'default': 'Paris'}, place
+
+def test_place_name_too_far():
+    temporary_folder, folder = helper.create_working_folder()
+    gazetteer = Gazetteer().load(_write_gazetteer(folder))
+    shutil.rmtree(folder)
+
+    # The middle of the Atlantic.
+    assert gazetteer.place_name(30.0, -40.0) is None
+    assert gazetteer.place_name(30.0, -40.0, max_distance=20000)['city'] == 'New York City'
+
+def test_nearest_across_antimeridian():
+    gazetteer = Gazetteer()
+    gazetteer.add(-21.13938, -175.2018, 'Nuku\'alofa')
+    gazetteer.add(-21.2, 179.9, 'West')
+    gazetteer.build_index()
+
+    index, distance = gazetteer.nearest(-21.2, -179.9)
+
+    assert gazetteer.cities[index] == 'West', index
+    assert distance < 25, distance
+
+def test_nearest_matches_brute_force():
+    gazetteer = Gazetteer(cell_size=1)
+    coordinates = [(random.uniform(30, 40), random.uniform(0, 20)) for i in range(500)]
+    for i, (lat, lon) in enumerate(coordinates):
+        gazetteer.add(lat, lon, str(i))
+    gazetteer.build_index()
+
+    for i in range(50):
+        lat, lon = random.uniform(30, 40), random.uniform(0, 20)
+        result = gazetteer.nearest(lat, lon, max_distance=200)
+        distances = [haversine(lat, lon, a, b) for a, b in coordinates]
+        expected = min(distances)
+        if expected > 200:
+            assert result is None, result
+        else:
+            # Equal up to the error of the flat projection used for ranking.
+            assert result[1] <= expected * 1.02 + 0.01, (result, expected)
+
+def test_geolocation_uses_gazetteer():
+    temporary_folder, folder = helper.create_working_folder()
+    cities_path = _write_gazetteer(folder)
+    config_path = os.path.join(folder, 'config.ini')
+    with open(config_path, 'w') as f:
+        f.write('[Geolocation]\nprovider=gazetteer\ngazetteer={}\n'.format(cities_path))
+
+    with mock.patch('elodie.config.config_file', config_path), \
+            mock.patch('elodie.geolocation.__GAZETTEER__', None), \
+            mock.patch('elodie.geolocation.lookup') as lookup:
+        if hasattr(geolocation.load_config, 'config'):
+            del geolocation.load_config.config
+        place = geolocation.place_name(37.34, -121.9)
+        del geolocation.load_config.config
+
+    shutil.rmtree(folder)
+
+    assert place['city'] == 'San Jose', place
+    assert lookup.called is False
+
+def test_geolocation_missing_gazetteer_stays_offline():
+    temporary_folder, folder = helper.create_working_folder()
+    config_path = os.path.join(folder, 'config.ini')
+    with open(config_path, 'w') as f:
+        f.write('[Geolocation]\nprovider=gazetteer\ngazetteer={}\n'.format(os.path.join(folder, 'missing.txt')))
+
+    with mock.patch('elodie.config.config_file', config_path), \
+            mock.patch('elodie.geolocation.__GAZETTEER__', None), \
+            mock.patch('elodie.geolocation.__GAZETTEER_MISSING__', None), \
+            mock.patch('elodie.geolocation.get_location_cache') as get_location_cache, \
+            mock.patch('elodie.geolocation.get_client') as get_client, \
+            mock.patch('elodie.log.error') as error:
+        get_location_cache.return_value.get_name.return_value = None
+        if hasattr(geolocation.load_config, 'config'):
+            del geolocation.load_config.config
+        places = [geolocation.place_name(37.34, -121.9), geolocation.place_name(40.7, -74.0)]
+        del geolocation.load_config.config
+
+    shutil.rmtree(folder)
+
+    assert places == [{'default': 'Unknown Location'}] * 2, places
+    assert get_client.called is False
+    assert error.call_count == 1, error.call_args_list
@@ -0,0 +1,154 @@
+from __future__ import absolute_import
+# Project imports
+import json
+import mock
+import os
+import shutil
+import sys
+import threading
+
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from . import helper
+from elodie import geolocation
+from elodie.geocoding import GeocodingClient
+
+os.environ['TZ'] = 'GMT'
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    # Keeps connections open between requests.
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = dict((k, v[0]) for k, v in parse_qs(url.query).items())
+        self.server.requests.append((url.path, query))
+        self.server.clients.add(self.client_address)
+        if query.get('key') != 'valid':
+            body = {'error': 'Invalid key'}
+        elif url.path == '/nominatim/v1/reverse.php':
+            body = {'address': {'city': 'City {} {}'.format(query['lat'], query['lon']), 'country': 'Country'}}
+        else:
+            body = {'results': [{'locations': [{'latLng': {'lat': 1.5, 'lng': 2.5}, 'geocodeQuality': 'CITY'}]}]}
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    server.requests = []
+    server.clients = set()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return (server, 'http://127.0.0.1:{}'.format(server.server_address[1]))
+
+def _stop_server(server):
+    server.shutdown()
+    server.server_close()
+
+def test_quantize():
+    client = GeocodingClient('valid', url='http://127.0.0.1:1', precision=2)
+
+    assert client.quantize(37.36883, -122.03635) == (37.37, -122.04)
+    assert client.quantize('1.004', '-1.006') == (1.0, -1.01)
+
+def test_reverse_batch_dedupes():
+    server, url = _start_server()
+    client = GeocodingClient('valid', url=url, precision=3, workers=2)
+    try:
+        results = client.reverse_batch([
+            (37.36883, -122.03635),
+            (37.36881, -122.03649),
+            (40.0, -74.0),
+            (37.36883, -122.03635),
+        ])
+    finally:
+        client.close()
+        _stop_server(server)
+
+    assert [r['address']['city'] for r in results] == [
+        'City 37.369 -122.036',
+        'City 37.369 -122.036',
+        'City 40.0 -74.0',
+        'City 37.369 -122.036',
+    ], results
+    assert len(server.requests) == 2, server.requests
+    assert client.request_count == 2, client.request_count
+
+def test_reverse_reuses_connections():
+    server, url = _start_server()
+    client = GeocodingClient('valid', url=url, workers=2)
+    try:
+        client.reverse_batch([(i, i) for i in range(20)])
+        client.reverse(50, 50)
+    finally:
+        client.close()
+        _stop_server(server)
+
+    assert len(server.requests) == 21, len(server.requests)
+    # At most one connection per worker.
+    assert len(server.clients) <= 2, server.clients
+
+def test_request_unreachable():
+    client = GeocodingClient('valid', url='http://127.0.0.1:1')
+
+    result = client.reverse(1, 1)
+
+    assert result is None, result
+
+def test_geolocation_place_names():
+    temporary_folder, folder = helper.create_working_folder()
+    server, url = _start_server()
+    location_db = os.path.join(folder, 'location.json')
+    config_path = os.path.join(folder, 'config.ini')
+    with open(config_path, 'w') as f:
+        f.write('[MapQuest]\nkey=valid\n[Geolocation]\nurl={}\nprecision=2\n'.format(url))
+
+    with mock.patch('elodie.config.config_file', config_path), \
+            mock.patch('elodie.constants.location_db', location_db), \
+            mock.patch('elodie.geolocation.__KEY__', None), \
+            mock.patch('elodie.geolocation.__CLIENT__', None), \
+            mock.patch('elodie.geolocation.__GAZETTEER__', None), \
+            mock.patch('elodie.geolocation.__LOCATION_CACHE__', None):
+        if hasattr(geolocation.load_config, 'config'):
+            del geolocation.load_config.config
+        try:
+            names = geolocation.place_names([
+                (10.001, 20.001),
+                (10.002, 20.002),
+                (None, 20.0),
+                (30.0, 40.0),
+            ])
+            # Now cached.
+            cached = geolocation.place_name(10.001, 20.001)
+            coordinates = geolocation.coordinates_by_name('Sunnyvale, CA')
+            cache_size = len(geolocation.get_location_cache())
+        finally:
+            del geolocation.load_config.config
+            _stop_server(server)
+
+    shutil.rmtree(folder)
+
+    assert names[0] == {'city': 'City 10.0 20.0', 'country': 'Country', 'default': 'City 10.0 20.0'}, names
+    assert names[1] == names[0], names
+    assert names[2] == {'default': 'Unknown Location'}, names
+    assert names[3]['city'] == 'City 30.0 40.0', names
+    assert cached == names[0], cached
+    assert coordinates == {'latitude': 1.5, 'longitude': 2.5}, coordinates
+    assert cache_size == 2, cache_size
+    assert len(server.requests) == 3, server.requests
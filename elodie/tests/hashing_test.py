@@ -0,0 +1,122 @@
+from __future__ import absolute_import
+# Project imports
+import hashlib
+import mock
+import os
+import shutil
+import sys
+
+from nose.tools import assert_raises
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from . import helper
+from elodie import hashing
+
+os.environ['TZ'] = 'GMT'
+
+def test_checksum_sha256():
+    checksum = hashing.checksum(helper.get_file('plain.jpg'))
+
+    assert checksum == helper.checksum(helper.get_file('plain.jpg')), checksum
+
+def test_checksum_blake2b():
+    with open(helper.get_file('plain.jpg'), 'rb') as f:
+        expected = hashlib.blake2b(f.read()).hexdigest()
+
+    checksum = hashing.checksum(helper.get_file('plain.jpg'), 'blake2b', blocksize=1000)
+
+    assert checksum == expected, checksum
+
+def test_checksums_single_read():
+    checksums = hashing.checksums(helper.get_file('plain.jpg'), ('sha256', 'blake2b'))
+
+    assert checksums['sha256'] == hashing.checksum(helper.get_file('plain.jpg'), 'sha256'), checksums
+    assert checksums['blake2b'] == hashing.checksum(helper.get_file('plain.jpg'), 'blake2b'), checksums
+
+def test_checksum_missing_file():
+    assert hashing.checksum('/does/not/exist.jpg') is None
+
+def test_new_unsupported_algorithm():
+    assert_raises(ValueError, hashing.new, 'md5')
+
+def test_tree_checksum():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = os.path.join(folder, 'video.mov')
+    with open(origin, 'wb') as f:
+        f.write(b'a' * 100 + b'b' * 100 + b'c' * 50)
+
+    root, chunks = hashing.tree_checksum(origin, 'sha256', chunk_size=100)
+
+    shutil.rmtree(folder)
+
+    expected_chunks = [hashlib.sha256(c * n).hexdigest() for c, n in ((b'a', 100), (b'b', 100), (b'c', 50))]
+    assert chunks == expected_chunks, chunks
+    assert root == hashing.combine_chunks(expected_chunks, 'sha256', 100), root
+    assert root != hashlib.sha256(b'a' * 100 + b'b' * 100 + b'c' * 50).hexdigest(), root
+
+def test_tree_checksum_single_chunk():
+    root, chunks = hashing.tree_checksum(helper.get_file('plain.jpg'), 'blake2b')
+
+    assert root == hashing.checksum(helper.get_file('plain.jpg'), 'blake2b'), root
+    assert chunks == [root], chunks
+
+def test_digest_tree_single_chunk_has_no_chunks():
+    digest, chunks = hashing.digest(helper.get_file('plain.jpg'), 'sha256', tree_chunk_size=hashing.TREE_CHUNK_SIZE)
+
+    assert digest == hashing.checksum(helper.get_file('plain.jpg')), digest
+    assert chunks is None, chunks
+
+def test_verify_chunks():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = os.path.join(folder, 'video.mov')
+    with open(origin, 'wb') as f:
+        f.write(b'a' * 250)
+    root, chunks = hashing.tree_checksum(origin, 'sha256', chunk_size=100)
+    with open(origin, 'r+b') as f:
+        f.seek(150)
+        f.write(b'x')
+
+    all_bad = hashing.verify_chunks(origin, chunks, 'sha256', chunk_size=100)
+    some_bad = hashing.verify_chunks(origin, chunks, 'sha256', chunk_size=100, indices=[0, 2])
+
+    shutil.rmtree(folder)
+
+    assert all_bad == [1], all_bad
+    assert some_bad == [], some_bad
+
+def test_checksum_mmap():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = os.path.join(folder, 'video.mov')
+    content = os.urandom(300000)
+    with open(origin, 'wb') as f:
+        f.write(content)
+
+    with mock.patch.object(hashing, 'MMAP_SIZE', 1000), mock.patch.object(hashing, 'MMAP_BLOCK_SIZE', 4096):
+        checksum = hashing.checksum(origin, 'blake2b')
+        chunk = hashing._chunk_checksum(origin, 'sha256', 70000, 100000)
+
+    shutil.rmtree(folder)
+
+    assert checksum == hashlib.blake2b(content).hexdigest(), checksum
+    assert chunk == hashlib.sha256(content[70000:170000]).hexdigest(), chunk
+
+def test_hash_range():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = os.path.join(folder, 'photo.jpg')
+    with open(origin, 'wb') as f:
+        f.write(b'0123456789')
+
+    hasher = hashlib.sha256()
+    count = hashing.hash_range(origin, [hasher], offset=8, length=100, drop_cache=True)
+
+    shutil.rmtree(folder)
+
+    assert count == 2, count
+    assert hasher.hexdigest() == hashlib.sha256(b'89').hexdigest()
+
+def test_get_block_size():
+    assert hashing.get_block_size(0) == 1
+    assert hashing.get_block_size(1000) == 1000
+    assert hashing.get_block_size(1024 * 1024) == hashing.BLOCK_SIZE
+    assert hashing.get_block_size(1024 * 1024 * 1024) == hashing.LARGE_BLOCK_SIZE
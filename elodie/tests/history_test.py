@@ -0,0 +1,253 @@
+from __future__ import absolute_import
+# Project imports
+import gzip
+import json
+import mock
+import os
+import shutil
+import sys
+
+from datetime import datetime
+from datetime import timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from . import helper
+from elodie import history
+from elodie.manifest import Manifest
+
+os.environ['TZ'] = 'GMT'
+
+HEADER = {'version': 2, 'algorithm': 'sha256'}
+
+NOW = datetime(2016, 6, 15, 12, 0, 0)
+
+def _entry(source, name='photo.jpg'):
+    return {"sources": {source: {}}, "target": {"path": "2015-12-Dec", "name": name}}
+
+def _kinds(directory, name='manifest'):
+    return [snapshot.kind for snapshot in history.list_snapshots(directory, name)]
+
+def _write(manifest_path, entries, changes=None, loaded_state=None, now=NOW):
+    with open(manifest_path, 'w') as f:
+        json.dump(entries, f)
+    return history.write_snapshot(manifest_path, HEADER, entries, changes, loaded_state, now=now)
+
+def test_write_after_load_is_a_delta():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+
+    manifest = Manifest().load_from_file(manifest_path)
+    manifest.merge({'aa': _entry('/a.jpg'), 'bb': _entry('/b.jpg')})
+    manifest.write()
+    manifest.merge({'cc': _entry('/c.jpg')})
+    del manifest.entries['aa']
+    manifest.write()
+
+    directory = history.get_directory(manifest_path)
+    snapshots = history.list_snapshots(directory, 'manifest')
+    header, metadata, entries = snapshots[-1].read()
+    with gzip.open(snapshots[-1].path, 'rt') as f:
+        json.load(f)
+
+    shutil.rmtree(folder)
+
+    assert [s.kind for s in snapshots] == ['full', 'delta'], snapshots
+    assert metadata['base'] == snapshots[0].timestamp, metadata
+    assert metadata['removed'] == ['aa'], metadata
+    assert list(entries) == ['cc'], entries
+
+def test_write_is_full_if_file_changed_since_loaded():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+
+    state = history.get_file_state(manifest_path)
+    _write(manifest_path, {'aa': _entry('/a.jpg')}, ['aa'], state)
+    _write(manifest_path, {'aa': _entry('/a.jpg'), 'bb': _entry('/b.jpg')}, ['bb'], [1, 2], NOW + timedelta(seconds=1))
+
+    kinds = _kinds(history.get_directory(manifest_path))
+
+    shutil.rmtree(folder)
+
+    assert kinds == ['full', 'full'], kinds
+
+@mock.patch('elodie.constants.history_full_interval', 2)
+def test_write_is_full_after_interval():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+
+    entries = {}
+    for i in range(5):
+        key = 'a{}'.format(i)
+        entries[key] = _entry('/{}.jpg'.format(i))
+        state = history.get_file_state(manifest_path)
+        _write(manifest_path, entries, [key], state, NOW + timedelta(seconds=i))
+
+    kinds = _kinds(history.get_directory(manifest_path))
+
+    shutil.rmtree(folder)
+
+    assert kinds == ['full', 'delta', 'delta', 'full', 'delta'], kinds
+
+def test_reconstruct_at_time():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+    output_path = os.path.join(folder, 'restored.json')
+
+    state = None
+    entries = {}
+    for day in range(3):
+        entries['a{}'.format(day)] = _entry('/{}.jpg'.format(day))
+        _write(manifest_path, entries, ['a{}'.format(day)], state, NOW + timedelta(days=day))
+        state = history.get_file_state(manifest_path)
+
+    count = history.restore(manifest_path, output_path, '2016-06-16')
+    with open(output_path, 'r') as f:
+        restored = json.load(f)
+    earlier = history.restore(manifest_path, output_path, '2016-06-14')
+    latest = history.restore(manifest_path, output_path)
+
+    shutil.rmtree(folder)
+
+    assert count == 2, count
+    assert sorted(restored) == ['@manifest', 'a0', 'a1'], restored
+    assert earlier is None, earlier
+    assert latest == 3, latest
+
+@mock.patch('elodie.history.log.warn')
+def test_restore_warns_about_shards_without_snapshots(mock_warn):
+    temporary_folder, folder = helper.create_working_folder()
+    directory = os.path.join(folder, 'manifest')
+    os.makedirs(directory)
+    output_path = os.path.join(folder, 'restored.json')
+    _write(os.path.join(directory, 'ab.json'), {'ab01': _entry('/a.jpg')})
+    _write(os.path.join(directory, 'cd.json'), {'cd01': _entry('/c.jpg')}, now=NOW + timedelta(days=1))
+
+    count = history.restore(directory, output_path, '2016-06-15')
+
+    shutil.rmtree(folder)
+
+    assert count == 1, count
+    assert mock_warn.call_count == 1, mock_warn.call_args_list
+    assert 'cd' in mock_warn.call_args[0][0], mock_warn.call_args
+
+def test_snapshot_file():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+    with open(manifest_path, 'w') as f:
+        json.dump({'@manifest': HEADER, 'a0': _entry('/0.jpg')}, f)
+
+    snapshot_path = history.snapshot_file(manifest_path, now=NOW)
+    # The latest snapshot is already of this version.
+    again = history.snapshot_file(manifest_path, now=NOW)
+    header, metadata, entries = history.list_snapshots(history.get_directory(manifest_path))[0].read()
+    os.remove(manifest_path)
+    removed_path = history.snapshot_file(manifest_path, HEADER, now=NOW)
+    removed = history.list_snapshots(history.get_directory(manifest_path))[-1].read()
+
+    shutil.rmtree(folder)
+
+    assert snapshot_path is not None
+    assert again is None, again
+    assert header == HEADER, header
+    assert dict(entries) == {'a0': _entry('/0.jpg')}, entries
+    assert removed_path is not None
+    assert dict(removed[2]) == {}, removed
+
+@mock.patch('elodie.constants.history_keep_last', 1)
+@mock.patch('elodie.constants.history_keep_daily', 0)
+@mock.patch('elodie.constants.history_keep_weekly', 0)
+def test_prune_folds_into_next_snapshot():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+    directory = history.get_directory(manifest_path)
+
+    # Nothing is pruned while the snapshots are written.
+    with mock.patch('elodie.constants.history_keep_last', 10):
+        state = None
+        _write(manifest_path, {'aa': _entry('/a.jpg'), 'bb': _entry('/b.jpg')}, None, state)
+        state = history.get_file_state(manifest_path)
+        _write(manifest_path, {'aa': _entry('/a.jpg')}, ['bb'], state, NOW + timedelta(seconds=1))
+        state = history.get_file_state(manifest_path)
+        _write(manifest_path, {'aa': _entry('/a.jpg'), 'cc': _entry('/c.jpg')}, ['cc'], state, NOW + timedelta(seconds=2))
+    before = _kinds(directory)
+
+    removed = history.prune(directory, 'manifest', NOW)
+    snapshots = history.list_snapshots(directory, 'manifest')
+    header, entries = history.reconstruct(snapshots, 0)
+
+    shutil.rmtree(folder)
+
+    assert before == ['full', 'delta', 'delta'], before
+    assert removed == 2, removed
+    assert [s.kind for s in snapshots] == ['full'], snapshots
+    assert sorted(entries) == ['aa', 'cc'], entries
+    assert header == HEADER, header
+
+@mock.patch('elodie.constants.history_keep_last', 2)
+@mock.patch('elodie.constants.history_keep_daily', 0)
+@mock.patch('elodie.constants.history_keep_weekly', 0)
+def test_prune_squashes_deltas():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+    directory = history.get_directory(manifest_path)
+
+    with mock.patch('elodie.constants.history_keep_last', 10):
+        state = None
+        _write(manifest_path, {'aa': _entry('/a.jpg'), 'bb': _entry('/b.jpg')}, None, state)
+        state = history.get_file_state(manifest_path)
+        _write(manifest_path, {'aa': _entry('/a.jpg'), 'dd': _entry('/d.jpg')}, ['bb', 'dd'], state, NOW + timedelta(seconds=1))
+        state = history.get_file_state(manifest_path)
+        _write(manifest_path, {'aa': _entry('/a.jpg'), 'cc': _entry('/c.jpg')}, ['cc', 'dd'], state, NOW + timedelta(seconds=2))
+        state = history.get_file_state(manifest_path)
+        _write(manifest_path, {'aa': _entry('/a.jpg', 'new.jpg'), 'cc': _entry('/c.jpg')}, ['aa'], state, NOW + timedelta(seconds=3))
+
+    # Keeps the full snapshot so the squashed delta has a base.
+    snapshots = history.list_snapshots(directory, 'manifest')
+    with mock.patch('elodie.history.get_retained', return_value=set([snapshots[0].file_name, snapshots[3].file_name])):
+        removed = history.prune(directory, 'manifest', NOW)
+    snapshots = history.list_snapshots(directory, 'manifest')
+    header, metadata, delta = snapshots[1].read()
+    header, entries = history.reconstruct(snapshots, 1)
+
+    shutil.rmtree(folder)
+
+    assert removed == 2, removed
+    assert [s.kind for s in snapshots] == ['full', 'delta'], snapshots
+    assert metadata['base'] == snapshots[0].timestamp, metadata
+    # Removing dd again is harmless, as the base never had it.
+    assert metadata['removed'] == ['bb', 'dd'], metadata
+    assert metadata['depth'] == 1, metadata
+    assert sorted(delta) == ['aa', 'cc'], delta
+    assert sorted(entries) == ['aa', 'cc'], entries
+    assert entries['aa']['target']['name'] == 'new.jpg', entries
+
+def test_get_retained():
+    snapshots = [
+        history.Snapshot('', 'm_{}.full.json.gz'.format(t), 'm', t, history.FULL)
+        for t in ('2016-05-01_10-00-00-000000', '2016-06-14_10-00-00-000000',
+                  '2016-06-14_11-00-00-000000', '2016-06-15_10-00-00-000000')
+    ]
+    with mock.patch.multiple('elodie.constants', history_keep_last=1, history_keep_daily=2, history_keep_weekly=1):
+        retained = history.get_retained(snapshots, NOW)
+
+    assert sorted(retained) == [
+        'm_2016-06-14_11-00-00-000000.full.json.gz',
+        'm_2016-06-15_10-00-00-000000.full.json.gz',
+    ], retained
+
+def test_legacy_snapshots_are_full():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+    directory = history.get_directory(manifest_path)
+    os.makedirs(directory)
+    with open(os.path.join(directory, 'manifest_2016-06-01_10-00-00.json'), 'w') as f:
+        json.dump({'aa': _entry('/a.jpg')}, f)
+
+    snapshots = history.list_snapshots(directory, 'manifest')
+    header, entries = history.reconstruct(snapshots, 0)
+
+    shutil.rmtree(folder)
+
+    assert [s.kind for s in snapshots] == ['full'], snapshots
+    assert list(entries) == ['aa'], entries
@@ -0,0 +1,121 @@
+from __future__ import absolute_import
+# Project imports
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from elodie.index import ManifestIndex
+from elodie.index import format_date_taken
+from elodie.index import match_entry
+
+os.environ['TZ'] = 'GMT'
+
+ENTRIES = {
+    'aaa': {
+        'sources': {
+            '/photos/2015/a.jpg': {'date_taken': [[2015, 12, 5, 0, 59, 26, 5, 339, 0]], 'camera_make': 'Canon', 'camera_model': 'EOS 5D', 'album': 'Trip'},
+        },
+        'target': {'path': '2015-12-Dec/Unknown Location', 'name': '2015-12-05_00-59-26-a.jpg'},
+    },
+    'bbb': {
+        'sources': {
+            '/photos/2016/b.jpg': {'date_taken': [[2016, 1, 1, 10, 0, 0, 4, 1, 0]], 'camera_make': 'Apple', 'camera_model': 'iPhone 6'},
+            '/backup/b.jpg': {'date_taken': [[2016, 1, 1, 10, 0, 0, 4, 1, 0]], 'origin': 'Backup'},
+        },
+        'target': {'path': '2016-01-Jan/Unknown Location', 'name': '2016-01-01_10-00-00-b.jpg'},
+    },
+    'ccc': {
+        'sources': {
+            '/photos/2016-extra/c.mov': {'camera_make': 'canon'},
+        },
+        'target': {'path': '2016-01-Jan/Unknown Location', 'name': '2016-01-01_23-00-00-c.mov'},
+    },
+}
+
+def test_find_by_name():
+    index = ManifestIndex(ENTRIES)
+
+    assert index.find(name='2015-12-05_00-59-26-a.jpg') == ['aaa']
+    assert index.find(name='2015-12-05') == []
+    assert index.find(name_prefix='2016-01-01_') == ['bbb', 'ccc']
+    assert index.find(name_prefix='2017') == []
+
+def test_find_by_source():
+    index = ManifestIndex(ENTRIES)
+
+    assert index.find(source='/backup/b.jpg') == ['bbb']
+    assert index.find(source='/photos/2016') == ['bbb']
+    assert index.find(source='/photos/2016/') == ['bbb']
+    assert index.find(source='/photos') == ['aaa', 'bbb', 'ccc']
+    assert index.find(source='/photos/2016/b') == []
+
+def test_find_by_date_range():
+    index = ManifestIndex(ENTRIES)
+
+    assert index.find(date_from='2016-01-01') == ['bbb']
+    assert index.find(date_to='2016-01-01') == ['aaa', 'bbb']
+    assert index.find(date_to='2016-01-01 09:00:00') == ['aaa']
+    assert index.find(date_from='2015-12-05', date_to='2015-12-05') == ['aaa']
+
+def test_find_by_values():
+    index = ManifestIndex(ENTRIES)
+
+    assert index.find(camera_make='CANON') == ['aaa', 'ccc']
+    assert index.find(camera_model='iphone 6') == ['bbb']
+    assert index.find(album='Trip') == ['aaa']
+    assert index.find(origin='backup') == ['bbb']
+    assert index.find(album='Missing') == []
+
+def test_find_intersects_criteria():
+    index = ManifestIndex(ENTRIES)
+
+    assert index.find(camera_make='canon', name_prefix='2016') == ['ccc']
+    assert index.find(camera_make='canon', date_from='2015-01-01') == ['aaa']
+    assert index.find() == []
+
+def test_find_unknown_field():
+    index = ManifestIndex(ENTRIES)
+    try:
+        index.find(colour='red')
+        raised = False
+    except TypeError:
+        raised = True
+
+    assert raised is True
+
+def test_format_date_taken():
+    assert format_date_taken([[2015, 12, 5, 0, 59, 26, 5, 339, 0]]) == '2015-12-05 00:59:26'
+    assert format_date_taken(time.gmtime(0)) == '1970-01-01 00:00:00'
+    assert format_date_taken(None) is None
+    assert format_date_taken('2015-12-05') is None
+
+def test_match_entry_agrees_with_find():
+    index = ManifestIndex(ENTRIES)
+    queries = [
+        {'key': 'bbb'},
+        {'name': '2015-12-05_00-59-26-a.jpg'},
+        {'name_prefix': '2016-01-01'},
+        {'source': '/photos'},
+        {'source': '/photos/2016/'},
+        {'date_from': '2016-01-01'},
+        {'date_to': '2015-12-05'},
+        {'date_from': '2016-01-01 10:00:00', 'date_to': '2016-01-01 10:00:00'},
+        {'camera_make': 'CANON'},
+        {'camera_make': 'canon', 'source': '/photos/2016-extra'},
+        {'origin': 'backup', 'camera_model': 'iphone 6'},
+        {'album': 'nothing'},
+    ]
+
+    for criteria in queries:
+        scanned = sorted(k for k, v in ENTRIES.items() if match_entry(k, v, criteria))
+        assert scanned == index.find(**criteria), (criteria, scanned)
+
+def test_match_entry_unknown_field():
+    try:
+        match_entry('aaa', ENTRIES['aaa'], {'flavor': 'sweet'})
+    except TypeError:
+        pass
+    else:
+        assert False, 'Unknown fields should raise TypeError'
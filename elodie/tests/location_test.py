@@ -0,0 +1,110 @@
+from __future__ import absolute_import
+# Project imports
+import json
+import mock
+import os
+import shutil
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from . import helper
+from elodie import geolocation
+from elodie.location import LocationCache
+
+os.environ['TZ'] = 'GMT'
+
+def test_get_name_nearest_within_threshold():
+    cache = LocationCache('/does/not/exist.json')
+    cache.add(37.368, -122.03, {'city': 'Sunnyvale'})
+    cache.add(37.339, -121.895, {'city': 'San Jose'})
+    cache.add(37.37, -122.04, {'city': 'Sunnyvale West'})
+
+    nearest = cache.get_name(37.3681, -122.0301, 3000)
+    outside = cache.get_name(37.5, -122.03, 3000)
+
+    assert nearest == {'city': 'Sunnyvale'}, nearest
+    assert outside is None, outside
+
+def test_get_name_across_cells_and_antimeridian():
+    cache = LocationCache('/does/not/exist.json')
+    cache.add(-16.0, 179.999, 'East')
+    cache.add(0.0999, 10.0999, 'Corner')
+
+    east = cache.get_name(-16.0, -179.999, 1000)
+    corner = cache.get_name(0.1001, 10.1001, 1000)
+
+    assert east == 'East', east
+    assert corner == 'Corner', corner
+
+def test_get_name_many_locations():
+    cache = LocationCache('/does/not/exist.json')
+    for i in range(100):
+        for j in range(100):
+            cache.add(i * 0.05, j * 0.05, '{}x{}'.format(i, j))
+
+    name = cache.get_name(2.501, 1.499, 1000)
+
+    assert name == '50x30', name
+
+def test_get_coordinates():
+    cache = LocationCache('/does/not/exist.json')
+    cache.add(61.01371, 99.196656, 'Siberia')
+
+    assert cache.get_coordinates('Siberia') == (61.01371, 99.196656)
+    assert cache.get_coordinates('Nowhere') is None
+
+def test_add_writes_in_batches():
+    temporary_folder, folder = helper.create_working_folder()
+    location_db = os.path.join(folder, 'location.json')
+
+    cache = LocationCache(location_db)
+    with mock.patch('elodie.constants.location_db_flush_size', 3):
+        cache.add(1, 1, 'a', write=True)
+        cache.add(2, 2, 'b', write=True)
+        written_early = os.path.isfile(location_db)
+        cache.add(3, 3, 'c', write=True)
+        cache.add(4, 4, 'd', write=True)
+
+    with open(location_db, 'r') as f:
+        written = json.load(f)
+    loaded = LocationCache(location_db).load()
+
+    shutil.rmtree(folder)
+
+    assert written_early is False
+    assert [l['name'] for l in written] == ['a', 'b', 'c'], written
+    assert cache.unsaved == 1, cache.unsaved
+    assert len(loaded) == 3, len(loaded)
+    assert loaded.get_name(2, 2, 10) == 'b'
+
+def test_geolocation_loads_cache_once():
+    temporary_folder, folder = helper.create_working_folder()
+    location_db = os.path.join(folder, 'location.json')
+    with open(location_db, 'w') as f:
+        json.dump([{'lat': 37.368, 'long': -122.03, 'name': {'city': 'Cached', 'default': 'Cached'}}], f)
+
+    with mock.patch('elodie.constants.location_db', location_db), \
+            mock.patch('elodie.geolocation.__LOCATION_CACHE__', None), \
+            mock.patch('elodie.geolocation.get_gazetteer', return_value=None), \
+            mock.patch('elodie.geolocation.get_client') as get_client:
+        client = get_client.return_value
+        client.quantize.side_effect = lambda lat, lon: (lat, lon)
+        client.reverse_batch.side_effect = lambda coordinates: [{'address': {'city': 'Looked Up'}}] * len(coordinates)
+        first = geolocation.place_name(37.368, -122.03)
+        second = geolocation.place_name(37.3681, -122.0301)
+        looked_up = geolocation.place_name(10.0, 10.0)
+        cached = geolocation.place_name(10.0, 10.0)
+        geolocation.flush_location_cache()
+
+    with open(location_db, 'r') as f:
+        written = json.load(f)
+
+    shutil.rmtree(folder)
+
+    assert first['city'] == 'Cached', first
+    assert second['city'] == 'Cached', second
+    assert looked_up == {'city': 'Looked Up', 'default': 'Looked Up'}, looked_up
+    assert cached == looked_up, cached
+    assert client.reverse_batch.call_count == 1, client.reverse_batch.call_count
+    assert len(written) == 2, written
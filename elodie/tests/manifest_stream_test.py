@@ -0,0 +1,173 @@
+from __future__ import absolute_import
+# Project imports
+import json
+import mock
+import os
+import shutil
+import sys
+
+from nose.tools import assert_raises
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from . import helper
+from elodie import manifest_stream
+from elodie.manifest_stream import HEADER_KEY
+from elodie.manifest_stream import ManifestReader
+from elodie.manifest_stream import ManifestWriter
+
+os.environ['TZ'] = 'GMT'
+
+HEADER = {'version': 2, 'algorithm': 'sha256'}
+
+ENTRIES = [
+    ('aaa', {'sources': {'/a.jpg': {'date_taken': [[2015, 12, 5, 0, 59, 26, 5, 339, 0]], 'latitude': 37.12345678}}, 'target': {'path': '2015-12-Dec', 'name': u'aé.jpg'}}),
+    ('bbb', {'sources': {'/b.jpg': {'size': 123456789}}, 'target': None}),
+    ('ccc', {}),
+]
+
+def _read(manifest_path):
+    with ManifestReader(manifest_path) as reader:
+        return (reader.header, list(reader))
+
+def test_read_json_dump():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+    contents = dict([(HEADER_KEY, HEADER)] + ENTRIES)
+    for indent in (None, 2):
+        with open(manifest_path, 'w') as f:
+            json.dump(contents, f, indent=indent)
+
+        # Blocks smaller than the entries, to read each one in pieces.
+        with mock.patch.object(manifest_stream, 'BLOCK_SIZE', 7):
+            header, entries = _read(manifest_path)
+
+        assert header == HEADER, header
+        assert sorted(entries) == sorted(ENTRIES), entries
+
+    shutil.rmtree(folder)
+
+def test_read_utf8():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+    contents = dict([(HEADER_KEY, HEADER)] + ENTRIES)
+    # Written without escaping, whatever the locale's encoding is.
+    with open(manifest_path, 'wb') as f:
+        f.write(json.dumps(contents, ensure_ascii=False).encode('utf-8'))
+
+    header, entries = _read(manifest_path)
+
+    shutil.rmtree(folder)
+
+    assert entries == ENTRIES, entries
+
+def test_read_without_header():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+    with open(manifest_path, 'w') as f:
+        f.write(' { "aaa" : {"target": {"size": 12345}} , "bbb":{}}\n')
+
+    with mock.patch.object(manifest_stream, 'BLOCK_SIZE', 1):
+        with ManifestReader(manifest_path) as reader:
+            has_entries = reader.has_entries()
+            header, entries = reader.header, list(reader)
+
+    shutil.rmtree(folder)
+
+    assert has_entries is True
+    assert header is None, header
+    assert entries == [('aaa', {'target': {'size': 12345}}), ('bbb', {})], entries
+
+def test_read_empty():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+    with open(manifest_path, 'w') as f:
+        json.dump({HEADER_KEY: HEADER}, f)
+
+    with ManifestReader(manifest_path) as reader:
+        has_entries = reader.has_entries()
+        header, entries = reader.header, list(reader)
+
+    shutil.rmtree(folder)
+
+    assert has_entries is False
+    assert header == HEADER, header
+    assert entries == [], entries
+
+def test_read_invalid():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+
+    for contents in ('', '[]', '{"aaa": {}', '{"aaa" {}}', '{"aaa": {"sources": '):
+        with open(manifest_path, 'w') as f:
+            f.write(contents)
+
+        def read():
+            with ManifestReader(manifest_path) as reader:
+                return list(reader)
+        assert_raises(ValueError, read)
+
+    shutil.rmtree(folder)
+
+def test_write_matches_json_dump():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+
+    for indent in (False, True):
+        with ManifestWriter(manifest_path, HEADER, indent=indent) as writer:
+            for key, entry in ENTRIES:
+                writer.write(key, entry)
+
+        contents = [(HEADER_KEY, HEADER)] + ENTRIES
+        with open(manifest_path, 'r') as f:
+            written = f.read()
+        if indent:
+            expected = json.dumps(dict(contents), indent=2, separators=(',', ': '))
+        else:
+            expected = json.dumps(dict(contents), separators=(',', ':'))
+
+        assert written == expected, written
+        assert writer.count == 3, writer.count
+
+    shutil.rmtree(folder)
+
+def test_write_leaves_manifest_on_error():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+    with open(manifest_path, 'w') as f:
+        f.write('{}')
+
+    def write():
+        with ManifestWriter(manifest_path, HEADER, sidecar=True) as writer:
+            writer.write('aaa', {})
+            raise IOError('Disk full')
+    assert_raises(IOError, write)
+
+    with open(manifest_path, 'r') as f:
+        written = f.read()
+    names = os.listdir(folder)
+
+    shutil.rmtree(folder)
+
+    assert written == '{}', written
+    assert names == ['manifest.json'], names
+
+def test_compressed_round_trip():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json.gz')
+
+    with ManifestWriter(manifest_path, HEADER, sidecar=True) as writer:
+        for key, entry in ENTRIES:
+            writer.write(key, entry)
+
+    with open(manifest_path, 'rb') as f:
+        magic = f.read(2)
+    header, entries = _read(manifest_path)
+    names = os.listdir(folder)
+
+    shutil.rmtree(folder)
+
+    assert magic == b'\x1f\x8b', magic
+    assert header == HEADER, header
+    assert entries == ENTRIES, entries
+    assert names == ['manifest.json.gz'], names
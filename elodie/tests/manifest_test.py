@@ -0,0 +1,288 @@
+from __future__ import absolute_import
+# Project imports
+import json
+import mock
+import os
+import shutil
+import sys
+
+from nose.tools import assert_raises
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from . import helper
+from elodie import constants
+from elodie import hashing
+from elodie.manifest import HEADER_KEY
+from elodie.manifest import Manifest
+from elodie.manifest import merge_entry
+from elodie.manifest import merge_files
+
+os.environ['TZ'] = 'GMT'
+
+def _entry(source, name='photo.jpg'):
+    return {"sources": {source: {}}, "target": {"path": "2015-12-Dec", "name": name}}
+
+def test_load_legacy_manifest():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+    with open(manifest_path, 'w') as f:
+        json.dump({'abc': _entry('/a.jpg')}, f)
+
+    manifest = Manifest(algorithm='blake2b').load_from_file(manifest_path)
+
+    shutil.rmtree(folder)
+
+    assert manifest.algorithm == 'sha256', manifest.algorithm
+    assert list(manifest.entries.keys()) == ['abc'], manifest.entries
+
+def test_write_records_header():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+
+    manifest = Manifest(algorithm='blake2b').load_from_file(manifest_path)
+    manifest.merge({'abc': _entry('/a.jpg')})
+    manifest.write()
+
+    with open(manifest_path, 'r') as f:
+        contents = json.load(f)
+    loaded = Manifest().load_from_file(manifest_path)
+
+    shutil.rmtree(folder)
+
+    assert contents[HEADER_KEY] == {'version': 2, 'algorithm': 'blake2b'}, contents
+    assert loaded.algorithm == 'blake2b', loaded.algorithm
+    assert len(loaded) == 1, loaded.entries
+
+def test_load_different_algorithm_fails():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+    with open(manifest_path, 'w') as f:
+        json.dump({HEADER_KEY: {'version': 2, 'algorithm': 'blake2b'}, 'abc': _entry('/a.jpg')}, f)
+
+    manifest = Manifest(algorithm='sha256')
+    manifest.merge({'def': _entry('/b.jpg')})
+
+    assert_raises(ValueError, manifest.load_from_file, manifest_path)
+
+    shutil.rmtree(folder)
+
+def test_migrate():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = os.path.join(folder, 'plain.jpg')
+    shutil.copyfile(helper.get_file('plain.jpg'), origin)
+    sha256 = hashing.checksum(origin, 'sha256')
+    blake2b = hashing.checksum(origin, 'blake2b')
+
+    manifest = Manifest(algorithm='sha256')
+    manifest.merge({sha256: _entry(origin)})
+    failed = manifest.migrate('blake2b', workers=2)
+
+    shutil.rmtree(folder)
+
+    assert failed == [], failed
+    assert manifest.algorithm == 'blake2b', manifest.algorithm
+    assert list(manifest.entries.keys()) == [blake2b], manifest.entries
+    assert manifest.entries[blake2b]['sources'] == {origin: {}}, manifest.entries
+
+def test_migrate_from_target():
+    temporary_folder, folder = helper.create_working_folder()
+    target = os.path.join(folder, '2015-12-Dec')
+    os.makedirs(target)
+    shutil.copyfile(helper.get_file('plain.jpg'), os.path.join(target, 'photo.jpg'))
+    sha256 = hashing.checksum(os.path.join(target, 'photo.jpg'), 'sha256')
+
+    manifest = Manifest(algorithm='sha256')
+    manifest.merge({sha256: _entry('/source/no-longer-exists.jpg')})
+    failed = manifest.migrate('blake2b', base_path=folder)
+
+    shutil.rmtree(folder)
+
+    assert failed == [], failed
+    assert manifest.algorithm == 'blake2b', manifest.algorithm
+
+def test_migrate_changed_file():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = os.path.join(folder, 'plain.jpg')
+    shutil.copyfile(helper.get_file('plain.jpg'), origin)
+
+    manifest = Manifest(algorithm='sha256')
+    manifest.merge({'0' * 64: _entry(origin)})
+    failed = manifest.migrate('blake2b')
+
+    shutil.rmtree(folder)
+
+    assert failed == ['0' * 64], failed
+    assert manifest.algorithm == 'sha256', manifest.algorithm
+    assert list(manifest.entries.keys()) == ['0' * 64], manifest.entries
+
+def test_migrate_to_tree_hash():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = os.path.join(folder, 'video.mov')
+    with open(origin, 'wb') as f:
+        f.write(b'a' * 250)
+    sha256 = hashing.checksum(origin, 'sha256')
+    root, chunks = hashing.tree_checksum(origin, 'sha256', chunk_size=100)
+
+    manifest = Manifest(algorithm='sha256')
+    manifest.merge({sha256: _entry(origin)})
+    failed = manifest.migrate('sha256', tree_chunk_size=100)
+    header = manifest.get_header()
+
+    shutil.rmtree(folder)
+
+    assert failed == [], failed
+    assert list(manifest.entries.keys()) == [root], manifest.entries
+    assert manifest.entries[root]['target']['chunks'] == chunks, manifest.entries
+    assert header['tree_chunk_size'] == 100, header
+
+def test_load_different_tree_chunk_size_fails():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+    with open(manifest_path, 'w') as f:
+        json.dump({HEADER_KEY: {'version': 2, 'algorithm': 'sha256', 'tree_chunk_size': 100}, 'abc': _entry('/a.jpg')}, f)
+
+    manifest = Manifest(algorithm='sha256')
+    manifest.merge({'def': _entry('/b.jpg')})
+
+    assert_raises(ValueError, manifest.load_from_file, manifest_path)
+
+    shutil.rmtree(folder)
+
+def test_add_hash_writes_in_batches():
+    temporary_folder, folder = helper.create_working_folder()
+    hash_db = os.path.join(folder, 'hash.json')
+
+    with mock.patch.object(constants, 'hash_db', hash_db), mock.patch.object(constants, 'hash_db_flush_size', 2):
+        manifest = Manifest()
+        manifest.add_hash('a', '/a.jpg', True)
+        written_after_one = os.path.exists(hash_db)
+        manifest.add_hash('b', '/b.jpg', True)
+        with open(hash_db, 'r') as f:
+            written = json.load(f)
+        loaded = Manifest().load_hash_db()
+
+    leftover_files = os.listdir(folder)
+    shutil.rmtree(folder)
+
+    assert written_after_one is False
+    assert written == {'a': '/a.jpg', 'b': '/b.jpg'}, written
+    assert loaded.hash_db == written, loaded.hash_db
+    assert leftover_files == ['hash.json'], leftover_files
+
+def test_get_target_key():
+    manifest = Manifest()
+    written = _entry('/a.jpg')
+    written["target"]["mtime_ns"] = 1
+    manifest.merge({'aa': written, 'bb': _entry('/b.jpg', 'other.jpg')})
+
+    first = manifest.get_target_key('2015-12-Dec', 'photo.jpg')
+    # Targets without recorded state aren't indexed.
+    unwritten = manifest.get_target_key('2015-12-Dec', 'other.jpg')
+    manifest.merge({'cc': _entry('/c.jpg')})
+    not_written = manifest.get_target_key('2015-12-Dec', 'photo.jpg')
+    written = _entry('/c.jpg')
+    written["target"]["mtime_ns"] = 2
+    manifest.merge({'cc': written})
+    rewritten = manifest.get_target_key('2015-12-Dec', 'photo.jpg')
+
+    assert first == 'aa', first
+    assert unwritten is None, unwritten
+    assert not_written == 'aa', not_written
+    assert rewritten == 'cc', rewritten
+
+def test_merge_clears_moved_target_state():
+    manifest = Manifest()
+    written = _entry('/a.jpg')
+    written["target"].update({"size": 10, "mtime_ns": 1, "checksum": "aa"})
+    manifest.merge({'aa': written, 'bb': dict(written)})
+
+    manifest.merge({'aa': _entry('/a.jpg', 'renamed.jpg')})
+    manifest.merge({'bb': {"target": {"path": "2015-12-Dec", "name": "photo.jpg", "size": 11}}})
+
+    assert manifest.entries['aa']['target'] == {"path": "2015-12-Dec", "name": "renamed.jpg"}, manifest.entries['aa']
+    assert manifest.entries['bb']['target'] == {"path": "2015-12-Dec", "name": "photo.jpg", "size": 11, "mtime_ns": 1,
+                                                "checksum": "aa"}, manifest.entries['bb']
+
+def test_merge_entry():
+    entry = {"sources": {"/a.jpg": {"album": "Trip", "origin": None}}, "target": {"path": "2015", "name": "a.jpg"}}
+    update = {"sources": {"/a.jpg": {"album": None, "origin": "Backup"}, "/b.jpg": {}}, "target": {"path": "2015", "name": "a.jpg", "size": 10}}
+
+    merged, conflict = merge_entry(entry, update)
+
+    assert conflict is False
+    assert merged == {
+        "sources": {"/a.jpg": {"album": "Trip", "origin": "Backup"}, "/b.jpg": {}},
+        "target": {"path": "2015", "name": "a.jpg", "size": 10}
+    }, merged
+
+def test_merge_entry_conflicting_targets():
+    merged, conflict = merge_entry(_entry('/a.jpg', 'a.jpg'), _entry('/b.jpg', 'b.jpg'))
+
+    assert conflict is True
+    assert merged["target"]["name"] == 'b.jpg', merged
+    assert sorted(merged["sources"]) == ['/a.jpg', '/b.jpg'], merged
+
+def _write_manifest(manifest_path, entries, algorithm='sha256'):
+    manifest = Manifest(algorithm=algorithm)
+    manifest.merge(entries)
+    manifest.dump(manifest_path)
+
+def test_merge_files():
+    temporary_folder, folder = helper.create_working_folder()
+    paths = [os.path.join(folder, 'manifest{}.json'.format(i)) for i in range(3)]
+    output_path = os.path.join(folder, 'merged.json')
+    _write_manifest(paths[0], {'ccc': _entry('/c.jpg'), 'aaa': _entry('/a.jpg', 'a.jpg')})
+    _write_manifest(paths[1], {'bbb': _entry('/b.jpg'), 'aaa': _entry('/backup/a.jpg', 'a.jpg')})
+    _write_manifest(paths[2], {'ccc': _entry('/other/c.jpg', 'other.jpg'), 'ddd': _entry('/d.jpg')})
+
+    expected = Manifest()
+    for path in paths:
+        expected.load_from_file(path)
+
+    # Runs of one entry, so every manifest is sorted in temporary files.
+    with mock.patch.object(constants, 'merge_run_size', 1):
+        count, conflicts = merge_files(paths, output_path)
+
+    with open(output_path, 'r') as f:
+        contents = json.load(f)
+    leftovers = [name for name in os.listdir(folder) if name.startswith('.merge.')]
+
+    shutil.rmtree(folder)
+
+    assert (count, conflicts) == (4, 1), (count, conflicts)
+    assert contents.pop(HEADER_KEY) == {'version': 2, 'algorithm': 'sha256'}, contents
+    assert list(contents.keys()) == ['aaa', 'bbb', 'ccc', 'ddd'], contents
+    assert contents == dict(expected.entries.items()), contents
+    assert leftovers == [], leftovers
+
+def test_merge_files_in_memory():
+    temporary_folder, folder = helper.create_working_folder()
+    paths = [os.path.join(folder, 'manifest{}.json'.format(i)) for i in range(2)]
+    output_path = os.path.join(folder, 'merged.json')
+    _write_manifest(paths[0], {'bbb': _entry('/b.jpg'), 'aaa': _entry('/a.jpg')}, 'blake2b')
+    _write_manifest(paths[1], {}, 'sha256')
+
+    count, conflicts = merge_files(paths, output_path, sidecar=True)
+    merged = Manifest().load_from_file(output_path)
+    has_sidecar = os.path.isfile(output_path + '.idx')
+
+    shutil.rmtree(folder)
+
+    assert (count, conflicts) == (2, 0), (count, conflicts)
+    assert merged.algorithm == 'blake2b', merged.algorithm
+    assert sorted(merged.entries) == ['aaa', 'bbb'], merged.entries
+    assert has_sidecar
+
+def test_merge_files_different_algorithm_fails():
+    temporary_folder, folder = helper.create_working_folder()
+    paths = [os.path.join(folder, 'manifest{}.json'.format(i)) for i in range(2)]
+    _write_manifest(paths[0], {'aaa': _entry('/a.jpg')}, 'blake2b')
+    _write_manifest(paths[1], {'bbb': _entry('/b.jpg')}, 'sha256')
+
+    assert_raises(ValueError, merge_files, paths, os.path.join(folder, 'merged.json'))
+    leftovers = [name for name in os.listdir(folder) if name.startswith('.merge.')]
+
+    shutil.rmtree(folder)
+
+    assert leftovers == [], leftovers
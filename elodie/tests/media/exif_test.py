@@ -0,0 +1,96 @@
+# -*- coding: utf-8
+# Project imports
+import os
+import shutil
+import struct
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))))
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))
+
+import helper
+from elodie.media import exif
+from elodie.media.photo import Photo
+
+os.environ['TZ'] = 'GMT'
+
+
+def _write_tiff(path):
+    # Big endian TIFF with Make and Model in IFD0 and DateTimeOriginal in the EXIF IFD.
+    make = b'NIKON\x00'
+    model = b'Z6\x00'
+    date = b'2016:02:03 04:05:06\x00'
+    ifd0_offset = 8
+    exif_ifd_offset = ifd0_offset + 2 + 3 * 12 + 4
+    data_offset = exif_ifd_offset + 2 + 1 * 12 + 4
+
+    ifd0 = struct.pack('>H', 3)
+    ifd0 += struct.pack('>HHII', 0x010F, 2, len(make), data_offset)
+    ifd0 += struct.pack('>HHI4s', 0x0110, 2, len(model), model)
+    ifd0 += struct.pack('>HHII', 0x8769, 4, 1, exif_ifd_offset)
+    ifd0 += struct.pack('>I', 0)
+
+    exif_ifd = struct.pack('>H', 1)
+    exif_ifd += struct.pack('>HHII', 0x9003, 2, len(date), data_offset + len(make))
+    exif_ifd += struct.pack('>I', 0)
+
+    with open(path, 'wb') as f:
+        f.write(b'MM\x00*' + struct.pack('>I', ifd0_offset))
+        f.write(ifd0 + exif_ifd + make + date)
+        f.write(b'\x00' * 1024)
+
+
+def test_get_metadata_jpeg():
+    metadata = exif.get_metadata(helper.get_file('plain.jpg'))
+
+    assert metadata['EXIF:DateTimeOriginal'] == '2015:12:05 00:59:26', metadata
+    assert metadata['EXIF:Make'] == 'Canon', metadata
+    assert metadata['EXIF:Model'] == 'Canon EOS REBEL T2i', metadata
+
+def test_get_metadata_gps():
+    metadata = exif.get_metadata(helper.get_file('with-location.jpg'))
+
+    assert helper.isclose(metadata['EXIF:GPSLatitude'], 37.3667027222), metadata
+    assert helper.isclose(metadata['EXIF:GPSLongitude'], 122.033383611), metadata
+    assert metadata['EXIF:GPSLatitudeRef'] == 'N', metadata
+    assert metadata['EXIF:GPSLongitudeRef'] == 'W', metadata
+
+def test_get_metadata_xmp():
+    metadata = exif.get_metadata(helper.get_file('with-album-and-title.jpg'))
+
+    assert metadata['XMP:Title'] == 'Some Title', metadata
+    assert metadata['XMP:Album'] == 'Test Album', metadata
+
+def test_get_metadata_xmp_original_name():
+    metadata = exif.get_metadata(helper.get_file('with-original-name.jpg'))
+
+    assert metadata['XMP:OriginalFileName'] == 'originalfilename.jpg', metadata
+
+def test_get_metadata_without_exif():
+    assert exif.get_metadata(helper.get_file('no-exif.jpg')) is None
+    assert exif.get_metadata(helper.get_file('invalid.jpg')) is None
+
+def test_get_metadata_tiff():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = os.path.join(folder, 'photo.nef')
+    _write_tiff(origin)
+
+    metadata = exif.get_metadata(origin)
+
+    shutil.rmtree(folder)
+
+    assert metadata['EXIF:Make'] == 'NIKON', metadata
+    assert metadata['EXIF:Model'] == 'Z6', metadata
+    assert metadata['EXIF:DateTimeOriginal'] == '2016:02:03 04:05:06', metadata
+
+def test_photo_get_native_attributes():
+    photo = Photo(helper.get_file('with-location.jpg'))
+
+    assert photo.get_native_attributes() is not None
+    assert photo.get_camera_make() == 'Canon'
+    assert helper.isclose(photo.get_coordinate('longitude'), -122.033383611)
+
+def test_photo_get_native_attributes_without_date():
+    photo = Photo(helper.get_file('no-exif.jpg'))
+
+    assert photo.get_native_attributes() is None
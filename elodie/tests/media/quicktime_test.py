@@ -0,0 +1,52 @@
+# -*- coding: utf-8
+# Project imports
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))))
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))
+
+import helper
+from elodie.media import quicktime
+from elodie.media.audio import Audio
+from elodie.media.video import Video
+
+os.environ['TZ'] = 'GMT'
+
+
+def test_get_metadata_video():
+    metadata = quicktime.get_metadata(helper.get_file('video.mov'))
+
+    assert metadata['QuickTime:CreationDate'] == '2015:01:19 12:45:11-08:00', metadata
+    assert metadata['QuickTime:MediaCreateDate'] == '2015:12:12 08:59:26', metadata
+    assert metadata['QuickTime:Make'] == 'Apple', metadata
+    assert metadata['QuickTime:Model'] == 'iPhone 5', metadata
+
+def test_get_metadata_location():
+    metadata = quicktime.get_metadata(helper.get_file('video.mov'))
+
+    assert metadata['Composite:GPSLatitude'] == 38.1893, metadata
+    assert metadata['Composite:GPSLongitude'] == -119.9558, metadata
+
+def test_get_metadata_audio():
+    metadata = quicktime.get_metadata(helper.get_file('audio.m4a'))
+
+    assert metadata['QuickTime:MediaCreateDate'] == '2016:01:04 05:28:15', metadata
+    assert 'QuickTime:Make' not in metadata, metadata
+
+def test_get_metadata_not_quicktime():
+    assert quicktime.get_metadata(helper.get_file('plain.jpg')) is None
+    assert quicktime.get_metadata(helper.get_file('invalid.jpg')) is None
+
+def test_video_get_native_attributes():
+    video = Video(helper.get_file('video.mov'))
+
+    assert video.get_native_attributes() is not None
+    assert video.get_camera_make() == 'Apple'
+    assert video.get_camera_model() == 'iPhone 5'
+    assert video.get_date_taken() == (2015, 1, 19, 12, 45, 11, 0, 19, 0), video.get_date_taken()
+
+def test_audio_get_native_attributes():
+    audio = Audio(helper.get_file('audio.m4a'))
+
+    assert audio.get_native_attributes() is not None
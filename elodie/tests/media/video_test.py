@@ -12,6 +12,8 @@ sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirna
 sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))
 
 import helper
+import mock
+from elodie import constants
 from elodie.media.media import Media
 from elodie.media.video import Video
 
@@ -197,3 +199,43 @@ def test_set_title_non_ascii():
     shutil.rmtree(folder)
 
     assert metadata['title'] == unicode_title, metadata['title']
+
+def test_get_scan_mode_missing_keys():
+    video = Video(helper.get_file('video.mov'))
+
+    assert video.get_scan_mode_missing_keys() == []
+
+    constants.exiftool_scan_mode = 'fast2'
+    try:
+        missing_keys = video.get_scan_mode_missing_keys()
+    finally:
+        constants.exiftool_scan_mode = 'full'
+
+    assert 'QuickTime:CreationDate' in missing_keys, missing_keys
+    assert 'QuickTime:Make' in missing_keys, missing_keys
+
+@mock.patch('elodie.media.video.Video.rescan_exiftool_attributes')
+def test_get_date_taken_attributes_rescans_in_fast_mode(mock_rescan):
+    mock_rescan.return_value = {'QuickTime:CreationDate': '2015:01:19 12:45:11'}
+
+    video = Video(helper.get_file('video.mov'))
+    video.exif_metadata = {'QuickTime:Make': 'Apple'}
+
+    constants.exiftool_scan_mode = 'fast2'
+    try:
+        attributes = video.get_date_taken_attributes()
+    finally:
+        constants.exiftool_scan_mode = 'full'
+
+    assert mock_rescan.called
+    assert attributes == mock_rescan.return_value, attributes
+
+@mock.patch('elodie.media.video.Video.rescan_exiftool_attributes')
+def test_get_date_taken_attributes_full_scan(mock_rescan):
+    video = Video(helper.get_file('video.mov'))
+    video.exif_metadata = {'QuickTime:Make': 'Apple'}
+
+    attributes = video.get_date_taken_attributes()
+
+    assert not mock_rescan.called
+    assert attributes == {'QuickTime:Make': 'Apple'}, attributes
@@ -0,0 +1,63 @@
+from __future__ import absolute_import
+# Project imports
+import os
+import shutil
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from . import helper
+from elodie.external.pyexiftool import ExifTool
+
+os.environ['TZ'] = 'GMT'
+
+def test_iter_execute_json():
+    temporary_folder, folder = helper.create_working_folder()
+
+    with ExifTool(executable_=helper.create_fake_exiftool(folder)) as et:
+        records = list(et.iter_execute_json('a.jpg', 'b.jpg', 'c d.jpg'))
+        # The instance can still be used afterwards.
+        records_again = list(et.iter_execute_json('e.jpg'))
+
+    shutil.rmtree(folder)
+
+    assert [r['SourceFile'] for r in records] == ['a.jpg', 'b.jpg', 'c d.jpg'], records
+    assert records[0]['EXIF:Make'] == 'Canon', records
+    assert [r['SourceFile'] for r in records_again] == ['e.jpg'], records_again
+
+def test_iter_execute_json_stopped_early():
+    temporary_folder, folder = helper.create_working_folder()
+
+    # The second record is longer than a read, so it's still being written
+    # when the first one is yielded.
+    with ExifTool(executable_=helper.create_fake_exiftool(folder)) as et:
+        records = et.iter_execute_json('a.jpg', 'b' * 10000 + '.jpg', 'c d.jpg')
+        first = next(records)
+        records.close()
+        # The rest of the first batch isn't read as the next batch's output.
+        records_again = list(et.iter_execute_json('e.jpg'))
+
+    shutil.rmtree(folder)
+
+    assert first['SourceFile'] == 'a.jpg', first
+    assert [r['SourceFile'] for r in records_again] == ['e.jpg'], records_again
+
+def test_iter_execute_json_no_records():
+    temporary_folder, folder = helper.create_working_folder()
+
+    with ExifTool(executable_=helper.create_fake_exiftool(folder)) as et:
+        records = list(et.iter_execute_json('-q'))
+
+    shutil.rmtree(folder)
+
+    assert records == [], records
+
+def test_iter_metadata_directory():
+    temporary_folder, folder = helper.create_working_folder()
+
+    with ExifTool(executable_=helper.create_fake_exiftool(folder)) as et:
+        records = list(et.iter_metadata_directory('/some/directory', ['jpg']))
+
+    shutil.rmtree(folder)
+
+    assert [r['SourceFile'] for r in records] == ['/some/directory'], records
@@ -0,0 +1,219 @@
+from __future__ import absolute_import
+# Project imports
+import json
+import mock
+import os
+import shutil
+import sys
+
+from nose.tools import assert_raises
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from . import helper
+from elodie import constants
+from elodie import shards
+from elodie.manifest import Manifest
+from elodie.manifest import merge_files
+from elodie.shards import ShardedEntries
+from elodie.shards import ShardedReader
+
+os.environ['TZ'] = 'GMT'
+
+def _entry(source, name='photo.jpg'):
+    return {"sources": {source: {}}, "target": {"path": "2015-12-Dec", "name": name}}
+
+ENTRIES = {
+    'ab01': _entry('/a.jpg', 'a.jpg'),
+    'ab02': _entry('/b.jpg', 'b.jpg'),
+    'cd01': _entry('/c.jpg', 'c.jpg'),
+    'legacy': _entry('/d.jpg', 'd.jpg'),
+}
+
+def _create(folder, entries=ENTRIES):
+    directory = os.path.join(folder, 'manifest')
+    manifest = Manifest(algorithm='blake2b').load_from_file(directory + os.sep)
+    manifest.merge(entries)
+    manifest.write()
+    return directory
+
+def _history(directory):
+    return sorted(os.listdir(os.path.join(directory, '.manifest_history')))
+
+def test_get_shard_name():
+    assert shards.get_shard_name('ab01', 2) == 'ab'
+    assert shards.get_shard_name('ab01', 3) == 'ab0'
+    assert shards.get_shard_name('AB01', 2) == '_'
+    assert shards.get_shard_name('xy01', 2) == '_'
+    assert shards.get_shard_name('a', 2) == '_'
+
+def test_unsupported_shard_count():
+    assert_raises(ValueError, ShardedEntries, '/tmp', 100)
+
+def test_write_creates_shards():
+    temporary_folder, folder = helper.create_working_folder()
+    directory = _create(folder)
+
+    names = sorted(n for n in os.listdir(directory) if not n.startswith('.'))
+    with open(os.path.join(directory, 'ab.json'), 'r') as f:
+        shard = json.load(f)
+    header = shards.read_header(directory)
+    history = _history(directory)
+
+    shutil.rmtree(folder)
+
+    assert names == ['@manifest.json', '_.json', '_.json.idx', 'ab.json', 'ab.json.idx', 'cd.json', 'cd.json.idx'], names
+    assert sorted(shard) == ['@manifest', 'ab01', 'ab02'], shard
+    assert header == {'version': 2, 'algorithm': 'blake2b', 'shards': 256}, header
+    assert len(history) == 3, history
+
+def test_lookup_loads_one_shard():
+    temporary_folder, folder = helper.create_working_folder()
+    directory = _create(folder)
+
+    manifest = Manifest().load_from_file(directory)
+    entry = manifest.entries['cd01']
+    loaded = sorted(manifest.entries.loaded)
+    missing = 'cd02' in manifest.entries
+    count = len(manifest)
+    keys = sorted(manifest.entries)
+
+    shutil.rmtree(folder)
+
+    assert manifest.algorithm == 'blake2b', manifest.algorithm
+    assert entry == ENTRIES['cd01'], entry
+    assert loaded == ['cd'], loaded
+    assert missing is False
+    assert count == 4, count
+    assert keys == sorted(ENTRIES), keys
+
+def test_write_only_changed_shards():
+    temporary_folder, folder = helper.create_working_folder()
+    directory = _create(folder)
+    with open(os.path.join(directory, 'ab.json'), 'r') as f:
+        ab = f.read()
+    history = _history(directory)
+
+    manifest = Manifest().load_from_file(directory)
+    manifest.merge({'cd01': {"sources": {"/backup/c.jpg": {}}}, 'ef01': _entry('/e.jpg')})
+    with mock.patch.object(shards, 'get_shard_path', side_effect=shards.get_shard_path) as get_shard_path:
+        manifest.write()
+    written = sorted(set(call[0][1] for call in get_shard_path.call_args_list))
+
+    with open(os.path.join(directory, 'ab.json'), 'r') as f:
+        ab_after = f.read()
+    new_history = _history(directory)
+    reloaded = Manifest().load_from_file(directory)
+    entry = reloaded.entries['cd01']
+
+    shutil.rmtree(folder)
+
+    assert written == ['cd', 'ef'], written
+    assert ab_after == ab
+    assert [n[:3] for n in history] == ['__2', 'ab_', 'cd_'], history
+    assert [n[:3] for n in new_history] == ['__2', 'ab_', 'cd_', 'cd_', 'ef_'], new_history
+    assert new_history[3].endswith('.delta.json.gz'), new_history
+    assert sorted(entry["sources"]) == ['/backup/c.jpg', '/c.jpg'], entry
+
+def test_empty_shards_are_removed():
+    temporary_folder, folder = helper.create_working_folder()
+    directory = _create(folder)
+
+    manifest = Manifest().load_from_file(directory)
+    del manifest.entries['cd01']
+    manifest.write()
+    names = os.listdir(directory)
+
+    shutil.rmtree(folder)
+
+    assert 'cd.json' not in names and 'cd.json.idx' not in names, names
+    assert 'ab.json' in names, names
+
+def test_replacing_entries_keeps_shards():
+    temporary_folder, folder = helper.create_working_folder()
+    directory = _create(folder)
+
+    manifest = Manifest().load_from_file(directory)
+    manifest.entries = {'ef01': _entry('/e.jpg')}
+    manifest.write()
+    names = sorted(n for n in os.listdir(directory) if n.endswith('.json'))
+
+    shutil.rmtree(folder)
+
+    assert manifest.is_sharded()
+    assert names == ['@manifest.json', 'ef.json'], names
+
+def test_open_sidecars():
+    temporary_folder, folder = helper.create_working_folder()
+    directory = _create(folder)
+
+    sidecars = shards.open_sidecars(directory)
+    found = {}
+    for opened in sidecars:
+        with opened:
+            found.update(opened.find(name_prefix='a'))
+    one = shards.open_sidecars(directory, 'cd01')
+    for opened in one:
+        opened.close()
+    unknown = shards.open_sidecars(directory, 'ef01')
+    os.remove(os.path.join(directory, 'cd.json.idx'))
+    incomplete = shards.open_sidecars(directory)
+
+    shutil.rmtree(folder)
+
+    assert len(sidecars) == 3, sidecars
+    assert sorted(found) == ['ab01'], found
+    assert len(one) == 1, one
+    assert unknown == [], unknown
+    assert incomplete is None, incomplete
+
+def test_reader():
+    temporary_folder, folder = helper.create_working_folder()
+    directory = _create(folder)
+
+    with shards.open_reader(directory) as reader:
+        header, has_entries, entries = reader.header, reader.has_entries(), dict(reader)
+    with shards.open_reader(directory, 'ab99') as reader:
+        keys = sorted(k for k, v in reader)
+    shard_path = shards.get_key_shard_path(directory, 'cd99')
+
+    shutil.rmtree(folder)
+
+    assert header['algorithm'] == 'blake2b', header
+    assert has_entries is True
+    assert entries == ENTRIES, entries
+    assert keys == ['ab01', 'ab02'], keys
+    assert shard_path == os.path.join(directory, 'cd.json'), shard_path
+
+def test_reader_not_sharded():
+    temporary_folder, folder = helper.create_working_folder()
+
+    assert_raises(ValueError, ShardedReader, folder)
+
+    shutil.rmtree(folder)
+
+def test_merge_files_to_shards():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest_path = os.path.join(folder, 'manifest.json')
+    manifest = Manifest(algorithm='blake2b')
+    manifest.merge(ENTRIES)
+    manifest.dump(manifest_path)
+    directory = os.path.join(folder, 'sharded')
+
+    with mock.patch.object(constants, 'merge_run_size', 2):
+        count, conflicts = merge_files([manifest_path], directory, shard_count=4096)
+    header = shards.read_header(directory)
+    names = sorted(n for n in os.listdir(directory) if n.endswith('.json'))
+
+    # Merging back into one file from the shards.
+    merged_path = os.path.join(folder, 'merged.json')
+    merge_files([directory], merged_path)
+    merged = Manifest().load_from_file(merged_path)
+
+    shutil.rmtree(folder)
+
+    assert (count, conflicts) == (4, 0), (count, conflicts)
+    assert header == {'version': 2, 'algorithm': 'blake2b', 'shards': 4096}, header
+    assert names == ['@manifest.json', '_.json', 'ab0.json', 'cd0.json'], names
+    assert dict(merged.entries.items()) == ENTRIES, merged.entries
+    assert merged.algorithm == 'blake2b', merged.algorithm
@@ -0,0 +1,178 @@
+from __future__ import absolute_import
+# Project imports
+import json
+import mock
+import os
+import shutil
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from . import helper
+from elodie import sidecar
+from elodie.index import ManifestIndex
+from elodie.manifest import HEADER_KEY
+from elodie.manifest import Manifest
+from elodie.sidecar import ManifestSidecar
+
+os.environ['TZ'] = 'GMT'
+
+def _manifest(count=50):
+    manifest = Manifest()
+    for i in range(count):
+        manifest.entries['{:064x}'.format(i * 7919)] = {
+            'sources': {u'/photos/été/{}.jpg'.format(i): {'album': 'Summer'}},
+            'target': {'path': '2015', 'name': 'photo-{}.jpg'.format(i % 10)},
+        }
+    return manifest
+
+def test_dump_matches_json_dump():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest = _manifest()
+    contents = {HEADER_KEY: manifest.get_header()}
+    contents.update(manifest.entries)
+
+    dumped = []
+    for indent, separators in ((False, (',', ':')), (True, (',', ': '))):
+        file_path = os.path.join(folder, 'manifest.json')
+        manifest.dump(file_path, indent, sidecar=True)
+        with open(file_path, 'r') as f:
+            dumped.append(f.read() == json.dumps(contents, indent=2 if indent else None, separators=separators))
+
+    shutil.rmtree(folder)
+
+    assert dumped == [True, True], dumped
+
+def test_lookups():
+    temporary_folder, folder = helper.create_working_folder()
+    file_path = os.path.join(folder, 'manifest.json')
+    manifest = _manifest()
+    manifest.dump(file_path, sidecar=True)
+
+    with ManifestSidecar.open(file_path) as index:
+        count = len(index)
+        present = all(index.contains(key) for key in manifest.entries)
+        absent = index.contains('f' * 64) or index.contains('not hex') or index.contains('ab')
+        entry = index.get('{:064x}'.format(7919 * 3))
+        by_name = index.find_by_name('photo-3.jpg')
+        missing_name = index.find_by_name('photo-10.jpg')
+
+    shutil.rmtree(folder)
+
+    assert count == 50, count
+    assert present is True
+    assert absent is False
+    assert entry == manifest.entries['{:064x}'.format(7919 * 3)], entry
+    assert sorted(by_name.keys()) == sorted(k for k, v in manifest.entries.items() if v['target']['name'] == 'photo-3.jpg'), by_name
+    assert len(by_name) == 5, by_name
+    assert missing_name == {}, missing_name
+
+def test_lookups_non_hex_keys():
+    temporary_folder, folder = helper.create_working_folder()
+    file_path = os.path.join(folder, 'manifest.json')
+    manifest = Manifest()
+    manifest.entries = {
+        'abc': {'sources': {}, 'target': {'path': '2015', 'name': 'a.jpg'}},
+        'de': {'sources': {}, 'target': {'path': '2015', 'name': 'b.jpg'}},
+    }
+    manifest.dump(file_path, sidecar=True)
+
+    with ManifestSidecar.open(file_path) as index:
+        found = (index.contains('abc'), index.contains('de'), index.contains('ab'), index.contains('abcd'))
+        by_name = index.find_by_name('b.jpg')
+
+    shutil.rmtree(folder)
+
+    assert found == (True, True, False, False), found
+    assert list(by_name.keys()) == ['de'], by_name
+
+def test_find_agrees_with_index():
+    from .index_test import ENTRIES
+    temporary_folder, folder = helper.create_working_folder()
+    file_path = os.path.join(folder, 'manifest.json')
+    manifest = Manifest()
+    manifest.entries = ENTRIES
+    manifest.dump(file_path, sidecar=True)
+    index = ManifestIndex(ENTRIES)
+    queries = [
+        {'key': 'bbb'},
+        {'key': 'zzz'},
+        {'name': '2015-12-05_00-59-26-a.jpg'},
+        {'name_prefix': '2016-01-01'},
+        {'source': '/photos'},
+        {'source': '/photos/2016/'},
+        {'source': '/photos/2016/b'},
+        {'date_from': '2016-01-01'},
+        {'date_to': '2015-12-05'},
+        {'camera_make': 'CANON'},
+        {'camera_make': 'canon', 'source': '/photos/2016-extra'},
+        {'origin': 'backup', 'camera_model': 'iphone 6'},
+        {'album': 'nothing'},
+    ]
+
+    found = []
+    with ManifestSidecar.open(file_path) as opened:
+        for criteria in queries:
+            entries = opened.find(**criteria)
+            found.append((criteria, sorted(entries), index.find(**criteria)))
+            assert all(entries[k] == ENTRIES[k] for k in entries), entries
+
+    shutil.rmtree(folder)
+
+    for criteria, keys, expected in found:
+        assert keys == expected, (criteria, keys, expected)
+
+def test_whitespace_is_not_a_hex_key():
+    temporary_folder, folder = helper.create_working_folder()
+    file_path = os.path.join(folder, 'manifest.json')
+    manifest = Manifest()
+    manifest.entries = {'abcd': {'sources': {}}, 'ab c': {'sources': {}}}
+    manifest.dump(file_path, sidecar=True)
+
+    with ManifestSidecar.open(file_path) as index:
+        found = (index.contains('abcd'), index.contains('ab c'), index.contains('ab  cd'))
+        key_format = index.key_format
+
+    shutil.rmtree(folder)
+
+    assert key_format == sidecar.KEY_ASCII, key_format
+    assert found == (True, True, False), found
+
+def test_stale_sidecar_is_ignored():
+    temporary_folder, folder = helper.create_working_folder()
+    file_path = os.path.join(folder, 'manifest.json')
+    manifest = _manifest()
+    manifest.dump(file_path, sidecar=True)
+
+    with open(file_path, 'a') as f:
+        f.write(' ')
+    stale = ManifestSidecar.open(file_path)
+    missing = ManifestSidecar.open(os.path.join(folder, 'other.json'))
+
+    shutil.rmtree(folder)
+
+    assert stale is None
+    assert missing is None
+
+def test_write_creates_sidecar_except_for_history():
+    temporary_folder, folder = helper.create_working_folder()
+    file_path = os.path.join(folder, 'manifest.json')
+    manifest = _manifest()
+    manifest.load_from_file(file_path)
+    manifest.write()
+
+    history = os.listdir(os.path.join(folder, '.manifest_history'))
+    fresh = ManifestSidecar.open(file_path)
+    if fresh is not None:
+        fresh.close()
+
+    with mock.patch('elodie.constants.manifest_sidecar', False):
+        os.remove(sidecar.get_path(file_path))
+        manifest.write()
+    disabled = os.path.exists(sidecar.get_path(file_path))
+
+    shutil.rmtree(folder)
+
+    assert fresh is not None
+    assert [name for name in history if name.endswith(sidecar.SUFFIX)] == [], history
+    assert disabled is False
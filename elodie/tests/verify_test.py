@@ -0,0 +1,108 @@
+from __future__ import absolute_import
+# Project imports
+import json
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from . import helper
+from elodie import hashing
+from elodie import verify
+from elodie.manifest import Manifest
+
+os.environ['TZ'] = 'GMT'
+
+def _create_target(folder):
+    os.makedirs(os.path.join(folder, '2015'))
+    manifest = Manifest(algorithm='sha256')
+    for name, content in (('ok.jpg', b'ok'), ('changed.jpg', b'changed')):
+        path = os.path.join(folder, '2015', name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        manifest.merge({hashing.checksum(path): {"sources": {}, "target": {"path": "2015", "name": name}}})
+    with open(os.path.join(folder, '2015', 'changed.jpg'), 'wb') as f:
+        f.write(b'corrupt')
+    manifest.merge({'0' * 64: {"sources": {}, "target": {"path": "2015", "name": "missing.jpg"}}})
+    return manifest
+
+class _Report(object):
+    def __init__(self):
+        self.lines = []
+    def write(self, line):
+        self.lines.append(json.loads(line))
+    def flush(self):
+        pass
+
+def test_run():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest = _create_target(folder)
+
+    verifier = verify.Verifier(manifest, folder, workers=2)
+    keys = verifier.select()
+    report = _Report()
+    summary = verifier.run(report, keys)
+
+    shutil.rmtree(folder)
+
+    statuses = dict((os.path.basename(r.get('path', '')), r['status']) for r in report.lines)
+    assert statuses == {'ok.jpg': 'ok', 'changed.jpg': 'mismatch', 'missing.jpg': 'missing'}, statuses
+    assert summary['ok'] == 1 and summary['mismatch'] == 1 and summary['missing'] == 1, summary
+    assert [r['checksum'] for r in report.lines] == sorted(manifest.entries.keys()), report.lines
+
+def test_resume_from_cursor():
+    temporary_folder, folder = helper.create_working_folder()
+    manifest = _create_target(folder)
+    cursor_path = os.path.join(folder, 'cursor.json')
+    keys = sorted(manifest.entries.keys())
+    with open(cursor_path, 'w') as f:
+        json.dump({'slices': 1, 'slice': 0, 'last': keys[0]}, f)
+
+    verifier = verify.Verifier(manifest, folder, cursor_path=cursor_path)
+    resumed = verifier.select()
+    verifier.run(_Report(), resumed)
+    restarted = verify.Verifier(manifest, folder, cursor_path=cursor_path).select(resume=False)
+    with open(cursor_path, 'r') as f:
+        cursor = json.load(f)
+
+    shutil.rmtree(folder)
+
+    assert resumed == keys[1:], resumed
+    assert restarted == keys, restarted
+    assert cursor['last'] is None, cursor
+
+def test_sample_rotates_through_slices():
+    manifest = Manifest()
+    for i in range(100):
+        manifest.merge({'{:064x}'.format(i * 7919): {"sources": {}, "target": {"path": "", "name": str(i)}}})
+
+    verifier = verify.Verifier(manifest, '/')
+    seen = []
+    for i in range(4):
+        keys = verifier.select(sample_percent=25)
+        seen.extend(keys)
+        # A finished run moves the cursor on to the next slice.
+        verifier.cursor['slice'] += 1
+
+    assert sorted(seen) == sorted(manifest.entries.keys()), len(seen)
+
+def test_sample_period_picks_slice_from_clock():
+    manifest = Manifest()
+    for i in range(10):
+        manifest.merge({'{:064x}'.format(i): {"sources": {}, "target": {"path": "", "name": str(i)}}})
+
+    keys = verify.Verifier(manifest, '/').select(sample_percent=50, period=2)
+    current_slice = int(time.time() // 86400) % 2
+
+    assert all(verify.get_slice(key, 2) == current_slice for key in keys), keys
+
+def test_rate_limiter():
+    limiter = verify.RateLimiter(1000)
+
+    first = limiter.wait(100)
+    second = limiter.wait(100)
+
+    assert first == 0, first
+    assert 0.05 < second <= 0.1, second
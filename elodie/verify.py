@@ -0,0 +1,232 @@
+"""
+Integrity verification of the files a manifest points at.
+
+Every entry's target file is re-hashed and compared to the entry's key.
+Files are hashed on a thread pool, optionally capped to a number of bytes
+per second so a verify can run next to other work. Progress is kept in a
+cursor file so an interrupted run picks up where it stopped, and a run can
+check only a slice of the archive, rotating through the slices so the whole
+archive is covered over a period.
+
+Results are written as one JSON object per line.
+"""
+from __future__ import division
+from builtins import object
+
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from elodie import compatability
+from elodie import constants
+
+#: The file matches its manifest entry.
+STATUS_OK = 'ok'
+
+#: The file is missing from the target.
+STATUS_MISSING = 'missing'
+
+#: The file's content doesn't match its manifest entry.
+STATUS_MISMATCH = 'mismatch'
+
+#: The file exists but could not be read.
+STATUS_ERROR = 'error'
+
+
+class RateLimiter(object):
+
+    """Spread reads out so they average at most a number of bytes per second.
+
+    :param int bytes_per_second: The cap, or None for no cap.
+    """
+
+    def __init__(self, bytes_per_second=None):
+        self.bytes_per_second = bytes_per_second
+        self.lock = threading.Lock()
+        self.next_time = time.time()
+
+    def wait(self, byte_count):
+        """Block until reading ``byte_count`` more bytes stays under the cap.
+
+        :param int byte_count: Number of bytes about to be read.
+        :returns: float number of seconds waited
+        """
+        if not self.bytes_per_second:
+            return 0
+        with self.lock:
+            now = time.time()
+            start = max(now, self.next_time)
+            self.next_time = start + byte_count / self.bytes_per_second
+        delay = start - now
+        if delay > 0:
+            time.sleep(delay)
+        return max(delay, 0)
+
+
+class Verifier(object):
+
+    """Verify the target files of a manifest.
+
+    :param manifest: The :class:`~elodie.manifest.Manifest` to verify.
+    :param str base_path: Base path of the target the manifest describes.
+    :param int workers: Number of files to hash at once.
+    :param int rate_limit: Maximum bytes read per second, or None.
+    :param str cursor_path: File the progress is kept in, or None to not
+        keep any.
+    """
+
+    def __init__(self, manifest, base_path, workers=None, rate_limit=None, cursor_path=None):
+        if workers is None:
+            workers = constants.verify_workers
+        self.manifest = manifest
+        self.base_path = base_path
+        self.workers = workers
+        self.limiter = RateLimiter(rate_limit)
+        self.cursor_path = cursor_path
+        self.cursor = self.load_cursor()
+
+    def load_cursor(self):
+        """Read the saved progress.
+
+        :returns: dict
+        """
+        if self.cursor_path is None or not os.path.isfile(self.cursor_path):
+            return {}
+        try:
+            with open(self.cursor_path, 'r') as f:
+                return json.load(f)
+        except ValueError:
+            return {}
+
+    def save_cursor(self):
+        if self.cursor_path is None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.cursor_path))
+        with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.tmp', delete=False) as f:
+            json.dump(self.cursor, f)
+        compatability._rename(f.name, self.cursor_path)
+
+    def select(self, sample_percent=None, period=None, resume=True):
+        """Choose the entries to verify in this run.
+
+        With sampling, entries are split into ``ceil(100 / sample_percent)``
+        slices by their key. If a period in days is given, the slice is
+        picked from the clock so every slice comes up once per period.
+        Otherwise each run moves on to the next slice.
+
+        :param float sample_percent: Percentage of entries to check, or None
+            for all of them.
+        :param float period: Days over which all slices are covered.
+        :param bool resume: Whether to skip entries an interrupted run of
+            the same slice already verified.
+        :returns: list of keys, in the order they're verified
+        """
+        slices = 1
+        if sample_percent is not None and 0 < sample_percent < 100:
+            slices = int(math.ceil(100 / sample_percent))
+
+        if period:
+            current_slice = int(time.time() // (period * 86400 / slices)) % slices
+        elif self.cursor.get("slices") == slices:
+            current_slice = self.cursor.get("slice", 0) % slices
+        else:
+            current_slice = 0
+
+        keys = sorted(
+            key for key in self.manifest.entries
+            if slices == 1 or get_slice(key, slices) == current_slice
+        )
+
+        last = self.cursor.get("last")
+        if not resume or (self.cursor.get("slices"), self.cursor.get("slice")) != (slices, current_slice):
+            last = None
+        if last is not None:
+            keys = [key for key in keys if key > last]
+
+        self.cursor = {"slices": slices, "slice": current_slice, "last": last}
+        return keys
+
+    def get_target_path(self, entry):
+        target = entry["target"]
+        return os.path.join(self.base_path, target["path"], target["name"])
+
+    def verify_entry(self, key):
+        """Verify the target file of a single entry.
+
+        :param str key: The entry's key.
+        :returns: dict report record
+        """
+        record = {"checksum": key}
+        entry = self.manifest.entries[key]
+        if not entry.get("target"):
+            record["status"] = STATUS_MISSING
+            return record
+
+        path = self.get_target_path(entry)
+        record["path"] = path
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            record["status"] = STATUS_MISSING
+            return record
+
+        self.limiter.wait(size)
+        start_time = time.time()
+        digest = self.manifest.hash_file(path)[0]
+        record["bytes"] = size
+        record["seconds"] = round(time.time() - start_time, 3)
+        if digest is None:
+            record["status"] = STATUS_ERROR
+        elif digest == key:
+            record["status"] = STATUS_OK
+        else:
+            record["status"] = STATUS_MISMATCH
+            record["actual"] = digest
+        return record
+
+    def run(self, report, keys):
+        """Verify entries and write a record per entry to a report.
+
+        The cursor is saved every ``constants.verify_cursor_interval``
+        entries and when the run ends. A run which finishes moves the
+        cursor on to the next slice.
+
+        :param report: File object the JSON lines are written to.
+        :param list keys: Keys from :meth:`select`.
+        :returns: dict of status to count, plus ``bytes`` and ``seconds``
+        """
+        summary = {STATUS_OK: 0, STATUS_MISSING: 0, STATUS_MISMATCH: 0, STATUS_ERROR: 0, "bytes": 0}
+        start_time = time.time()
+        pool = ThreadPool(self.workers)
+        try:
+            # imap keeps the order, so every key up to the cursor is done.
+            for count, record in enumerate(pool.imap(self.verify_entry, keys), 1):
+                report.write(json.dumps(record, sort_keys=True) + '\n')
+                summary[record["status"]] += 1
+                summary["bytes"] += record.get("bytes", 0)
+                self.cursor["last"] = record["checksum"]
+                if count % constants.verify_cursor_interval == 0:
+                    report.flush()
+                    self.save_cursor()
+            self.cursor["slice"] = self.cursor["slice"] + 1
+            self.cursor["last"] = None
+        finally:
+            pool.terminate()
+            pool.join()
+            self.save_cursor()
+        summary["seconds"] = round(time.time() - start_time, 3)
+        return summary
+
+
+def get_slice(key, slices):
+    """Get the sampling slice an entry belongs to.
+
+    :param str key: The entry's key, a hex digest.
+    :param int slices: Number of slices.
+    :returns: int
+    """
+    return int(key[:8], 16) % slices